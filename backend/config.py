@@ -3,7 +3,7 @@
 """
 
 import os
-from typing import List
+from typing import List, Optional
 from pydantic_settings import BaseSettings
 
 
@@ -17,18 +17,144 @@ class Settings(BaseSettings):
     
     # База данных
     DATABASE_URL: str = "sqlite:///./ai_content_curator.db"
+    # Применять миграции при запуске приложения. Если экземпляров несколько,
+    # отключите и запускайте python -m backend.migrate перед их стартом
+    DATABASE_AUTO_MIGRATE: bool = True
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_RECYCLE: int = 1800
     
     # Безопасность
     SECRET_KEY: str = "your-super-secret-key-change-this-in-production"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Кэш проверенных пользователей для аутентификации запросов
+    AUTH_CACHE_TTL_SECONDS: float = 30.0
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+    # Хеширование паролей: стоимость bcrypt и размер пула потоков
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    # Ограничение попыток входа: для одного имени пользователя с одного адреса,
+    # со всего адреса и суммарно
+    LOGIN_RATE_LIMIT_BURST: int = 10
+    LOGIN_RATE_LIMIT_PER_MINUTE: float = 10.0
+    LOGIN_IP_RATE_LIMIT_BURST: int = 30
+    LOGIN_IP_RATE_LIMIT_PER_MINUTE: float = 30.0
+    LOGIN_GLOBAL_RATE_LIMIT_PER_SECOND: float = 20.0
+    # Адреса или подсети обратных прокси (nginx), которым доверяется X-Forwarded-For
+    TRUSTED_PROXIES: List[str] = []
     
     # Gemini AI
     GEMINI_API_KEY: str = ""
+    # Адаптивный лимит одновременных запросов к Gemini: от MIN до MAX
+    GEMINI_MAX_CONCURRENCY: int = 8
+    GEMINI_MIN_CONCURRENCY: int = 1
+    GEMINI_INITIAL_CONCURRENCY: int = 4
+    GEMINI_LATENCY_TARGET_SECONDS: float = 20.0
+    GEMINI_POOL_SIZE: int = 2
+    GEMINI_TIMEOUT_SECONDS: float = 60.0
+    # Повторы при временных ошибках и автоматический выключатель
+    GEMINI_RETRY_ATTEMPTS: int = 3
+    GEMINI_RETRY_BASE_DELAY: float = 0.5
+    GEMINI_RETRY_MAX_DELAY: float = 8.0
+    GEMINI_BREAKER_FAILURE_THRESHOLD: int = 5
+    GEMINI_BREAKER_RECOVERY_SECONDS: float = 30.0
+    # Лимиты Gemini API и доля от них, которую разрешено использовать
+    GEMINI_RPM_LIMIT: int = 60
+    GEMINI_TPM_LIMIT: int = 120000
+    GEMINI_BUDGET_HEADROOM: float = 0.9
+    
+    # Длинные тексты: бюджет токенов фрагмента и число фрагментов, анализируемых параллельно
+    CHUNK_MAX_TOKENS: int = 3000
+    CHUNK_FANOUT: int = 4
+    # Сколько раз резюме фрагментов объединяются повторно, прежде чем текст обрезается
+    CHUNK_REDUCE_MAX_DEPTH: int = 2
+    
+    # Тексты до этой длины (символы) анализируются локально без Gemini,
+    # если движок не указан в запросе; 0 - всегда Gemini
+    LOCAL_ANALYZER_MAX_CHARS: int = 0
+    
+    # Кэш результатов анализа
+    ANALYSIS_CACHE_ENABLED: bool = True
+    ANALYSIS_CACHE_MAX_ENTRIES: int = 10000
+    ANALYSIS_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    ANALYSIS_CACHE_TTL_SECONDS: int = 3600
+    ANALYSIS_CACHE_PERSISTENT: bool = False
+    ANALYSIS_CACHE_PERSISTENT_TTL_SECONDS: int = 7 * 24 * 3600
+    
+    # Ограничение частоты запросов анализа
+    RATE_LIMIT_BACKEND: str = "memory"  # memory или sql (общие лимиты для нескольких воркеров)
+    RATE_LIMIT_USER_PER_MINUTE: float = 20.0
+    RATE_LIMIT_USER_BURST: int = 10
+    RATE_LIMIT_TELEGRAM_PER_MINUTE: float = 10.0
+    RATE_LIMIT_TELEGRAM_BURST: int = 5
+    RATE_LIMIT_GLOBAL_PER_MINUTE: float = 300.0
+    RATE_LIMIT_GLOBAL_BURST: int = 50
+    
+    # Пакетный анализ
+    BATCH_MAX_ITEMS: int = 50
+    BATCH_CONCURRENCY: int = 4
+    
+    # Фоновые задания анализа
+    JOB_WORKERS: int = 2
+    JOB_POLL_INTERVAL_SECONDS: float = 1.0
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BACKOFF_SECONDS: float = 5.0
+    JOB_MAX_PER_USER: int = 2
+    JOB_LEASE_SECONDS: int = 300
+    JOB_CALLBACK_TIMEOUT_SECONDS: float = 10.0
+    # Хосты, на которые разрешены callback заданий. Пустой список - любые хосты
+    # с публичными адресами (localhost и внутренняя сеть запрещены всегда)
+    JOB_CALLBACK_ALLOWED_HOSTS: List[str] = []
     
     # Telegram Bot
     TELEGRAM_BOT_TOKEN: str = ""
     TELEGRAM_WEBHOOK_URL: str = ""
+    # Минимальный интервал между правками сообщения при потоковом анализе (секунды)
+    BOT_STREAM_EDIT_INTERVAL: float = 1.5
+    # Отложенная запись сессий и анализов бота: размер пакета, интервал (секунды)
+    # и предел накопленных записей, если БД недоступна
+    BOT_WRITE_BATCH_SIZE: int = 100
+    BOT_WRITE_FLUSH_INTERVAL: float = 1.0
+    BOT_WRITE_MAX_PENDING: int = 10000
+    # Сколько раз повторяется пакет, не сохраненный из-за временной ошибки
+    BOT_WRITE_MAX_RETRIES: int = 5
+    # Кэш привязки Telegram аккаунтов к пользователям
+    BOT_USER_CACHE_TTL_SECONDS: float = 60.0
+    BOT_USER_CACHE_MAX_ENTRIES: int = 10000
+    # Параллельная обработка обновлений: воркеры быстрых команд и анализа текста,
+    # предел обновлений в обработке (включая ожидающие своей очереди)
+    BOT_FAST_WORKERS: int = 8
+    BOT_LLM_WORKERS: int = 4
+    BOT_MAX_PENDING_UPDATES: int = 256
+    # Очередь обновлений webhook: размер, ожидание места (секунды),
+    # Retry-After при переполнении, окно проверки повторных update_id
+    # и время на обработку очереди при остановке. Обновления из очереди
+    # передаются в обработку сразу, их число ограничивает BOT_MAX_PENDING_UPDATES
+    BOT_WEBHOOK_QUEUE_SIZE: int = 1000
+    BOT_WEBHOOK_ENQUEUE_TIMEOUT: float = 0.5
+    BOT_WEBHOOK_RETRY_AFTER_SECONDS: int = 5
+    BOT_WEBHOOK_DEDUP_WINDOW: int = 10000
+    BOT_WEBHOOK_DRAIN_TIMEOUT: float = 10.0
+    # Устарело и не используется: у webhook больше нет своих воркеров.
+    # Оставлено, чтобы не ломать запуск с существующими .env
+    BOT_WEBHOOK_WORKERS: Optional[int] = None
+    # Хранение данных бота: db - напрямую в БД, api - через API бэкенда,
+    # чтобы БД использовал только один процесс
+    BOT_STORAGE_MODE: str = "db"
+    BOT_API_URL: str = "http://localhost:8000/api"
+    # Токен бота для /api/telegram (пустой - API для бота отключено)
+    BOT_API_TOKEN: str = ""
+    BOT_API_TIMEOUT_SECONDS: float = 10.0
+    BOT_API_MAX_CONNECTIONS: int = 20
+    BOT_API_RETRY_ATTEMPTS: int = 3
+    BOT_API_RETRY_BASE_DELAY: float = 0.5
+    BOT_API_RETRY_MAX_DELAY: float = 5.0
+    # Максимум сессий и анализов в одном запросе сохранения
+    BOT_API_MAX_RECORDS: int = 1000
+    
+    # Пользователи с доступом к отчетам администратора (/api/admin)
+    ADMIN_USERNAMES: List[str] = []
     
     # CORS
     ALLOWED_ORIGINS: List[str] = ["http://localhost:3000", "http://127.0.0.1:3000"]
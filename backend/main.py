@@ -4,27 +4,69 @@
 
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
+import asyncio
+import logging
 import os
 from dotenv import load_dotenv
-
-from backend.database import engine, Base
-from backend.routers import analysis, auth, users
-from telegram_bot.webhook import router as telegram_router
+from sqlalchemy import text
+
+from backend.database import engine
+from backend.migrate import upgrade_database
+from backend.routers import admin, analysis, auth, telegram, users
+from telegram_bot.webhook import (
+    router as telegram_router, bot_ready, bot_stats, initialize_bot_application,
+    shutdown_bot_application, webhook_enabled
+)
 from backend.config import settings
+from backend.services.analysis_service import (
+    get_analysis_service, close_analysis_service, peek_analysis_service
+)
+from backend.services.job_queue import job_queue
+from backend.services.rate_limit import get_rate_limiter
 
 # Загружаем переменные окружения
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Управление жизненным циклом приложения"""
-    # Создаем таблицы в БД при запуске
-    Base.metadata.create_all(bind=engine)
+    # Обновляем схему БД миграциями (при нескольких экземплярах приложения
+    # миграции запускаются отдельно: python -m backend.migrate)
+    if settings.DATABASE_AUTO_MIGRATE:
+        await asyncio.to_thread(upgrade_database)
+    
+    # Создаем общий сервис анализа (и клиент Gemini) один раз на процесс
+    try:
+        get_analysis_service()
+    except Exception as e:
+        logger.warning(f"Не удалось инициализировать Gemini: {e}")
+    
+    # Запускаем воркеры фоновых заданий анализа
+    await job_queue.start()
+    
+    # Запускаем бота заранее, чтобы первое обновление не ждало инициализации.
+    # Если запуск не удался, webhook повторит его при первом обновлении.
+    if webhook_enabled():
+        try:
+            await initialize_bot_application()
+        except Exception as e:
+            logger.warning(f"Не удалось инициализировать Telegram бота: {e}")
+    
     yield
-    # Здесь можно добавить код для очистки ресурсов при завершении
+    
+    # Дописываем в БД данные бота, накопленные в буфере
+    await shutdown_bot_application()
+    
+    await job_queue.stop()
+    
+    # Закрываем соединения с Gemini
+    await close_analysis_service()
 
 
 # Создаем экземпляр FastAPI
@@ -48,6 +90,8 @@ app.add_middleware(
 app.include_router(auth.router, prefix="/api/auth", tags=["Аутентификация"])
 app.include_router(users.router, prefix="/api/users", tags=["Пользователи"])
 app.include_router(analysis.router, prefix="/api/analysis", tags=["Анализ контента"])
+app.include_router(admin.router, prefix="/api/admin", tags=["Администрирование"])
+app.include_router(telegram.router, prefix="/api/telegram", tags=["API для Telegram бота"])
 app.include_router(telegram_router, tags=["Telegram Webhook"])
 
 # Статические файлы для фронтенда
@@ -71,6 +115,44 @@ async def health_check():
     return {"status": "healthy", "service": "AI Content Curator"}
 
 
+@app.get("/ready")
+async def readiness_check():
+    """Готовность к приему запросов: БД доступна, сервис анализа и бот инициализированы"""
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        database = True
+    except Exception as e:
+        logger.warning(f"БД недоступна: {e}")
+        database = False
+    
+    checks = {
+        "database": database,
+        "analysis": peek_analysis_service() is not None,
+        # None - бот работает отдельно (polling) или не настроен
+        "bot": bot_ready() if webhook_enabled() else None
+    }
+    ready = all(check is not False for check in checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not ready", "checks": checks}
+    )
+
+
+@app.get("/metrics", dependencies=[Depends(admin.get_admin_user)])
+async def metrics():
+    """Метрики сервиса (только для администраторов)"""
+    analysis_service = peek_analysis_service()
+    return {
+        "analysis": analysis_service.stats() if analysis_service else None,
+        "jobs": await job_queue.stats(),
+        "auth_cache": auth.user_cache.stats(),
+        "login_rate_limit": auth.login_limiter.stats(),
+        "rate_limit_rejected": get_rate_limiter().stats(),
+        "bot": bot_stats()
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
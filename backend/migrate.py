@@ -0,0 +1,60 @@
+"""
+Обновление схемы БД миграциями Alembic: при запуске приложения
+(DATABASE_AUTO_MIGRATE) или отдельной командой перед запуском:
+
+    python -m backend.migrate
+"""
+
+import asyncio
+import logging
+from pathlib import Path
+from typing import Set
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect, pool
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from backend.config import settings
+from backend.database import get_async_database_url
+
+logger = logging.getLogger(__name__)
+
+# Начальная ревизия и ее таблицы: схема, которую создавали версии без миграций
+BASELINE_REVISION = "0001"
+BASELINE_TABLES = {"users", "analyses", "telegram_sessions"}
+
+
+def alembic_config() -> Config:
+    """Конфигурация Alembic без alembic.ini: не зависит от рабочего каталога и не меняет логирование"""
+    config = Config()
+    config.set_main_option("script_location", str(Path(__file__).parent / "migrations"))
+    return config
+
+
+async def existing_tables() -> Set[str]:
+    engine = create_async_engine(get_async_database_url(settings.DATABASE_URL), poolclass=pool.NullPool)
+    try:
+        async with engine.connect() as conn:
+            return set(await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_table_names()))
+    finally:
+        await engine.dispose()
+
+
+def upgrade_database():
+    """
+    Применение миграций до последней ревизии. База, созданная до появления
+    миграций (есть таблицы начальной схемы, но нет alembic_version),
+    сначала отмечается начальной ревизией.
+    """
+    config = alembic_config()
+    tables = asyncio.run(existing_tables())
+    if "alembic_version" not in tables and BASELINE_TABLES <= tables:
+        logger.info(f"База без миграций: отмечаем начальную ревизию {BASELINE_REVISION}")
+        command.stamp(config, BASELINE_REVISION)
+    command.upgrade(config, "head")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    upgrade_database()
@@ -0,0 +1,38 @@
+"""Таблица кэша результатов анализа
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('analysis_cache',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('cache_key', sa.String(length=64), nullable=False),
+    sa.Column('analysis_type', sa.String(length=50), nullable=False),
+    sa.Column('result', sa.Text(), nullable=False),
+    sa.Column('confidence', sa.Float(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_analysis_cache_cache_key', 'analysis_cache', ['cache_key'], unique=True)
+    op.create_index('ix_analysis_cache_id', 'analysis_cache', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_analysis_cache_id', table_name='analysis_cache')
+    op.drop_index('ix_analysis_cache_cache_key', table_name='analysis_cache')
+    op.drop_table('analysis_cache')
@@ -0,0 +1,47 @@
+"""Таблица фоновых заданий анализа
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('analysis_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('original_text', sa.Text(), nullable=False),
+    sa.Column('analysis_type', sa.String(length=50), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_run_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.Column('locked_until', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('callback_url', sa.String(length=500), nullable=True),
+    sa.Column('analysis_id', sa.Integer(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['analysis_id'], ['analyses.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_analysis_jobs_id', 'analysis_jobs', ['id'], unique=False)
+    op.create_index('ix_analysis_jobs_status', 'analysis_jobs', ['status'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_analysis_jobs_status', table_name='analysis_jobs')
+    op.drop_index('ix_analysis_jobs_id', table_name='analysis_jobs')
+    op.drop_table('analysis_jobs')
@@ -0,0 +1,40 @@
+"""Индексы для запросов истории анализов и очереди заданий
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # История пользователя: WHERE user_id [AND analysis_type] ORDER BY created_at DESC
+    op.create_index('ix_analyses_user_created', 'analyses', ['user_id', 'created_at', 'id'])
+    op.create_index(
+        'ix_analyses_user_type_created', 'analyses',
+        ['user_id', 'analysis_type', 'created_at', 'id']
+    )
+
+    # Очередь заданий: выборка готовых заданий и лимит на пользователя
+    op.drop_index('ix_analysis_jobs_status', table_name='analysis_jobs')
+    op.create_index('ix_analysis_jobs_status_next_run', 'analysis_jobs', ['status', 'next_run_at'])
+    op.create_index('ix_analysis_jobs_user_status', 'analysis_jobs', ['user_id', 'status'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_analysis_jobs_user_status', table_name='analysis_jobs')
+    op.drop_index('ix_analysis_jobs_status_next_run', table_name='analysis_jobs')
+    op.create_index('ix_analysis_jobs_status', 'analysis_jobs', ['status'])
+
+    op.drop_index('ix_analyses_user_type_created', table_name='analyses')
+    op.drop_index('ix_analyses_user_created', table_name='analyses')
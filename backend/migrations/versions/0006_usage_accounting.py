@@ -0,0 +1,46 @@
+"""Учет токенов и задержки анализов, дневные агрегаты расхода
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('analyses', sa.Column('prompt_tokens', sa.Integer(), nullable=True))
+    op.add_column('analyses', sa.Column('response_tokens', sa.Integer(), nullable=True))
+    op.add_column('analyses', sa.Column('latency_ms', sa.Integer(), nullable=True))
+
+    op.create_table(
+        'usage_daily',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('analysis_type', sa.String(length=50), nullable=False),
+        sa.Column('requests', sa.Integer(), nullable=False),
+        sa.Column('prompt_tokens', sa.Integer(), nullable=False),
+        sa.Column('response_tokens', sa.Integer(), nullable=False),
+        sa.Column('latency_ms', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('day', 'user_id', 'analysis_type')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('usage_daily')
+
+    with op.batch_alter_table('analyses') as batch_op:
+        batch_op.drop_column('latency_ms')
+        batch_op.drop_column('response_tokens')
+        batch_op.drop_column('prompt_tokens')
@@ -0,0 +1,114 @@
+"""Числовые confidence_score и время обработки анализов
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 00:00:00
+
+"""
+import re
+from typing import Optional, Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Сколько строк переносится за один проход
+BATCH_SIZE = 1000
+
+# Значение целиком: число и необязательная единица ("1.23s", "85%")
+_NUMBER_RE = re.compile(r"\s*([-+]?\d+(?:[.,]\d+)?)\s*(s|%)?\s*", re.IGNORECASE)
+
+analyses = sa.table(
+    'analyses',
+    sa.column('id', sa.Integer),
+    sa.column('confidence_score', sa.String),
+    sa.column('processing_time', sa.String),
+    sa.column('confidence_value', sa.Float),
+    sa.column('latency_ms', sa.Integer),
+)
+
+
+def parse_number(value: Optional[str]) -> Optional[float]:
+    """
+    Число из строки вида "0.95", "1.23s" или "85%" (проценты - доля от 1);
+    некорректные значения - NULL
+    """
+    if not value:
+        return None
+    match = _NUMBER_RE.fullmatch(value)
+    if not match:
+        return None
+    number = float(match.group(1).replace(",", "."))
+    if match.group(2) == "%":
+        number /= 100
+    return number
+
+
+def upgrade() -> None:
+    op.add_column('analyses', sa.Column('confidence_value', sa.Float(), nullable=True))
+
+    # Перенос данных: строки разбираются в Python, чтобы некорректные значения стали NULL.
+    # latency_ms уже заполнен у анализов, сохраненных после 0006, - его не трогаем.
+    conn = op.get_bind()
+    update = analyses.update().where(analyses.c.id == sa.bindparam('row_id')).values(
+        confidence_value=sa.bindparam('confidence'),
+        latency_ms=sa.func.coalesce(analyses.c.latency_ms, sa.bindparam('latency'))
+    )
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(analyses.c.id, analyses.c.confidence_score, analyses.c.processing_time)
+            .where(analyses.c.id > last_id)
+            .order_by(analyses.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+
+        params = []
+        for row in rows:
+            seconds = parse_number(row.processing_time)
+            params.append({
+                'row_id': row.id,
+                'confidence': parse_number(row.confidence_score),
+                'latency': round(seconds * 1000) if seconds is not None else None,
+            })
+        conn.execute(update, params)
+        last_id = rows[-1].id
+
+    with op.batch_alter_table('analyses') as batch_op:
+        batch_op.drop_column('confidence_score')
+        batch_op.drop_column('processing_time')
+
+    with op.batch_alter_table('analyses') as batch_op:
+        batch_op.alter_column(
+            'confidence_value', new_column_name='confidence_score',
+            existing_type=sa.Float(), existing_nullable=True
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('analyses') as batch_op:
+        batch_op.alter_column(
+            'confidence_score', new_column_name='confidence_value',
+            existing_type=sa.Float(), existing_nullable=True
+        )
+
+    op.add_column('analyses', sa.Column('confidence_score', sa.String(length=10), nullable=True))
+    op.add_column('analyses', sa.Column('processing_time', sa.String(length=20), nullable=True))
+
+    op.execute(analyses.update().values(
+        confidence_score=sa.cast(analyses.c.confidence_value, sa.String(10)),
+        processing_time=sa.cast(
+            sa.func.round(analyses.c.latency_ms / sa.literal(1000.0, sa.Numeric), 2), sa.String(20)
+        ) + 's'
+    ))
+
+    with op.batch_alter_table('analyses') as batch_op:
+        batch_op.drop_column('confidence_value')
@@ -2,7 +2,7 @@
 Модели базы данных
 """
 
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, Boolean, ForeignKey, Float, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from backend.database import Base
@@ -34,12 +34,45 @@ class Analysis(Base):
     original_text = Column(Text, nullable=False)
     analysis_type = Column(String(50), nullable=False)  # sentiment, summary, keywords
     result = Column(Text, nullable=False)
-    confidence_score = Column(String(10), nullable=True)
-    processing_time = Column(String(20), nullable=True)
+    confidence_score = Column(Float, nullable=True)
+    prompt_tokens = Column(Integer, nullable=True)
+    response_tokens = Column(Integer, nullable=True)
+    latency_ms = Column(Integer, nullable=True)  # время обработки в миллисекундах
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Связи
     user = relationship("User", back_populates="analyses")
+    
+    # Индексы под запросы истории: фильтр по пользователю (и типу) с сортировкой по дате
+    __table_args__ = (
+        Index("ix_analyses_user_created", "user_id", "created_at", "id"),
+        Index("ix_analyses_user_type_created", "user_id", "analysis_type", "created_at", "id"),
+    )
+
+
+class AnalysisJob(Base):
+    """Модель задания фонового анализа"""
+    __tablename__ = "analysis_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    original_text = Column(Text, nullable=False)
+    analysis_type = Column(String(50), nullable=False)
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, succeeded, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_run_at = Column(DateTime(timezone=True), server_default=func.now())
+    locked_until = Column(DateTime(timezone=True), nullable=True)
+    callback_url = Column(String(500), nullable=True)
+    analysis_id = Column(Integer, ForeignKey("analyses.id"), nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    # Индексы под выборку готовых заданий и подсчет выполняемых по пользователю
+    __table_args__ = (
+        Index("ix_analysis_jobs_status_next_run", "status", "next_run_at"),
+        Index("ix_analysis_jobs_user_status", "user_id", "status"),
+    )
 
 
 class TelegramSession(Base):
@@ -55,3 +88,37 @@ class TelegramSession(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     last_activity = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class AnalysisCacheEntry(Base):
+    """Модель записи кэша результатов анализа"""
+    __tablename__ = "analysis_cache"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String(64), unique=True, index=True, nullable=False)
+    analysis_type = Column(String(50), nullable=False)
+    result = Column(Text, nullable=False)
+    confidence = Column(Float, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class RateLimitBucket(Base):
+    """Модель корзины токенов ограничения частоты запросов"""
+    __tablename__ = "rate_limit_buckets"
+    
+    key = Column(String(200), primary_key=True)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)  # время последнего пополнения (unix time)
+
+
+class UsageDaily(Base):
+    """Модель дневного агрегата расхода по пользователю и типу анализа"""
+    __tablename__ = "usage_daily"
+    
+    day = Column(Date, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    analysis_type = Column(String(50), primary_key=True)
+    requests = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    response_tokens = Column(Integer, nullable=False, default=0)
+    latency_ms = Column(Integer, nullable=False, default=0)  # сумма задержек анализов
@@ -0,0 +1,95 @@
+"""
+Курсорная (keyset) пагинация списков
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import and_, func, or_, select
+
+# Максимальный размер страницы
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(*values) -> str:
+    """Кодирование позиции последней записи страницы в непрозрачную строку"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    """Декодирование курсора; ValueError при неверном формате"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Неверный курсор") from e
+    if not isinstance(values, list):
+        raise ValueError("Неверный курсор")
+    return values
+
+
+def decode_created_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Курсор по (created_at, id)"""
+    values = decode_cursor(cursor)
+    try:
+        created_at, row_id = values
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Неверный курсор") from e
+
+
+def decode_id_cursor(cursor: str) -> int:
+    """Курсор по id"""
+    values = decode_cursor(cursor)
+    try:
+        (row_id,) = values
+        return int(row_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Неверный курсор") from e
+
+
+def created_before(model, cursor: Tuple[datetime, int]):
+    """
+    Условие "после курсора" для сортировки по (created_at DESC, id DESC).
+    created_at берется из самой строки курсора, если она еще существует:
+    так сравнение не зависит от формата хранения дат (SQLite хранит
+    CURRENT_TIMESTAMP без микросекунд).
+    """
+    created_at, row_id = cursor
+    anchor = func.coalesce(
+        select(model.created_at).where(model.id == row_id).scalar_subquery(),
+        created_at
+    )
+    # created_at <= anchor - граница диапазона индекса (user_id, created_at, id):
+    # без нее каждая следующая страница просматривала бы все более новые записи
+    return and_(
+        model.created_at <= anchor,
+        or_(model.created_at < anchor, model.id < row_id)
+    )
+
+
+def page_size(limit: int) -> int:
+    """Размер страницы в допустимых пределах"""
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def split_page(rows: list, limit: int) -> Tuple[list, bool]:
+    """Отделение лишней записи, запрошенной для проверки наличия следующей страницы"""
+    return rows[:limit], len(rows) > limit
+
+
+def next_created_cursor(rows: list, has_more: bool) -> Optional[str]:
+    if not has_more or not rows:
+        return None
+    last = rows[-1]
+    return encode_cursor(last.created_at, last.id)
+
+
+def next_id_cursor(rows: list, has_more: bool) -> Optional[str]:
+    if not has_more or not rows:
+        return None
+    return encode_cursor(rows[-1].id)
@@ -0,0 +1,91 @@
+"""
+Роутер отчетов администратора
+"""
+
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.config import settings
+from backend.database import get_db
+from backend.models import UsageDaily, User
+from backend.pagination import page_size
+from backend.schemas import User as UserSchema, UsageReport
+from backend.routers.auth import get_current_user
+
+router = APIRouter()
+
+# Максимальный период отчета о расходе (дни)
+MAX_USAGE_REPORT_DAYS = 366
+
+
+async def get_admin_user(
+    current_user: UserSchema = Depends(get_current_user)
+) -> UserSchema:
+    """Зависимость FastAPI: текущий пользователь с правами администратора"""
+    if current_user.username not in settings.ADMIN_USERNAMES:
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+    return current_user
+
+
+def usage_totals():
+    """Суммы расхода по дневным агрегатам"""
+    requests = func.coalesce(func.sum(UsageDaily.requests), 0)
+    return (
+        requests.label("requests"),
+        func.coalesce(func.sum(UsageDaily.prompt_tokens), 0).label("prompt_tokens"),
+        func.coalesce(func.sum(UsageDaily.response_tokens), 0).label("response_tokens"),
+        (func.sum(UsageDaily.latency_ms) * 1.0 / func.nullif(requests, 0)).label("avg_latency_ms")
+    )
+
+
+@router.get("/usage", response_model=UsageReport)
+async def get_usage_report(
+    days: int = 30,
+    users_limit: int = 20,
+    db: AsyncSession = Depends(get_db),
+    admin: UserSchema = Depends(get_admin_user)
+):
+    """
+    Расход токенов Gemini и средняя задержка за последние days дней:
+    по дням, по пользователям (самые затратные первыми) и по типам анализа.
+    Отчет строится по дневным агрегатам, без чтения таблицы анализов.
+    """
+    days = max(1, min(days, MAX_USAGE_REPORT_DAYS))
+    since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+    in_period = UsageDaily.day >= since
+    
+    total = (await db.execute(select(*usage_totals()).where(in_period))).one()
+    
+    by_day = await db.execute(
+        select(UsageDaily.day, *usage_totals())
+        .where(in_period)
+        .group_by(UsageDaily.day)
+        .order_by(UsageDaily.day)
+    )
+    
+    tokens = func.sum(UsageDaily.prompt_tokens) + func.sum(UsageDaily.response_tokens)
+    by_user = await db.execute(
+        select(UsageDaily.user_id, User.username, *usage_totals())
+        .join(User, User.id == UsageDaily.user_id)
+        .where(in_period)
+        .group_by(UsageDaily.user_id, User.username)
+        .order_by(tokens.desc())
+        .limit(page_size(users_limit))
+    )
+    
+    by_type = await db.execute(
+        select(UsageDaily.analysis_type, *usage_totals())
+        .where(in_period)
+        .group_by(UsageDaily.analysis_type)
+        .order_by(UsageDaily.analysis_type)
+    )
+    
+    return UsageReport(
+        since=since,
+        total=total._asdict(),
+        days=[row._asdict() for row in by_day],
+        users=[row._asdict() for row in by_user],
+        analysis_types=[row._asdict() for row in by_type]
+    )
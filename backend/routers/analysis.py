@@ -2,50 +2,150 @@
 Роутер для анализа контента с помощью Gemini AI
 """
 
+import asyncio
+import json
+import math
 import time
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from typing import Any, AsyncIterator, Awaitable, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from backend.database import get_db
-from backend.models import User, Analysis
-from backend.schemas import AnalysisRequest, AnalysisResponse, AnalysisList
+from backend.config import settings
+from backend.database import get_db, SessionLocal
+from backend.models import Analysis, AnalysisJob
+from backend.pagination import (
+    created_before, decode_created_cursor, next_created_cursor, page_size, split_page
+)
+from backend.schemas import (
+    AnalysisRequest, AnalysisResponse, AnalysisList,
+    BatchAnalysisRequest, BatchAnalysisItem, BatchAnalysisResponse,
+    CombinedAnalysisRequest, CombinedAnalysisResponse,
+    AnalysisJobRequest, AnalysisJobResponse, User as UserSchema
+)
 from backend.routers.auth import get_current_user
-from backend.services.gemini_service import GeminiService
+from backend.services.analysis_service import (
+    ANALYSIS_TYPES, AnalysisResult, AnalysisService, get_analysis_service
+)
+from backend.services.history import history_filters, select_analysis_previews
+from backend.services.job_queue import check_callback_url, job_queue
+from backend.services.gemini_service import GeminiTransientError
+from backend.services.rate_limit import RateLimitExceeded, get_rate_limiter
+from backend.services.resilience import CircuitOpenError
+from backend.services.usage import record_usage
 
 router = APIRouter()
 
+# Как часто проверяем, не отключился ли клиент во время анализа (секунды)
+DISCONNECT_POLL_INTERVAL = 0.5
+
+
+async def run_until_disconnected(http_request: Request, coro: Awaitable[Any]) -> Any:
+    """
+    Выполнение корутины с отменой при отключении HTTP клиента.
+    Если клиент закрыл соединение, запрос к модели отменяется.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Клиент закрыл соединение")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def get_analyzer() -> AnalysisService:
+    """Зависимость FastAPI: общий экземпляр AnalysisService"""
+    try:
+        return get_analysis_service()
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+def rate_limit_error(error: RateLimitExceeded) -> HTTPException:
+    """Ответ 429 с заголовком Retry-After"""
+    retry_after = math.ceil(error.retry_after)
+    return HTTPException(
+        status_code=429,
+        detail=f"Слишком много запросов. Повторите через {retry_after} с",
+        headers={"Retry-After": str(retry_after)}
+    )
+
+
+def upstream_unavailable_error(error: Exception) -> HTTPException:
+    """Ответ 503, когда Gemini перегружен или отключен выключателем"""
+    headers = None
+    if isinstance(error, CircuitOpenError):
+        headers = {"Retry-After": str(math.ceil(error.retry_after))}
+    return HTTPException(
+        status_code=503,
+        detail=f"Сервис анализа временно недоступен: {str(error)}",
+        headers=headers
+    )
+
+
+def resolve_engine(
+    analysis_service: AnalysisService, request: AnalysisRequest
+) -> str:
+    """Движок анализа для запроса; 400, если движок не подходит"""
+    try:
+        return analysis_service.select_engine(request.analysis_type, request.text, request.engine)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def check_user_rate(user_id: int, cost: float = 1):
+    """Списание из квот пользователя и сервиса; 429 при превышении"""
+    try:
+        await get_rate_limiter().check_user(user_id, cost)
+    except RateLimitExceeded as e:
+        raise rate_limit_error(e)
+
+
+async def get_rate_limited_user(
+    current_user: UserSchema = Depends(get_current_user)
+) -> UserSchema:
+    """Зависимость FastAPI: текущий пользователь с учетом лимита запросов анализа"""
+    await check_user_rate(current_user.id)
+    return current_user
+
 
 @router.post("/", response_model=AnalysisResponse)
 async def create_analysis(
     request: AnalysisRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    http_request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserSchema = Depends(get_rate_limited_user),
+    analysis_service: AnalysisService = Depends(get_analyzer)
 ):
     """Создание нового анализа контента"""
     start_time = time.time()
     
     # Проверяем тип анализа
-    valid_types = ["sentiment", "summary", "keywords"]
-    if request.analysis_type not in valid_types:
+    if request.analysis_type not in ANALYSIS_TYPES:
         raise HTTPException(
             status_code=400,
-            detail=f"Неподдерживаемый тип анализа. Доступные: {', '.join(valid_types)}"
+            detail=f"Неподдерживаемый тип анализа. Доступные: {', '.join(ANALYSIS_TYPES)}"
         )
     
+    engine = resolve_engine(analysis_service, request)
+    
     try:
-        # Инициализируем сервис Gemini
-        gemini_service = GeminiService()
-        
-        # Выполняем анализ в зависимости от типа
-        if request.analysis_type == "sentiment":
-            result, confidence = await gemini_service.analyze_sentiment(request.text)
-        elif request.analysis_type == "summary":
-            result, confidence = await gemini_service.create_summary(request.text)
-        elif request.analysis_type == "keywords":
-            result, confidence = await gemini_service.extract_keywords(request.text)
+        # Выполняем анализ (результат может быть взят из кэша)
+        analysis_result = await run_until_disconnected(
+            http_request,
+            analysis_service.analyze(request.analysis_type, request.text, engine)
+        )
+        result = analysis_result.result
+        confidence = analysis_result.confidence
         
-        processing_time = f"{time.time() - start_time:.2f}s"
+        elapsed = time.time() - start_time
         
         # Сохраняем результат в БД
         analysis = Analysis(
@@ -53,16 +153,164 @@ async def create_analysis(
             original_text=request.text,
             analysis_type=request.analysis_type,
             result=result,
-            confidence_score=str(confidence) if confidence else None,
-            processing_time=processing_time
+            confidence_score=confidence,
+            prompt_tokens=analysis_result.prompt_tokens,
+            response_tokens=analysis_result.response_tokens,
+            latency_ms=round(elapsed * 1000)
         )
         
         db.add(analysis)
-        db.commit()
-        db.refresh(analysis)
+        await record_usage(db, [analysis])
+        await db.commit()
+        await db.refresh(analysis)
+        analysis.from_cache = analysis_result.from_cache
+        analysis.engine = analysis_result.engine
         
         return analysis
         
+    except HTTPException:
+        raise
+    except RateLimitExceeded as e:
+        raise rate_limit_error(e)
+    except (CircuitOpenError, GeminiTransientError) as e:
+        raise upstream_unavailable_error(e)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ошибка при анализе контента: {str(e)}"
+        )
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Формирование события server-sent events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/stream")
+async def create_analysis_stream(
+    request: AnalysisRequest,
+    current_user: UserSchema = Depends(get_rate_limited_user),
+    analysis_service: AnalysisService = Depends(get_analyzer)
+):
+    """
+    Потоковый анализ контента (text/event-stream).
+    События: token - очередной фрагмент, done - сохраненный анализ, error - ошибка
+    """
+    if request.analysis_type not in ANALYSIS_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неподдерживаемый тип анализа. Доступные: {', '.join(ANALYSIS_TYPES)}"
+        )
+    
+    engine = resolve_engine(analysis_service, request)
+    user_id = current_user.id
+    
+    async def event_stream() -> AsyncIterator[str]:
+        start_time = time.time()
+        analysis_result = None
+        
+        try:
+            async for item in analysis_service.analyze_stream(
+                request.analysis_type, request.text, engine
+            ):
+                if isinstance(item, AnalysisResult):
+                    analysis_result = item
+                else:
+                    yield format_sse("token", {"text": item})
+        except (RateLimitExceeded, CircuitOpenError) as e:
+            yield format_sse("error", {
+                "detail": str(e),
+                "retry_after": math.ceil(e.retry_after)
+            })
+            return
+        except Exception as e:
+            yield format_sse("error", {"detail": f"Ошибка при анализе контента: {str(e)}"})
+            return
+        
+        elapsed = time.time() - start_time
+        
+        # Сохраняем итоговый результат после завершения потока
+        async with SessionLocal() as db:
+            analysis = Analysis(
+                user_id=user_id,
+                original_text=request.text,
+                analysis_type=request.analysis_type,
+                result=analysis_result.result,
+                confidence_score=analysis_result.confidence,
+                prompt_tokens=analysis_result.prompt_tokens,
+                response_tokens=analysis_result.response_tokens,
+                latency_ms=round(elapsed * 1000)
+            )
+            try:
+                db.add(analysis)
+                await record_usage(db, [analysis])
+                await db.commit()
+                await db.refresh(analysis)
+                analysis.from_cache = analysis_result.from_cache
+                analysis.engine = analysis_result.engine
+            except Exception as e:
+                yield format_sse("error", {"detail": f"Ошибка при сохранении анализа: {str(e)}"})
+                return
+            
+            yield format_sse("done", AnalysisResponse.model_validate(analysis).model_dump(mode="json"))
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/all", response_model=CombinedAnalysisResponse)
+async def create_combined_analysis(
+    request: CombinedAnalysisRequest,
+    http_request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserSchema = Depends(get_rate_limited_user),
+    analysis_service: AnalysisService = Depends(get_analyzer)
+):
+    """Тональность, резюме и ключевые слова одним запросом к модели"""
+    start_time = time.time()
+    
+    try:
+        results = await run_until_disconnected(
+            http_request,
+            analysis_service.analyze_all(request.text)
+        )
+        
+        elapsed = time.time() - start_time
+        
+        # Сохраняем по записи на каждый тип анализа
+        analyses = [
+            Analysis(
+                user_id=current_user.id,
+                original_text=request.text,
+                analysis_type=analysis_type,
+                result=analysis_result.result,
+                confidence_score=analysis_result.confidence,
+                prompt_tokens=analysis_result.prompt_tokens,
+                response_tokens=analysis_result.response_tokens,
+                latency_ms=round(elapsed * 1000)
+            )
+            for analysis_type, analysis_result in results.items()
+        ]
+        
+        db.add_all(analyses)
+        await record_usage(db, analyses)
+        await db.commit()
+        for analysis in analyses:
+            await db.refresh(analysis)
+            analysis.from_cache = results[analysis.analysis_type].from_cache
+            analysis.engine = results[analysis.analysis_type].engine
+        
+        return CombinedAnalysisResponse(analyses=analyses)
+        
+    except HTTPException:
+        raise
+    except RateLimitExceeded as e:
+        raise rate_limit_error(e)
+    except (CircuitOpenError, GeminiTransientError) as e:
+        raise upstream_unavailable_error(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -70,37 +318,210 @@ async def create_analysis(
         )
 
 
+@router.post("/batch", response_model=BatchAnalysisResponse)
+async def create_analyses_batch(
+    request: BatchAnalysisRequest,
+    http_request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserSchema = Depends(get_current_user),
+    analysis_service: AnalysisService = Depends(get_analyzer)
+):
+    """Пакетный анализ: несколько текстов за один запрос"""
+    if not request.items:
+        raise HTTPException(status_code=400, detail="Пустой пакет")
+    
+    if len(request.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Слишком много элементов в пакете. Максимум: {settings.BATCH_MAX_ITEMS}"
+        )
+    
+    # Каждый элемент пакета расходует квоту как отдельный запрос
+    await check_user_rate(current_user.id, cost=len(request.items))
+    
+    semaphore = asyncio.Semaphore(settings.BATCH_CONCURRENCY)
+    
+    async def analyze_item(item: AnalysisRequest):
+        if item.analysis_type not in ANALYSIS_TYPES:
+            raise ValueError(
+                f"Неподдерживаемый тип анализа. Доступные: {', '.join(ANALYSIS_TYPES)}"
+            )
+        engine = analysis_service.select_engine(item.analysis_type, item.text, item.engine)
+        async with semaphore:
+            start_time = time.time()
+            analysis_result = await analysis_service.analyze(item.analysis_type, item.text, engine)
+            return analysis_result, time.time() - start_time
+    
+    # Ошибка одного элемента не прерывает остальные
+    outcomes = await run_until_disconnected(
+        http_request,
+        asyncio.gather(*(analyze_item(item) for item in request.items), return_exceptions=True)
+    )
+    
+    results = [BatchAnalysisItem(index=index) for index in range(len(request.items))]
+    rows = []
+    for index, (item, outcome) in enumerate(zip(request.items, outcomes)):
+        if isinstance(outcome, BaseException):
+            results[index].error = str(outcome)
+            continue
+        
+        analysis_result, elapsed = outcome
+        analysis = Analysis(
+            user_id=current_user.id,
+            original_text=item.text,
+            analysis_type=item.analysis_type,
+            result=analysis_result.result,
+            confidence_score=analysis_result.confidence,
+            prompt_tokens=analysis_result.prompt_tokens,
+            response_tokens=analysis_result.response_tokens,
+            latency_ms=round(elapsed * 1000)
+        )
+        rows.append((index, analysis, analysis_result))
+    
+    # Все записи сохраняем одной транзакцией
+    if rows:
+        try:
+            db.add_all([analysis for _, analysis, _ in rows])
+            await record_usage(db, [analysis for _, analysis, _ in rows])
+            await db.flush()
+            ids = [analysis.id for _, analysis, _ in rows]
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            raise HTTPException(
+                status_code=500,
+                detail=f"Ошибка при сохранении результатов: {str(e)}"
+            )
+        
+        # Перечитываем сохраненные записи одним запросом
+        saved_rows = await db.execute(
+            select(Analysis).where(Analysis.id.in_(ids)).execution_options(populate_existing=True)
+        )
+        saved = {analysis.id: analysis for analysis in saved_rows.scalars()}
+        for (index, _, analysis_result), analysis_id in zip(rows, ids):
+            analysis = saved[analysis_id]
+            analysis.from_cache = analysis_result.from_cache
+            analysis.engine = analysis_result.engine
+            results[index].analysis = AnalysisResponse.model_validate(analysis)
+    
+    succeeded = len(rows)
+    return BatchAnalysisResponse(
+        results=results,
+        succeeded=succeeded,
+        failed=len(results) - succeeded
+    )
+
+
+@router.post("/jobs", response_model=AnalysisJobResponse, status_code=202)
+async def create_analysis_job(
+    request: AnalysisJobRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserSchema = Depends(get_rate_limited_user)
+):
+    """Постановка анализа в очередь: ответ возвращается сразу, результат - через статус задания"""
+    if request.analysis_type not in ANALYSIS_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неподдерживаемый тип анализа. Доступные: {', '.join(ANALYSIS_TYPES)}"
+        )
+    
+    callback_url = str(request.callback_url) if request.callback_url else None
+    if callback_url:
+        try:
+            await check_callback_url(callback_url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    job = AnalysisJob(
+        user_id=current_user.id,
+        original_text=request.text,
+        analysis_type=request.analysis_type,
+        callback_url=callback_url
+    )
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    
+    job_queue.notify()
+    
+    return job
+
+
+@router.get("/jobs/{job_id}", response_model=AnalysisJobResponse)
+async def get_analysis_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserSchema = Depends(get_current_user)
+):
+    """Статус задания анализа"""
+    result = await db.execute(select(AnalysisJob).where(
+        AnalysisJob.id == job_id,
+        AnalysisJob.user_id == current_user.id
+    ))
+    job = result.scalars().first()
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+    
+    return job
+
+
 @router.get("/", response_model=AnalysisList)
 async def get_user_analyses(
-    skip: int = 0,
+    cursor: Optional[str] = None,
     limit: int = 20,
     analysis_type: str = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    min_confidence: Optional[float] = None,
+    max_latency_ms: Optional[int] = None,
+    include_total: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserSchema = Depends(get_current_user)
 ):
-    """Получение анализов пользователя"""
-    query = db.query(Analysis).filter(Analysis.user_id == current_user.id)
+    """
+    Получение анализов пользователя, новые первыми.
+    Тексты в списке обрезаны до превью, полный анализ - GET /{analysis_id}.
+    Следующая страница запрашивается по next_cursor из предыдущего ответа
+    (с теми же фильтрами).
+    """
+    limit = page_size(limit)
+    filters = (current_user.id, analysis_type, min_confidence, max_latency_ms)
+    query = select_analysis_previews(*filters)
+    
+    # Общее количество считается только по запросу: это отдельный проход по истории
+    total = None
+    if include_total:
+        total = await db.scalar(select(func.count(Analysis.id)).where(*history_filters(*filters)))
     
-    if analysis_type:
-        query = query.filter(Analysis.analysis_type == analysis_type)
+    if cursor:
+        try:
+            query = query.where(created_before(Analysis, decode_created_cursor(cursor)))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     
-    total = query.count()
-    analyses = query.order_by(Analysis.created_at.desc()).offset(skip).limit(limit).all()
+    result = await db.execute(
+        query.order_by(Analysis.created_at.desc(), Analysis.id.desc()).limit(limit + 1)
+    )
+    analyses, has_more = split_page(result.all(), limit)
     
-    return AnalysisList(analyses=analyses, total=total)
+    return AnalysisList(
+        analyses=analyses,
+        next_cursor=next_created_cursor(analyses, has_more),
+        total=total
+    )
 
 
 @router.get("/{analysis_id}", response_model=AnalysisResponse)
 async def get_analysis(
     analysis_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserSchema = Depends(get_current_user)
 ):
     """Получение конкретного анализа"""
-    analysis = db.query(Analysis).filter(
+    result = await db.execute(select(Analysis).where(
         Analysis.id == analysis_id,
         Analysis.user_id == current_user.id
-    ).first()
+    ))
+    analysis = result.scalars().first()
     
     if not analysis:
         raise HTTPException(status_code=404, detail="Анализ не найден")
@@ -111,19 +532,20 @@ async def get_analysis(
 @router.delete("/{analysis_id}")
 async def delete_analysis(
     analysis_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserSchema = Depends(get_current_user)
 ):
     """Удаление анализа"""
-    analysis = db.query(Analysis).filter(
+    result = await db.execute(select(Analysis).where(
         Analysis.id == analysis_id,
         Analysis.user_id == current_user.id
-    ).first()
+    ))
+    analysis = result.scalars().first()
     
     if not analysis:
         raise HTTPException(status_code=404, detail="Анализ не найден")
     
-    db.delete(analysis)
-    db.commit()
+    await db.delete(analysis)
+    await db.commit()
     
     return {"message": "Анализ успешно удален"}
@@ -2,11 +2,15 @@
 Роутер для аутентификации пользователей
 """
 
+import asyncio
+import math
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 
@@ -14,39 +18,120 @@ from backend.database import get_db
 from backend.models import User
 from backend.schemas import Token, TokenData, User as UserSchema, UserCreate
 from backend.config import settings
+from backend.services.cache import TTLCache
+from backend.services.rate_limit import TokenBucketLimiter, client_ip
 
 router = APIRouter()
 
 # Настройка шифрования паролей
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/token")
 
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+# Снимки проверенных пользователей по id: аутентификация без запроса к БД
+user_cache = TTLCache(
+    max_entries=settings.AUTH_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.AUTH_CACHE_TTL_SECONDS
+)
+
+
+# bcrypt занимает процессор на сотни миллисекунд, поэтому выполняется
+# в отдельном пуле потоков, а не в цикле событий
+password_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+
+# Ограничение попыток входа: корзина на пару (адрес клиента, имя пользователя),
+# корзина на адрес клиента и общая корзина
+login_limiter = TokenBucketLimiter(
+    capacity=settings.LOGIN_RATE_LIMIT_BURST,
+    refill_per_second=settings.LOGIN_RATE_LIMIT_PER_MINUTE / 60
+)
+login_ip_limiter = TokenBucketLimiter(
+    capacity=settings.LOGIN_IP_RATE_LIMIT_BURST,
+    refill_per_second=settings.LOGIN_IP_RATE_LIMIT_PER_MINUTE / 60
+)
+login_global_limiter = TokenBucketLimiter(
+    capacity=settings.LOGIN_GLOBAL_RATE_LIMIT_PER_SECOND,
+    refill_per_second=settings.LOGIN_GLOBAL_RATE_LIMIT_PER_SECOND
+)
+
+
+def invalidate_user_cache(user_id: int):
+    """Сброс снимка пользователя после изменения его данных"""
+    user_cache.delete(user_id)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Проверка пароля"""
-    return pwd_context.verify(plain_password, hashed_password)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        password_executor, pwd_context.verify, plain_password, hashed_password
+    )
+
+
+async def verify_and_update_password(plain_password: str, hashed_password: str):
+    """Проверка пароля; новый хеш, если старый создан с другими параметрами"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        password_executor, pwd_context.verify_and_update, plain_password, hashed_password
+    )
 
 
-def get_password_hash(password: str) -> str:
+async def get_password_hash(password: str) -> str:
     """Хеширование пароля"""
-    return pwd_context.hash(password)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, pwd_context.hash, password)
+
+
+async def check_login_rate(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+    """
+    Зависимость FastAPI: ограничение частоты попыток входа. Подбор пароля
+    к одному аккаунту не блокирует вход этому пользователю с других адресов.
+    Асинхронная, чтобы выполняться в цикле событий, а не в пуле потоков.
+    """
+    client = client_ip(request)
+    username = form_data.username.strip().lower()[:100]
+    retry_after = login_limiter.acquire((client, username))
+    if not retry_after:
+        retry_after = login_ip_limiter.acquire(client)
+    if not retry_after:
+        retry_after = login_global_limiter.acquire("all")
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Слишком много попыток входа. Попробуйте позже",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
 
 
-def get_user_by_username(db: Session, username: str) -> Optional[User]:
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
     """Получение пользователя по имени"""
-    return db.query(User).filter(User.username == username).first()
+    result = await db.execute(select(User).where(User.username == username))
+    return result.scalars().first()
 
 
-def get_user_by_email(db: Session, email: str) -> Optional[User]:
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
     """Получение пользователя по email"""
-    return db.query(User).filter(User.email == email).first()
+    result = await db.execute(select(User).where(User.email == email))
+    return result.scalars().first()
 
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
+async def authenticate_user(db: AsyncSession, username: str, password: str) -> Optional[User]:
     """Аутентификация пользователя"""
-    user = get_user_by_username(db, username)
-    if not user or not verify_password(password, user.hashed_password):
+    user = await get_user_by_username(db, username)
+    if not user:
         return None
+    
+    verified, new_hash = await verify_and_update_password(password, user.hashed_password)
+    if not verified:
+        return None
+    
+    # Хеш создан с устаревшей стоимостью bcrypt - пересчитываем
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
     return user
 
 
@@ -62,8 +147,14 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """Получение текущего пользователя из токена"""
+async def get_current_user(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)
+) -> UserSchema:
+    """
+    Получение текущего пользователя из токена.
+    Возвращает снимок пользователя (не ORM объект); снимки кэшируются
+    на AUTH_CACHE_TTL_SECONDS, поэтому повторные запросы не обращаются к БД.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Не удалось проверить учетные данные",
@@ -74,53 +165,66 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
-        token_data = TokenData(username=username)
+        token_data = TokenData(username=username, user_id=payload.get("uid"))
     except JWTError:
         raise credentials_exception
     
-    user = get_user_by_username(db, username=token_data.username)
-    if user is None:
+    if token_data.user_id is not None:
+        cached = user_cache.get(token_data.user_id)
+        if cached is not None:
+            if cached.username != token_data.username:
+                raise credentials_exception
+            return cached
+        user = await db.get(User, token_data.user_id)
+    else:
+        # Токены, выданные до появления uid
+        user = await get_user_by_username(db, username=token_data.username)
+    
+    if user is None or user.username != token_data.username:
         raise credentials_exception
-    return user
+    
+    snapshot = UserSchema.model_validate(user)
+    user_cache.set(user.id, snapshot)
+    return snapshot
 
 
 @router.post("/register", response_model=UserSchema)
-async def register_user(user: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
     """Регистрация нового пользователя"""
     # Проверяем, не существует ли уже такой пользователь
-    if get_user_by_username(db, user.username):
+    if await get_user_by_username(db, user.username):
         raise HTTPException(
             status_code=400,
             detail="Пользователь с таким именем уже существует"
         )
     
-    if get_user_by_email(db, user.email):
+    if await get_user_by_email(db, user.email):
         raise HTTPException(
             status_code=400,
             detail="Пользователь с таким email уже существует"
         )
     
     # Создаем нового пользователя
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     db_user = User(
         username=user.username,
         email=user.email,
         hashed_password=hashed_password
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
     return db_user
 
 
-@router.post("/token", response_model=Token)
+@router.post("/token", response_model=Token, dependencies=[Depends(check_login_rate)])
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Получение токена доступа"""
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -129,12 +233,12 @@ async def login_for_access_token(
         )
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": user.username, "uid": user.id}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 @router.get("/me", response_model=UserSchema)
-async def read_users_me(current_user: User = Depends(get_current_user)):
+async def read_users_me(current_user: UserSchema = Depends(get_current_user)):
     """Получение информации о текущем пользователе"""
     return current_user
@@ -0,0 +1,88 @@
+"""
+Роутер API для Telegram бота (BOT_STORAGE_MODE=api): привязка аккаунтов,
+история и пакетное сохранение данных бота. Доступ по токену BOT_API_TOKEN.
+"""
+
+import hmac
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.config import settings
+from backend.database import get_db
+from backend.pagination import page_size
+from backend.routers.auth import invalidate_user_cache
+from backend.schemas import (
+    AnalysisPreview, TelegramAccount, TelegramLinkRequest, TelegramRecords, TelegramRecordsSaved
+)
+from backend.services.telegram_storage import (
+    AccountAlreadyLinked, find_user_id, link_account, recent_analyses, save_records, unlink_account
+)
+
+
+async def verify_bot_token(x_bot_token: Optional[str] = Header(None)):
+    """Зависимость FastAPI: запрос от Telegram бота (заголовок X-Bot-Token)"""
+    if not settings.BOT_API_TOKEN:
+        raise HTTPException(status_code=403, detail="API для бота отключено")
+    if not x_bot_token or not hmac.compare_digest(x_bot_token, settings.BOT_API_TOKEN):
+        raise HTTPException(status_code=401, detail="Неверный токен бота")
+
+
+router = APIRouter(dependencies=[Depends(verify_bot_token)])
+
+
+@router.get("/accounts/{telegram_id}", response_model=TelegramAccount)
+async def get_account(telegram_id: str, db: AsyncSession = Depends(get_db)):
+    """Пользователь, привязанный к Telegram аккаунту"""
+    return TelegramAccount(telegram_id=telegram_id, user_id=await find_user_id(db, telegram_id))
+
+
+@router.put("/accounts/{telegram_id}", response_model=TelegramAccount)
+async def link_telegram_account(
+    telegram_id: str,
+    request: TelegramLinkRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """Привязка Telegram аккаунта к пользователю (/connect)"""
+    try:
+        user_id = await link_account(db, request.username, telegram_id)
+    except AccountAlreadyLinked:
+        raise HTTPException(
+            status_code=409, detail="Telegram аккаунт уже привязан к другому пользователю"
+        )
+    if user_id is None:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    invalidate_user_cache(user_id)
+    return TelegramAccount(telegram_id=telegram_id, user_id=user_id)
+
+
+@router.delete("/accounts/{telegram_id}", response_model=TelegramAccount)
+async def unlink_telegram_account(telegram_id: str, db: AsyncSession = Depends(get_db)):
+    """Отвязка Telegram аккаунта (/disconnect); user_id - отвязанный пользователь"""
+    user_id = await unlink_account(db, telegram_id)
+    if user_id is not None:
+        invalidate_user_cache(user_id)
+    return TelegramAccount(telegram_id=telegram_id, user_id=user_id)
+
+
+@router.get("/analyses", response_model=List[AnalysisPreview])
+async def get_recent_analyses(user_id: int, limit: int = 5, db: AsyncSession = Depends(get_db)):
+    """Превью последних анализов пользователя (/history)"""
+    return await recent_analyses(db, user_id, page_size(limit))
+
+
+@router.post("/records", response_model=TelegramRecordsSaved)
+async def save_telegram_records(records: TelegramRecords, db: AsyncSession = Depends(get_db)):
+    """Сохранение пакета сессий и анализов бота одной транзакцией"""
+    if max(len(records.sessions), len(records.analyses)) > settings.BOT_API_MAX_RECORDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Слишком много записей в пакете. Максимум: {settings.BOT_API_MAX_RECORDS}"
+        )
+    
+    await save_records(
+        db,
+        [session.model_dump() for session in records.sessions],
+        [analysis.model_dump() for analysis in records.analyses]
+    )
+    return TelegramRecordsSaved(sessions=len(records.sessions), analyses=len(records.analyses))
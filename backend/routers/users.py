@@ -2,38 +2,51 @@
 Роутер для управления пользователями
 """
 
-from typing import List
+from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from backend.database import get_db
 from backend.models import User
-from backend.schemas import User as UserSchema, UserUpdate
-from backend.routers.auth import get_current_user
+from backend.pagination import decode_id_cursor, next_id_cursor, page_size, split_page
+from backend.schemas import User as UserSchema, UserList, UserUpdate
+from backend.routers.auth import get_current_user, invalidate_user_cache
 
 router = APIRouter()
 
 
-@router.get("/", response_model=List[UserSchema])
+@router.get("/", response_model=UserList)
 async def get_users(
-    skip: int = 0,
+    cursor: Optional[str] = None,
     limit: int = 100,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserSchema = Depends(get_current_user)
 ):
-    """Получение списка пользователей"""
-    users = db.query(User).offset(skip).limit(limit).all()
-    return users
+    """Получение списка пользователей (курсорная пагинация по id)"""
+    limit = page_size(limit)
+    query = select(User).order_by(User.id)
+    
+    if cursor:
+        try:
+            query = query.where(User.id > decode_id_cursor(cursor))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    result = await db.execute(query.limit(limit + 1))
+    users, has_more = split_page(result.scalars().all(), limit)
+    
+    return UserList(users=users, next_cursor=next_id_cursor(users, has_more))
 
 
 @router.get("/{user_id}", response_model=UserSchema)
 async def get_user(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserSchema = Depends(get_current_user)
 ):
     """Получение пользователя по ID"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     return user
@@ -42,13 +55,18 @@ async def get_user(
 @router.put("/me", response_model=UserSchema)
 async def update_current_user(
     user_update: UserUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserSchema = Depends(get_current_user)
 ):
     """Обновление информации о текущем пользователе"""
+    user = await db.get(User, current_user.id)
+    if not user:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    
     for field, value in user_update.dict(exclude_unset=True).items():
-        setattr(current_user, field, value)
+        setattr(user, field, value)
     
-    db.commit()
-    db.refresh(current_user)
-    return current_user
+    await db.commit()
+    await db.refresh(user)
+    invalidate_user_cache(user.id)
+    return user
@@ -2,9 +2,9 @@
 Pydantic схемы для валидации данных
 """
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, HttpUrl, computed_field
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime
 
 
 # Схемы для пользователей
@@ -33,6 +33,11 @@ class User(UserBase):
         from_attributes = True
 
 
+class UserList(BaseModel):
+    users: List[User]
+    next_cursor: Optional[str] = None
+
+
 # Схемы для аутентификации
 class Token(BaseModel):
     access_token: str
@@ -41,30 +46,105 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     username: Optional[str] = None
+    user_id: Optional[int] = None
 
 
 # Схемы для анализа
 class AnalysisRequest(BaseModel):
     text: str
     analysis_type: str  # sentiment, summary, keywords
+    engine: Optional[str] = None  # gemini, local; по умолчанию - по длине текста
+
+
+class AnalysisTiming(BaseModel):
+    """Время обработки в прежнем строковом формате ("1.23s") по полю latency_ms"""
+    
+    @computed_field
+    @property
+    def processing_time(self) -> Optional[str]:
+        if self.latency_ms is None:
+            return None
+        return f"{self.latency_ms / 1000:.2f}s"
 
 
-class AnalysisResponse(BaseModel):
+class AnalysisResponse(AnalysisTiming):
     id: int
     original_text: str
     analysis_type: str
     result: str
-    confidence_score: Optional[str] = None
-    processing_time: Optional[str] = None
+    confidence_score: Optional[float] = None
+    latency_ms: Optional[int] = None
     created_at: datetime
+    from_cache: bool = False
+    engine: Optional[str] = None
     
     class Config:
         from_attributes = True
 
 
-class AnalysisList(BaseModel):
+class CombinedAnalysisRequest(BaseModel):
+    text: str
+
+
+class CombinedAnalysisResponse(BaseModel):
     analyses: List[AnalysisResponse]
-    total: int
+
+
+class BatchAnalysisRequest(BaseModel):
+    items: List[AnalysisRequest]
+
+
+class BatchAnalysisItem(BaseModel):
+    index: int
+    analysis: Optional[AnalysisResponse] = None
+    error: Optional[str] = None
+
+
+class BatchAnalysisResponse(BaseModel):
+    results: List[BatchAnalysisItem]
+    succeeded: int
+    failed: int
+
+
+class AnalysisJobRequest(BaseModel):
+    text: str
+    analysis_type: str
+    callback_url: Optional[HttpUrl] = None
+
+
+class AnalysisJobResponse(BaseModel):
+    id: int
+    analysis_type: str
+    status: str  # queued, running, succeeded, failed
+    attempts: int
+    analysis_id: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+
+class AnalysisPreview(AnalysisTiming):
+    """Элемент списка анализов: original_text и result обрезаны до превью"""
+    id: int
+    original_text: str
+    analysis_type: str
+    result: str
+    truncated: bool = False
+    confidence_score: Optional[float] = None
+    latency_ms: Optional[int] = None
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+
+class AnalysisList(BaseModel):
+    analyses: List[AnalysisPreview]
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
 
 
 # Схемы для Telegram
@@ -75,6 +155,70 @@ class TelegramUser(BaseModel):
     last_name: Optional[str] = None
 
 
+class TelegramAccount(BaseModel):
+    telegram_id: str
+    user_id: Optional[int] = None
+
+
+class TelegramLinkRequest(BaseModel):
+    username: str
+
+
+class TelegramSessionRecord(TelegramUser):
+    last_activity: datetime
+
+
+class TelegramAnalysisRecord(BaseModel):
+    user_id: int
+    original_text: str
+    analysis_type: str
+    result: str
+    confidence_score: Optional[float] = None
+    prompt_tokens: int = 0
+    response_tokens: int = 0
+    latency_ms: Optional[int] = None
+
+
+class TelegramRecords(BaseModel):
+    """Пакет сессий и анализов бота, сохраняемый одной транзакцией"""
+    sessions: List[TelegramSessionRecord] = []
+    analyses: List[TelegramAnalysisRecord] = []
+
+
+class TelegramRecordsSaved(BaseModel):
+    sessions: int
+    analyses: int
+
+
+# Схемы для отчетов администратора
+class UsageTotals(BaseModel):
+    requests: int
+    prompt_tokens: int
+    response_tokens: int
+    avg_latency_ms: Optional[float] = None
+
+
+class DailyUsage(UsageTotals):
+    day: date
+
+
+class UserUsage(UsageTotals):
+    user_id: int
+    username: str
+
+
+class AnalysisTypeUsage(UsageTotals):
+    analysis_type: str
+
+
+class UsageReport(BaseModel):
+    since: date
+    total: UsageTotals
+    days: List[DailyUsage]
+    users: List[UserUsage]
+    analysis_types: List[AnalysisTypeUsage]
+
+
 # Общие схемы ответов
 class MessageResponse(BaseModel):
     message: str
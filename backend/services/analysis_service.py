@@ -0,0 +1,236 @@
+"""
+Сервис анализа контента: кэш результатов и объединение
+одинаковых запросов поверх Gemini AI
+"""
+
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Optional, Union
+
+from backend.config import settings
+from backend.services.cache import AnalysisCache, make_cache_key
+from backend.services.gemini_service import GeminiService, close_gemini_service, get_gemini_service
+from backend.services.local_analyzers import LOCAL_ANALYSIS_TYPES, LOCAL_ANALYZERS
+from backend.services.singleflight import SingleFlight
+from backend.services.usage import track_usage
+
+# Поддерживаемые типы анализа
+ANALYSIS_TYPES = ("sentiment", "summary", "keywords")
+
+# Комбинированный анализ: все типы одним запросом к модели
+COMBINED_ANALYSIS_TYPE = "all"
+
+# Движки анализа: модель Gemini или локальные анализаторы
+ENGINE_GEMINI = "gemini"
+ENGINE_LOCAL = "local"
+ANALYSIS_ENGINES = (ENGINE_GEMINI, ENGINE_LOCAL)
+
+
+@dataclass
+class AnalysisResult:
+    """Результат анализа текста"""
+    result: str
+    confidence: Optional[float]
+    from_cache: bool = False
+    engine: str = ENGINE_GEMINI
+    # Токены вызовов модели для этого результата (0 - без обращения к модели)
+    prompt_tokens: int = 0
+    response_tokens: int = 0
+
+
+class AnalysisService:
+    """Анализ текста с кэшированием результатов"""
+
+    def __init__(self, gemini_service: GeminiService, cache: Optional[AnalysisCache] = None):
+        self.gemini_service = gemini_service
+        self.cache = cache
+        self.singleflight = SingleFlight()
+        self.local_calls = 0
+
+    def select_engine(self, analysis_type: str, text: str, engine: Optional[str] = None) -> str:
+        """
+        Выбор движка анализа. Явно указанный движок проверяется, иначе
+        короткие тексты (до LOCAL_ANALYZER_MAX_CHARS) анализируются локально
+        """
+        if engine is not None:
+            if engine not in ANALYSIS_ENGINES:
+                raise ValueError(
+                    f"Неподдерживаемый движок анализа. Доступные: {', '.join(ANALYSIS_ENGINES)}"
+                )
+            if engine == ENGINE_LOCAL and analysis_type not in LOCAL_ANALYSIS_TYPES:
+                raise ValueError(
+                    f"Локальный анализ доступен только для: {', '.join(LOCAL_ANALYSIS_TYPES)}"
+                )
+            return engine
+
+        if analysis_type in LOCAL_ANALYSIS_TYPES and len(text) <= settings.LOCAL_ANALYZER_MAX_CHARS:
+            return ENGINE_LOCAL
+        return ENGINE_GEMINI
+
+    def _analyze_local(self, analysis_type: str, text: str) -> AnalysisResult:
+        # Локальный анализ дешевле обращения к кэшу, поэтому не кэшируется
+        self.local_calls += 1
+        result, confidence = LOCAL_ANALYZERS[analysis_type](text)
+        return AnalysisResult(result, confidence, engine=ENGINE_LOCAL)
+
+    async def analyze(
+        self, analysis_type: str, text: str, engine: Optional[str] = None
+    ) -> AnalysisResult:
+        """Выполнение анализа указанного типа"""
+        if analysis_type not in ANALYSIS_TYPES:
+            raise ValueError(f"Неподдерживаемый тип анализа: {analysis_type}")
+
+        if self.select_engine(analysis_type, text, engine) == ENGINE_LOCAL:
+            return self._analyze_local(analysis_type, text)
+
+        key = make_cache_key(analysis_type, GeminiService.PROMPT_VERSION, text)
+        if self.cache is not None:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                result, confidence = cached
+                return AnalysisResult(result, confidence, from_cache=True)
+
+        # Одинаковые одновременные запросы ждут один вызов модели;
+        # токены учитываются у запроса, который его выполнил
+        with track_usage() as usage:
+            result, confidence = await self.singleflight.do(
+                key, lambda: self._compute(key, analysis_type, text)
+            )
+        return AnalysisResult(
+            result, confidence,
+            prompt_tokens=usage.prompt_tokens, response_tokens=usage.response_tokens
+        )
+
+    async def _compute(self, key: str, analysis_type: str, text: str):
+        result, confidence = await self._call_model(analysis_type, text)
+
+        if self.cache is not None:
+            await self.cache.set(key, analysis_type, result, confidence)
+
+        return result, confidence
+
+    async def analyze_stream(
+        self, analysis_type: str, text: str, engine: Optional[str] = None
+    ) -> AsyncIterator[Union[str, AnalysisResult]]:
+        """
+        Потоковый анализ: фрагменты текста по мере генерации,
+        последним элементом - итоговый AnalysisResult
+        """
+        if analysis_type not in ANALYSIS_TYPES:
+            raise ValueError(f"Неподдерживаемый тип анализа: {analysis_type}")
+
+        if self.select_engine(analysis_type, text, engine) == ENGINE_LOCAL:
+            analysis_result = self._analyze_local(analysis_type, text)
+            yield analysis_result.result
+            yield analysis_result
+            return
+
+        key = make_cache_key(analysis_type, GeminiService.PROMPT_VERSION, text)
+        if self.cache is not None:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                result, confidence = cached
+                yield result
+                yield AnalysisResult(result, confidence, from_cache=True)
+                return
+
+        chunks = []
+        with track_usage() as usage:
+            async for chunk in self.gemini_service.stream_analysis(analysis_type, text):
+                chunks.append(chunk)
+                yield chunk
+
+        result = "".join(chunks).strip()
+        confidence = self.gemini_service.confidence_for(analysis_type, result)
+
+        if self.cache is not None:
+            await self.cache.set(key, analysis_type, result, confidence)
+
+        yield AnalysisResult(
+            result, confidence,
+            prompt_tokens=usage.prompt_tokens, response_tokens=usage.response_tokens
+        )
+
+    async def analyze_all(self, text: str) -> Dict[str, AnalysisResult]:
+        """Все типы анализа одним запросом к модели"""
+        keys = {
+            analysis_type: make_cache_key(analysis_type, GeminiService.PROMPT_VERSION, text)
+            for analysis_type in ANALYSIS_TYPES
+        }
+
+        if self.cache is not None:
+            cached = {}
+            for analysis_type, key in keys.items():
+                value = await self.cache.get(key)
+                if value is None:
+                    break
+                cached[analysis_type] = AnalysisResult(*value, from_cache=True)
+            else:
+                return cached
+
+        combined_key = make_cache_key(COMBINED_ANALYSIS_TYPE, GeminiService.PROMPT_VERSION, text)
+        with track_usage() as usage:
+            results = await self.singleflight.do(
+                combined_key, lambda: self._compute_all(keys, text)
+            )
+        # Расход общего запроса делится между типами анализа
+        shares = usage.split(len(results))
+        return {
+            analysis_type: AnalysisResult(
+                result, confidence,
+                prompt_tokens=share.prompt_tokens, response_tokens=share.response_tokens
+            )
+            for (analysis_type, (result, confidence)), share in zip(results.items(), shares)
+        }
+
+    async def _compute_all(self, keys: Dict[str, str], text: str):
+        results = await self.gemini_service.analyze_all(text)
+
+        # Заполняем кэш отдельных типов анализа
+        if self.cache is not None:
+            for analysis_type, (result, confidence) in results.items():
+                await self.cache.set(keys[analysis_type], analysis_type, result, confidence)
+
+        return results
+
+    async def _call_model(self, analysis_type: str, text: str):
+        if analysis_type == "sentiment":
+            return await self.gemini_service.analyze_sentiment(text)
+        if analysis_type == "summary":
+            return await self.gemini_service.create_summary(text)
+        return await self.gemini_service.extract_keywords(text)
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики сервиса анализа"""
+        return {
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "singleflight": self.singleflight.stats(),
+            "local_calls": self.local_calls,
+            "upstream": self.gemini_service.stats()
+        }
+
+
+# Единственный экземпляр сервиса на процесс
+_analysis_service: Optional[AnalysisService] = None
+
+
+def get_analysis_service() -> AnalysisService:
+    """Получение общего экземпляра AnalysisService"""
+    global _analysis_service
+
+    if _analysis_service is None:
+        cache = AnalysisCache() if settings.ANALYSIS_CACHE_ENABLED else None
+        _analysis_service = AnalysisService(get_gemini_service(), cache)
+    return _analysis_service
+
+
+def peek_analysis_service() -> Optional[AnalysisService]:
+    """Текущий экземпляр сервиса без создания нового"""
+    return _analysis_service
+
+
+async def close_analysis_service():
+    """Закрытие общего экземпляра AnalysisService"""
+    global _analysis_service
+
+    _analysis_service = None
+    await close_gemini_service()
@@ -0,0 +1,213 @@
+"""
+Кэширование результатов анализа
+"""
+
+import hashlib
+import logging
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from sqlalchemy import select
+
+from backend.config import settings
+from backend.database import SessionLocal
+from backend.models import AnalysisCacheEntry
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """
+    LRU кэш в памяти процесса с ограничением по времени жизни,
+    количеству записей и суммарному размеру значений
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = lambda value: 1
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._data: "OrderedDict[Hashable, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Получение значения (None если нет или истекло)"""
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+
+        expires_at, _, value = item
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        """Сохранение значения с вытеснением самых старых записей"""
+        if key in self._data:
+            self._remove(key)
+
+        size = self._sizeof(value)
+        self._data[key] = (time.monotonic() + self.ttl_seconds, size, value)
+        self._bytes += size
+
+        while self._data and (
+            len(self._data) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            oldest_key = next(iter(self._data))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def delete(self, key: Hashable):
+        """Удаление значения"""
+        if key in self._data:
+            self._remove(key)
+
+    def clear(self):
+        """Очистка кэша"""
+        self._data.clear()
+        self._bytes = 0
+
+    def _remove(self, key: Hashable):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики кэша"""
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+
+def normalize_text(text: str) -> str:
+    """Нормализация текста для ключа кэша"""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def make_cache_key(analysis_type: str, prompt_version: str, text: str) -> str:
+    """Ключ кэша: хеш типа анализа, версии промпта и нормализованного текста"""
+    raw = f"{analysis_type}\x00{prompt_version}\x00{normalize_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Двухуровневый кэш результатов анализа:
+    LRU в памяти и (опционально) таблица analysis_cache в БД
+    """
+
+    def __init__(self):
+        self.memory = TTLCache(
+            max_entries=settings.ANALYSIS_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.ANALYSIS_CACHE_TTL_SECONDS,
+            max_bytes=settings.ANALYSIS_CACHE_MAX_BYTES,
+            sizeof=lambda value: len(value[0].encode("utf-8"))
+        )
+        self.persistent = settings.ANALYSIS_CACHE_PERSISTENT
+        self.persistent_hits = 0
+        self.persistent_misses = 0
+
+    async def get(self, key: str) -> Optional[Tuple[str, Optional[float]]]:
+        """Поиск результата сначала в памяти, затем в БД"""
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+
+        if not self.persistent:
+            return None
+
+        try:
+            value = await self._load(key)
+        except Exception as e:
+            logger.warning(f"Ошибка чтения кэша анализа из БД: {e}")
+            return None
+
+        if value is None:
+            self.persistent_misses += 1
+            return None
+
+        self.persistent_hits += 1
+        self.memory.set(key, value)
+        return value
+
+    async def set(self, key: str, analysis_type: str, result: str, confidence: Optional[float]):
+        """Сохранение результата в оба уровня кэша"""
+        self.memory.set(key, (result, confidence))
+
+        if not self.persistent:
+            return
+
+        try:
+            await self._store(key, analysis_type, result, confidence)
+        except Exception as e:
+            logger.warning(f"Ошибка записи кэша анализа в БД: {e}")
+
+    async def _load(self, key: str) -> Optional[Tuple[str, Optional[float]]]:
+        async with SessionLocal() as db:
+            entry = await db.scalar(
+                select(AnalysisCacheEntry).where(AnalysisCacheEntry.cache_key == key)
+            )
+            if entry is None:
+                return None
+
+            created_at = entry.created_at
+            if created_at.tzinfo is None:
+                created_at = created_at.replace(tzinfo=timezone.utc)
+            max_age = timedelta(seconds=settings.ANALYSIS_CACHE_PERSISTENT_TTL_SECONDS)
+            if datetime.now(timezone.utc) - created_at > max_age:
+                await db.delete(entry)
+                await db.commit()
+                return None
+
+            return entry.result, entry.confidence
+
+    async def _store(self, key: str, analysis_type: str, result: str, confidence: Optional[float]):
+        async with SessionLocal() as db:
+            entry = await db.scalar(
+                select(AnalysisCacheEntry).where(AnalysisCacheEntry.cache_key == key)
+            )
+            if entry is None:
+                entry = AnalysisCacheEntry(cache_key=key, analysis_type=analysis_type)
+                db.add(entry)
+            entry.result = result
+            entry.confidence = confidence
+            entry.created_at = datetime.now(timezone.utc)
+            await db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики попаданий и промахов по уровням"""
+        return {
+            "memory": self.memory.stats(),
+            "persistent": {
+                "enabled": self.persistent,
+                "hits": self.persistent_hits,
+                "misses": self.persistent_misses
+            }
+        }
@@ -0,0 +1,163 @@
+"""
+Разбиение длинных текстов на фрагменты и объединение результатов
+анализа фрагментов (map-reduce)
+"""
+
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# Примерное число символов на токен (для кириллицы ~3)
+CHARS_PER_TOKEN = 3
+
+# Метки тональности и их числовые значения
+SENTIMENT_SCORES = {
+    "позитивная": 1.0,
+    "нейтральная": 0.0,
+    "негативная": -1.0,
+}
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+")
+_SENTIMENT_RE = re.compile(r"тональность\s*:\s*\[?\s*(позитивн|негативн|нейтральн)", re.IGNORECASE)
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов текста"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def split_text(text: str, max_tokens: int) -> List[str]:
+    """
+    Разбиение текста на фрагменты не больше max_tokens.
+    Границы выбираются по абзацам, затем по предложениям; предложение
+    длиннее бюджета режется по словам.
+    """
+    text = text.strip()
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    pieces: List[str] = []
+    for paragraph in _PARAGRAPH_RE.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in _SENTENCE_RE.split(paragraph):
+            if len(sentence) <= max_chars:
+                pieces.append(sentence)
+            else:
+                pieces.extend(_split_words(sentence, max_chars))
+
+    # Собираем соседние куски во фрагменты, заполняя бюджет
+    chunks: List[str] = []
+    current = ""
+    for piece in pieces:
+        candidate = f"{current}\n\n{piece}" if current else piece
+        if len(candidate) <= max_chars:
+            current = candidate
+        else:
+            chunks.append(current)
+            current = piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _split_words(text: str, max_chars: int) -> List[str]:
+    parts: List[str] = []
+    current = ""
+    for word in text.split():
+        # Слово длиннее бюджета режется как есть
+        while len(word) > max_chars:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(word[:max_chars])
+            word = word[max_chars:]
+        candidate = f"{current} {word}" if current else word
+        if len(candidate) <= max_chars:
+            current = candidate
+        else:
+            parts.append(current)
+            current = word
+    if current:
+        parts.append(current)
+    return parts
+
+
+def merge_keywords(results: List[str], limit: int = 10) -> str:
+    """
+    Объединение списков ключевых слов фрагментов: слова, встретившиеся
+    в большем числе фрагментов, идут первыми (при равенстве - в порядке появления)
+    """
+    counts: Counter = Counter()
+    titles: Dict[str, str] = {}
+    for result in results:
+        seen = set()
+        for keyword in re.split(r"[,;\n]", result):
+            keyword = keyword.strip(" \t-*•.\"'")
+            key = keyword.lower()
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            counts[key] += 1
+            titles.setdefault(key, keyword)
+
+    order = {key: index for index, key in enumerate(titles)}
+    top = sorted(counts, key=lambda key: (-counts[key], order[key]))[:limit]
+    return ", ".join(titles[key] for key in top)
+
+
+def parse_sentiment(result: str) -> Optional[str]:
+    """Метка тональности из ответа модели"""
+    match = _SENTIMENT_RE.search(result)
+    if not match:
+        return None
+    return match.group(1).lower() + "ая"
+
+
+def combine_sentiment(
+    results: List[Tuple[str, Optional[float]]], weights: List[float]
+) -> Tuple[str, Optional[float]]:
+    """
+    Итоговая тональность по фрагментам: среднее значений меток,
+    взвешенное по длине фрагмента и уверенности модели
+    """
+    total_weight = 0.0
+    score = 0.0
+    confidence_sum = 0.0
+    labels: Counter = Counter()
+
+    for (result, confidence), weight in zip(results, weights):
+        label = parse_sentiment(result)
+        if label is None:
+            continue
+        labels[label] += 1
+        confidence = confidence if confidence is not None else 0.5
+        score += SENTIMENT_SCORES[label] * weight * confidence
+        confidence_sum += confidence * weight
+        total_weight += weight
+
+    if not total_weight:
+        return "Тональность: нейтральная\nОбъяснение: не удалось определить тональность фрагментов", None
+
+    average = score / confidence_sum if confidence_sum else 0.0
+    if average > 1 / 3:
+        label = "позитивная"
+    elif average < -1 / 3:
+        label = "негативная"
+    else:
+        label = "нейтральная"
+    confidence = round(confidence_sum / total_weight, 2)
+
+    details = ", ".join(f"{name} - {count}" for name, count in labels.most_common())
+    result = (
+        f"Тональность: {label}\n"
+        f"Уверенность: {confidence}\n"
+        f"Объяснение: итог по {sum(labels.values())} фрагментам текста ({details})"
+    )
+    return result, confidence
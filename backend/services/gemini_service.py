@@ -2,28 +2,269 @@
 Сервис для работы с Gemini AI API
 """
 
+import asyncio
+import itertools
+import logging
+import re
+import time
+from contextlib import asynccontextmanager
 import google.generativeai as genai
-from typing import Tuple, Optional
+from google.ai import generativelanguage as glm
+from google.api_core import exceptions as google_exceptions
+from typing import Any, AsyncIterator, Dict, List, Tuple, Optional
 from backend.config import settings
+from backend.services.chunking import combine_sentiment, estimate_tokens, merge_keywords, split_text
+from backend.services.rate_limit import RateLimitExceeded, get_rate_limiter
+from backend.services.resilience import (
+    AIMDLimiter, CircuitBreaker, CircuitOpenError, backoff_delay, retry_with_backoff
+)
+from backend.services.usage import add_usage
+
+logger = logging.getLogger(__name__)
+
+# Заголовки разделов комбинированного ответа и соответствующие типы анализа
+COMBINED_SECTIONS = {
+    "ТОНАЛЬНОСТЬ": "sentiment",
+    "РЕЗЮМЕ": "summary",
+    "КЛЮЧЕВЫЕ СЛОВА": "keywords",
+}
+
+# Ошибки, после которых запрос к модели имеет смысл повторить:
+# перегрузка, лимиты, таймауты и внутренние ошибки сервиса
+TRANSIENT_ERRORS = (
+    asyncio.TimeoutError,
+    ConnectionError,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+)
+
+
+class GeminiError(Exception):
+    """Ошибка при обращении к Gemini"""
+
+
+class GeminiTransientError(GeminiError):
+    """Временная ошибка Gemini (перегрузка, таймаут): запрос можно повторить позже"""
+
+
+# Ошибки, которые методы анализа пропускают без обертки
+PASSTHROUGH_ERRORS = (GeminiError, CircuitOpenError, RateLimitExceeded)
+
+
+def to_gemini_error(error: Exception) -> Exception:
+    """Классификация исключения клиента Gemini"""
+    if isinstance(error, PASSTHROUGH_ERRORS):
+        return error
+    if isinstance(error, asyncio.TimeoutError):
+        return GeminiTransientError("Превышено время ожидания ответа Gemini")
+    if isinstance(error, TRANSIENT_ERRORS):
+        return GeminiTransientError(f"Gemini временно недоступен: {error}")
+    return GeminiError(f"Ошибка Gemini: {error}")
+
+
+def response_usage(response: Any, prompt: str, text: str) -> Tuple[int, int]:
+    """
+    Токены запроса и ответа из usage_metadata ответа модели.
+    Если клиент их не возвращает (google-generativeai < 0.5), - оценка по длине текста.
+    """
+    metadata = getattr(response, "usage_metadata", None)
+    if metadata is not None and getattr(metadata, "prompt_token_count", None):
+        return metadata.prompt_token_count, metadata.candidates_token_count or 0
+    return estimate_tokens(prompt), estimate_tokens(text)
 
 
 class GeminiService:
     """Сервис для анализа текста с помощью Gemini AI"""
     
+    # Версия промптов: меняется при изменении текста промптов,
+    # чтобы не отдавать из кэша результаты старых формулировок
+    PROMPT_VERSION = "1"
+    
     def __init__(self):
         """Инициализация сервиса"""
         if not settings.GEMINI_API_KEY:
             raise ValueError("GEMINI_API_KEY не установлен в переменных окружения")
         
         genai.configure(api_key=settings.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-pro')
+        
+        # Пул моделей: у каждой свой асинхронный клиент со своим
+        # keep-alive gRPC каналом, запросы распределяются по кругу
+        self._clients: List[glm.GenerativeServiceAsyncClient] = []
+        self._models: List[genai.GenerativeModel] = []
+        for _ in range(max(1, settings.GEMINI_POOL_SIZE)):
+            client = glm.GenerativeServiceAsyncClient(
+                client_options={"api_key": settings.GEMINI_API_KEY}
+            )
+            model = genai.GenerativeModel('gemini-pro')
+            model._async_client = client
+            self._clients.append(client)
+            self._models.append(model)
+        self._model_cycle = itertools.cycle(self._models)
+        self.model = self._models[0]
+        
+        # Число одновременных запросов к модели подстраивается под ее задержку и ошибки
+        self.limiter = AIMDLimiter(
+            initial_limit=settings.GEMINI_INITIAL_CONCURRENCY,
+            min_limit=settings.GEMINI_MIN_CONCURRENCY,
+            max_limit=settings.GEMINI_MAX_CONCURRENCY,
+            latency_target=settings.GEMINI_LATENCY_TARGET_SECONDS
+        )
+        # Пока Gemini недоступен, запросы отклоняются сразу
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.GEMINI_BREAKER_FAILURE_THRESHOLD,
+            recovery_timeout=settings.GEMINI_BREAKER_RECOVERY_SECONDS
+        )
+        self.retries = 0
     
-    async def analyze_sentiment(self, text: str) -> Tuple[str, Optional[float]]:
+    async def close(self):
+        """Закрытие соединений пула"""
+        for client in self._clients:
+            try:
+                await client.transport.close()
+            except Exception as e:
+                logger.warning(f"Ошибка при закрытии клиента Gemini: {e}")
+        self._clients.clear()
+    
+    @asynccontextmanager
+    async def _guarded(self, prompt: str):
         """
-        Анализ тональности текста
-        Возвращает: (результат_анализа, уверенность)
+        Обертка одного вызова модели: выключатель, бюджет запросов,
+        адаптивный лимит параллелизма и классификация ошибок
         """
-        prompt = f"""
+        self.breaker.before_call()
+        try:
+            await get_rate_limiter().check_model_budget(prompt)
+            async with self.limiter.slot():
+                start = time.monotonic()
+                try:
+                    yield
+                except Exception as e:
+                    if isinstance(e, TRANSIENT_ERRORS):
+                        self.limiter.on_overload()
+                    raise
+                self.limiter.on_success(time.monotonic() - start)
+        except (asyncio.CancelledError, GeneratorExit):
+            self.breaker.record_ignored()
+            raise
+        except Exception as e:
+            error = to_gemini_error(e)
+            if isinstance(error, GeminiTransientError):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_ignored()
+            if error is e:
+                raise
+            raise error from e
+        self.breaker.record_success()
+    
+    def _on_retry(self, error: BaseException):
+        self.retries += 1
+        logger.warning(f"Повтор запроса к Gemini после ошибки: {error}")
+    
+    async def _generate(self, prompt: str) -> str:
+        """
+        Асинхронный вызов модели с таймаутом и повторами временных ошибок.
+        Отмена вызывающей корутины прерывает и запрос к Gemini.
+        """
+        async def attempt():
+            async with self._guarded(prompt):
+                model = next(self._model_cycle)
+                response = await asyncio.wait_for(
+                    model.generate_content_async(prompt),
+                    timeout=settings.GEMINI_TIMEOUT_SECONDS
+                )
+            return response
+        
+        response = await retry_with_backoff(
+            attempt,
+            attempts=settings.GEMINI_RETRY_ATTEMPTS,
+            base_delay=settings.GEMINI_RETRY_BASE_DELAY,
+            max_delay=settings.GEMINI_RETRY_MAX_DELAY,
+            is_retryable=lambda e: isinstance(e, GeminiTransientError),
+            on_retry=self._on_retry
+        )
+        text = response.text.strip()
+        add_usage(*response_usage(response, prompt, text))
+        return text
+    
+    async def _generate_stream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Потоковый вызов модели: фрагменты текста по мере генерации.
+        Таймаут применяется к ожиданию каждого следующего фрагмента.
+        Повтор возможен, только пока клиенту не отдан ни один фрагмент.
+        """
+        for attempt in itertools.count():
+            started = False
+            try:
+                async with self._guarded(prompt):
+                    model = next(self._model_cycle)
+                    response = await asyncio.wait_for(
+                        model.generate_content_async(prompt, stream=True),
+                        timeout=settings.GEMINI_TIMEOUT_SECONDS
+                    )
+                    chunks = response.__aiter__()
+                    generated = []
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(
+                                chunks.__anext__(),
+                                timeout=settings.GEMINI_TIMEOUT_SECONDS
+                            )
+                        except StopAsyncIteration:
+                            break
+                        if chunk.text:
+                            started = True
+                            generated.append(chunk.text)
+                            yield chunk.text
+                add_usage(*response_usage(response, prompt, "".join(generated)))
+                return
+            except GeminiTransientError as e:
+                if started or attempt >= settings.GEMINI_RETRY_ATTEMPTS - 1:
+                    raise
+                self._on_retry(e)
+                await asyncio.sleep(backoff_delay(
+                    attempt, settings.GEMINI_RETRY_BASE_DELAY, settings.GEMINI_RETRY_MAX_DELAY
+                ))
+    
+    def stats(self) -> Dict[str, Any]:
+        """Состояние защиты вызовов модели"""
+        return {
+            "concurrency": self.limiter.stats(),
+            "breaker": self.breaker.stats(),
+            "retries": self.retries
+        }
+    
+    async def stream_analysis(self, analysis_type: str, text: str) -> AsyncIterator[str]:
+        """Потоковый анализ указанного типа"""
+        # Длинный текст анализируется по фрагментам, итог отдается одним куском
+        if len(self._chunks(text)) > 1:
+            methods = {
+                "sentiment": self.analyze_sentiment,
+                "summary": self.create_summary,
+                "keywords": self.extract_keywords,
+            }
+            result, _ = await methods[analysis_type](text)
+            yield result
+            return
+        
+        prompt = self.build_prompt(analysis_type, text)
+        
+        try:
+            async for chunk in self._generate_stream(prompt):
+                yield chunk
+        except PASSTHROUGH_ERRORS:
+            raise
+        except Exception as e:
+            raise GeminiError(f"Ошибка при потоковом анализе: {str(e)}")
+    
+    def _sentiment_prompt(self, text: str) -> str:
+        """Промпт анализа тональности"""
+        return f"""
         Проанализируй тональность следующего текста на русском языке.
         Определи эмоциональную окраску: позитивная, негативная или нейтральная.
         Также оцени уверенность в анализе от 0 до 1.
@@ -36,72 +277,227 @@ class GeminiService:
         Уверенность: [число от 0 до 1]
         Объяснение: [краткое объяснение почему такая тональность]
         """
+    
+    def _summary_prompt(self, text: str) -> str:
+        """Промпт краткого резюме"""
+        return f"""
+        Создай краткое резюме следующего текста на русском языке.
+        Выдели основные мысли и ключевые моменты в 2-3 предложениях.
+        
+        Текст для резюмирования:
+        "{text}"
+        
+        Ответь кратким резюме без дополнительных пояснений.
+        """
+    
+    def _keywords_prompt(self, text: str) -> str:
+        """Промпт извлечения ключевых слов"""
+        return f"""
+        Извлеки ключевые слова и основные темы из следующего текста на русском языке.
+        Выдели 5-10 наиболее важных слов и фраз, которые отражают суть текста.
+        
+        Текст для анализа:
+        "{text}"
+        
+        Ответь списком ключевых слов через запятую.
+        """
+    
+    def build_prompt(self, analysis_type: str, text: str) -> str:
+        """Промпт для указанного типа анализа"""
+        if analysis_type == "sentiment":
+            return self._sentiment_prompt(text)
+        if analysis_type == "summary":
+            return self._summary_prompt(text)
+        if analysis_type == "keywords":
+            return self._keywords_prompt(text)
+        raise ValueError(f"Неподдерживаемый тип анализа: {analysis_type}")
+    
+    def confidence_for(self, analysis_type: str, result: str) -> Optional[float]:
+        """Уверенность для результата указанного типа анализа"""
+        if analysis_type == "sentiment":
+            return self._extract_confidence(result)
+        if analysis_type == "summary":
+            return 0.9
+        return 0.8
+    
+    async def analyze_sentiment(self, text: str) -> Tuple[str, Optional[float]]:
+        """
+        Анализ тональности текста
+        Возвращает: (результат_анализа, уверенность)
+        """
+        chunks = self._chunks(text)
+        if len(chunks) > 1:
+            results = await self._map_chunks(chunks, self.analyze_sentiment)
+            return combine_sentiment(results, [len(chunk) for chunk in chunks])
+        
+        prompt = self._sentiment_prompt(text)
         
         try:
-            response = self.model.generate_content(prompt)
-            result = response.text.strip()
+            result = await self._generate(prompt)
             
             # Пытаемся извлечь уверенность из ответа
             confidence = self._extract_confidence(result)
             
             return result, confidence
             
+        except PASSTHROUGH_ERRORS:
+            raise
         except Exception as e:
-            raise Exception(f"Ошибка при анализе тональности: {str(e)}")
+            raise GeminiError(f"Ошибка при анализе тональности: {str(e)}")
     
-    async def create_summary(self, text: str) -> Tuple[str, Optional[float]]:
+    async def create_summary(self, text: str, depth: int = 0) -> Tuple[str, Optional[float]]:
         """
         Создание краткого резюме текста
+        depth - уровень объединения резюме фрагментов (не больше CHUNK_REDUCE_MAX_DEPTH)
         Возвращает: (резюме, уверенность)
         """
-        prompt = f"""
-        Создай краткое резюме следующего текста на русском языке.
-        Выдели основные мысли и ключевые моменты в 2-3 предложениях.
-        
-        Текст для резюмирования:
-        "{text}"
+        chunks = self._chunks(text)
+        if len(chunks) == 1:
+            return await self._summarize(chunks[0])
+        if depth >= settings.CHUNK_REDUCE_MAX_DEPTH:
+            # Уровни объединения исчерпаны: финальное резюме по началу текста
+            return await self._summarize(chunks[0])
         
-        Ответь кратким резюме без дополнительных пояснений.
-        """
+        # Резюме резюме: при необходимости объединение тоже делится на фрагменты
+        results = await self._map_chunks(chunks, self._summarize)
+        summaries = "\n\n".join(result for result, _ in results)
+        if len(summaries) >= len(text):
+            # Резюме фрагментов не короче текста - следующий уровень его не сократит
+            return await self._summarize(self._chunks(summaries)[0])
+        return await self.create_summary(summaries, depth + 1)
+    
+    async def _summarize(self, text: str) -> Tuple[str, Optional[float]]:
+        """Резюме текста, укладывающегося в один запрос"""
+        prompt = self._summary_prompt(text)
         
         try:
-            response = self.model.generate_content(prompt)
-            result = response.text.strip()
+            result = await self._generate(prompt)
             
             # Для резюме уверенность всегда высокая
             confidence = 0.9
             
             return result, confidence
             
+        except PASSTHROUGH_ERRORS:
+            raise
         except Exception as e:
-            raise Exception(f"Ошибка при создании резюме: {str(e)}")
+            raise GeminiError(f"Ошибка при создании резюме: {str(e)}")
     
     async def extract_keywords(self, text: str) -> Tuple[str, Optional[float]]:
         """
         Извлечение ключевых слов и тем из текста
         Возвращает: (ключевые_слова, уверенность)
         """
+        chunks = self._chunks(text)
+        if len(chunks) > 1:
+            results = await self._map_chunks(chunks, self.extract_keywords)
+            return merge_keywords([result for result, _ in results]), 0.8
+        
+        prompt = self._keywords_prompt(text)
+        
+        try:
+            result = await self._generate(prompt)
+            
+            # Для ключевых слов уверенность средняя
+            confidence = 0.8
+            
+            return result, confidence
+            
+        except PASSTHROUGH_ERRORS:
+            raise
+        except Exception as e:
+            raise GeminiError(f"Ошибка при извлечении ключевых слов: {str(e)}")
+    
+    async def analyze_all(self, text: str) -> Dict[str, Tuple[str, Optional[float]]]:
+        """
+        Тональность, резюме и ключевые слова за один запрос к модели
+        (для длинного текста - по запросу на фрагмент и один на объединение резюме)
+        Возвращает: {тип_анализа: (результат, уверенность)}
+        """
+        chunks = self._chunks(text)
+        if len(chunks) > 1:
+            results = await self._map_chunks(chunks, self.analyze_all)
+            summaries = "\n\n".join(result["summary"][0] for result in results)
+            return {
+                "sentiment": combine_sentiment(
+                    [result["sentiment"] for result in results],
+                    [len(chunk) for chunk in chunks]
+                ),
+                "summary": await self.create_summary(summaries, depth=1),
+                "keywords": (merge_keywords([result["keywords"][0] for result in results]), 0.8),
+            }
+        
         prompt = f"""
-        Извлеки ключевые слова и основные темы из следующего текста на русском языке.
-        Выдели 5-10 наиболее важных слов и фраз, которые отражают суть текста.
+        Проанализируй следующий текст на русском языке и выполни три задачи:
+        1. Определи тональность (позитивная, негативная или нейтральная) и уверенность от 0 до 1.
+        2. Создай краткое резюме из 2-3 предложений с основными мыслями.
+        3. Выдели 5-10 ключевых слов и фраз, которые отражают суть текста.
         
         Текст для анализа:
         "{text}"
         
-        Ответь списком ключевых слов через запятую.
+        Ответь строго в следующем формате, сохранив заголовки разделов в квадратных скобках:
+        [ТОНАЛЬНОСТЬ]
+        Тональность: [позитивная/негативная/нейтральная]
+        Уверенность: [число от 0 до 1]
+        Объяснение: [краткое объяснение почему такая тональность]
+        [РЕЗЮМЕ]
+        [краткое резюме без дополнительных пояснений]
+        [КЛЮЧЕВЫЕ СЛОВА]
+        [ключевые слова через запятую]
         """
         
         try:
-            response = self.model.generate_content(prompt)
-            result = response.text.strip()
+            response = await self._generate(prompt)
+            sections = self._split_sections(response)
             
-            # Для ключевых слов уверенность средняя
-            confidence = 0.8
-            
-            return result, confidence
+            return {
+                "sentiment": (sections["sentiment"], self._extract_confidence(sections["sentiment"])),
+                "summary": (sections["summary"], 0.9),
+                "keywords": (sections["keywords"], 0.8),
+            }
             
+        except PASSTHROUGH_ERRORS:
+            raise
         except Exception as e:
-            raise Exception(f"Ошибка при извлечении ключевых слов: {str(e)}")
+            raise GeminiError(f"Ошибка при комбинированном анализе: {str(e)}")
+    
+    def _chunks(self, text: str) -> List[str]:
+        """Фрагменты текста в пределах бюджета токенов одного запроса"""
+        return split_text(text, settings.CHUNK_MAX_TOKENS)
+    
+    async def _map_chunks(self, chunks: List[str], analyze) -> List[Any]:
+        """
+        Параллельный анализ фрагментов (не больше CHUNK_FANOUT одновременно).
+        Ошибка одного фрагмента отменяет остальные.
+        """
+        semaphore = asyncio.Semaphore(settings.CHUNK_FANOUT)
+        
+        async def run(chunk: str):
+            async with semaphore:
+                return await analyze(chunk)
+        
+        tasks = [asyncio.ensure_future(run(chunk)) for chunk in chunks]
+        try:
+            return await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    def _split_sections(self, text: str) -> Dict[str, str]:
+        """Разбор комбинированного ответа на разделы"""
+        titles = "|".join(re.escape(title) for title in COMBINED_SECTIONS)
+        parts = re.split(rf"^\s*\[({titles})\]\s*$", text, flags=re.MULTILINE | re.IGNORECASE)
+        
+        # parts: [текст до первого заголовка, заголовок, содержимое, заголовок, ...]
+        sections = {}
+        for title, content in zip(parts[1::2], parts[2::2]):
+            sections[COMBINED_SECTIONS[title.upper()]] = content.strip()
+        
+        missing = [name for name in COMBINED_SECTIONS.values() if not sections.get(name)]
+        if missing:
+            raise ValueError(f"В ответе модели нет разделов: {', '.join(missing)}")
+        return sections
     
     def _extract_confidence(self, text: str) -> Optional[float]:
         """Извлечение значения уверенности из текста ответа"""
@@ -110,7 +506,6 @@ class GeminiService:
             for line in lines:
                 if 'уверенность' in line.lower():
                     # Ищем число в строке
-                    import re
                     numbers = re.findall(r'0\.\d+|\d+\.\d+', line)
                     if numbers:
                         confidence = float(numbers[0])
@@ -118,3 +513,29 @@ class GeminiService:
             return None
         except:
             return None
+
+
+
+# Единственный экземпляр сервиса на процесс
+_gemini_service: Optional[GeminiService] = None
+
+
+def get_gemini_service() -> GeminiService:
+    """
+    Получение общего экземпляра GeminiService.
+    Создается один раз (в lifespan приложения или при старте бота).
+    """
+    global _gemini_service
+    
+    if _gemini_service is None:
+        _gemini_service = GeminiService()
+    return _gemini_service
+
+
+async def close_gemini_service():
+    """Закрытие общего экземпляра GeminiService"""
+    global _gemini_service
+    
+    if _gemini_service is not None:
+        await _gemini_service.close()
+        _gemini_service = None
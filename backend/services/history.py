@@ -0,0 +1,68 @@
+"""
+Запросы истории анализов: облегченные списки с превью
+"""
+
+from typing import List, Optional
+
+from sqlalchemy import func, select
+
+from backend.models import Analysis
+
+# Длина превью исходного текста и результата в списках (символы)
+TEXT_PREVIEW_LENGTH = 200
+RESULT_PREVIEW_LENGTH = 300
+
+
+def preview(column, length: int):
+    """Первые length символов текстовой колонки, обрезанные на стороне БД"""
+    return func.substr(column, 1, length)
+
+
+def is_truncated(column, length: int):
+    """
+    Признак обрезки превью. Длина считается по фрагменту length + 1,
+    чтобы не читать значение колонки целиком.
+    """
+    return func.length(func.substr(column, 1, length + 1)) > length
+
+
+def history_filters(
+    user_id: int,
+    analysis_type: Optional[str] = None,
+    min_confidence: Optional[float] = None,
+    max_latency_ms: Optional[int] = None
+) -> List:
+    """Условия выборки истории пользователя (общие для списка и подсчета)"""
+    conditions = [Analysis.user_id == user_id]
+    if analysis_type:
+        conditions.append(Analysis.analysis_type == analysis_type)
+    if min_confidence is not None:
+        conditions.append(Analysis.confidence_score >= min_confidence)
+    if max_latency_ms is not None:
+        conditions.append(Analysis.latency_ms <= max_latency_ms)
+    return conditions
+
+
+def select_analysis_previews(
+    user_id: int,
+    analysis_type: Optional[str] = None,
+    min_confidence: Optional[float] = None,
+    max_latency_ms: Optional[int] = None
+):
+    """
+    Запрос списка анализов пользователя без полных original_text и result:
+    из БД выбираются только колонки превью и метаданные
+    """
+    return select(
+        Analysis.id,
+        Analysis.analysis_type,
+        preview(Analysis.original_text, TEXT_PREVIEW_LENGTH).label("original_text"),
+        preview(Analysis.result, RESULT_PREVIEW_LENGTH).label("result"),
+        (
+            is_truncated(Analysis.original_text, TEXT_PREVIEW_LENGTH)
+            | is_truncated(Analysis.result, RESULT_PREVIEW_LENGTH)
+        ).label("truncated"),
+        Analysis.confidence_score,
+        Analysis.latency_ms,
+        Analysis.created_at
+    ).where(*history_filters(user_id, analysis_type, min_confidence, max_latency_ms))
@@ -0,0 +1,381 @@
+"""
+Очередь фоновых заданий анализа, хранящаяся в БД
+"""
+
+import asyncio
+import ipaddress
+import logging
+import random
+import socket
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+from sqlalchemy import and_, func, or_, select, update
+
+from backend.config import settings
+from backend.database import SessionLocal
+from backend.models import Analysis, AnalysisJob
+from backend.schemas import AnalysisJobResponse
+from backend.services.analysis_service import get_analysis_service
+from backend.services.rate_limit import RateLimitExceeded
+from backend.services.resilience import CircuitOpenError
+from backend.services.usage import record_usage
+
+logger = logging.getLogger(__name__)
+
+
+# Максимальная длина адреса callback (размер колонки analysis_jobs.callback_url)
+MAX_CALLBACK_URL_LENGTH = 500
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def is_public_address(address: str) -> bool:
+    """Адрес в интернете, а не localhost, внутренняя сеть, link-local (метаданные облака) и т.п."""
+    ip = ipaddress.ip_address(address)
+    return ip.is_global and not ip.is_multicast
+
+
+async def resolve_host(host: str, port: int) -> List[str]:
+    """IP адреса хоста"""
+    addresses = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return [info[4][0] for info in addresses]
+
+
+async def check_callback_url(url: str) -> Optional[str]:
+    """
+    Проверка адреса callback перед сохранением и перед отправкой.
+    Если задан JOB_CALLBACK_ALLOWED_HOSTS, разрешены только эти хосты,
+    иначе - любые хосты, все адреса которых публичные. ValueError - адрес запрещен.
+    Возвращает проверенный IP адрес для подключения (None для хостов из списка разрешенных).
+    """
+    if len(url) > MAX_CALLBACK_URL_LENGTH:
+        raise ValueError(f"Адрес callback длиннее {MAX_CALLBACK_URL_LENGTH} символов")
+
+    parsed = httpx.URL(url)
+    if parsed.scheme not in ("http", "https") or not parsed.host:
+        raise ValueError("Адрес callback должен быть http(s) URL")
+
+    if settings.JOB_CALLBACK_ALLOWED_HOSTS:
+        if parsed.host not in settings.JOB_CALLBACK_ALLOWED_HOSTS:
+            raise ValueError("Хост callback не входит в список разрешенных")
+        return None
+
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    try:
+        addresses = await resolve_host(parsed.host, port)
+    except socket.gaierror:
+        raise ValueError("Не удалось определить адрес хоста callback")
+
+    if not addresses or not all(is_public_address(address) for address in addresses):
+        raise ValueError("Callback на внутренние адреса запрещен")
+    return addresses[0]
+
+
+async def post_callback(
+    client: httpx.AsyncClient, url: str, body: Dict[str, Any]
+) -> httpx.Response:
+    """
+    Отправка callback. Соединение устанавливается с адресом, который прошел
+    проверку: иначе httpx разрешил бы имя повторно, и DNS мог бы к этому
+    моменту вернуть внутренний адрес (DNS rebinding). Host и SNI - исходные.
+    """
+    address = await check_callback_url(url)
+    target = httpx.URL(url)
+    headers: Dict[str, str] = {}
+    extensions: Dict[str, Any] = {}
+    if address is not None:
+        headers["Host"] = target.netloc.decode("ascii")
+        if target.scheme == "https":
+            extensions["sni_hostname"] = target.host
+        target = target.copy_with(host=address)
+    return await client.post(target, json=body, headers=headers, extensions=extensions)
+
+
+class JobQueue:
+    """
+    Пул воркеров, обрабатывающих задания из таблицы analysis_jobs.
+    Задание захватывается условным UPDATE с арендой (locked_until),
+    поэтому несколько процессов могут разбирать одну очередь.
+    """
+
+    def __init__(self):
+        self._workers: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._http: Optional[httpx.AsyncClient] = None
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+        self.deferred = 0
+
+    async def start(self):
+        """Запуск воркеров"""
+        if self._workers:
+            return
+        self._http = httpx.AsyncClient(timeout=settings.JOB_CALLBACK_TIMEOUT_SECONDS)
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"analysis-job-worker-{n}")
+            for n in range(settings.JOB_WORKERS)
+        ]
+        logger.info(f"Запущено воркеров очереди анализа: {len(self._workers)}")
+
+    async def stop(self):
+        """Остановка воркеров"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def notify(self):
+        """Разбудить воркеры после постановки нового задания"""
+        self._wakeup.set()
+
+    async def _worker(self):
+        while True:
+            try:
+                job_id = await self._claim()
+            except Exception as e:
+                logger.error(f"Ошибка при захвате задания: {e}")
+                job_id = None
+
+            if job_id is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(
+                        self._wakeup.wait(), timeout=settings.JOB_POLL_INTERVAL_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._process(job_id)
+            except Exception as e:
+                # Задание с истекшей арендой снова захватит воркер (этот или другой)
+                logger.error(f"Ошибка при обработке задания {job_id}: {e}")
+
+    async def _claim(self) -> Optional[int]:
+        """Захват следующего готового задания с учетом лимита на пользователя"""
+        async with SessionLocal() as db:
+            now = utcnow()
+
+            # Пользователи, у которых уже достигнут лимит одновременных заданий
+            busy_users = select(AnalysisJob.user_id).where(
+                AnalysisJob.status == "running",
+                AnalysisJob.locked_until > now
+            ).group_by(AnalysisJob.user_id).having(
+                func.count(AnalysisJob.id) >= settings.JOB_MAX_PER_USER
+            )
+
+            ready = or_(
+                and_(AnalysisJob.status == "queued", AnalysisJob.next_run_at <= now),
+                # Аренда истекла: воркер, взявший задание, завершился аварийно
+                and_(AnalysisJob.status == "running", AnalysisJob.locked_until <= now)
+            )
+
+            candidates = await db.scalars(
+                select(AnalysisJob.id).where(
+                    ready,
+                    AnalysisJob.user_id.notin_(busy_users)
+                ).order_by(AnalysisJob.id).limit(10)
+            )
+
+            for job_id in candidates.all():
+                claimed = await db.execute(
+                    update(AnalysisJob).where(AnalysisJob.id == job_id, ready).values(
+                        status="running",
+                        locked_until=now + timedelta(seconds=settings.JOB_LEASE_SECONDS),
+                        attempts=AnalysisJob.attempts + 1
+                    )
+                )
+                await db.commit()
+                if claimed.rowcount == 1:
+                    return job_id
+            return None
+
+    async def _process(self, job_id: int):
+        job = await self._load(job_id)
+        if job is None:
+            return
+        # Номер попытки, с которой задание захвачено: если аренда истекла и задание
+        # захватил другой воркер, результат этой попытки не записывается
+        attempt = job["attempts"]
+
+        start_time = time.time()
+        lease = asyncio.create_task(self._keep_lease(job_id, attempt))
+        try:
+            analysis_result = await get_analysis_service().analyze(
+                job["analysis_type"], job["original_text"]
+            )
+        except (RateLimitExceeded, CircuitOpenError) as e:
+            # Бюджет модели исчерпан или Gemini недоступен - откладываем задание, не расходуя попытку
+            await self._defer(job_id, attempt, e.retry_after)
+            return
+        except Exception as e:
+            logger.warning(f"Задание {job_id} завершилось с ошибкой: {e}")
+            final = await self._fail(job_id, attempt, str(e))
+            if final:
+                await self._send_callback(job_id)
+            return
+        finally:
+            lease.cancel()
+
+        if await self._complete(job_id, attempt, analysis_result, time.time() - start_time):
+            await self._send_callback(job_id)
+
+    async def _keep_lease(self, job_id: int, attempt: int):
+        """Продление аренды, пока анализ выполняется (длинные тексты анализируются долго)"""
+        while True:
+            await asyncio.sleep(settings.JOB_LEASE_SECONDS / 3)
+            try:
+                async with SessionLocal() as db:
+                    extended = await db.execute(
+                        update(AnalysisJob).where(
+                            AnalysisJob.id == job_id,
+                            AnalysisJob.status == "running",
+                            AnalysisJob.attempts == attempt
+                        ).values(locked_until=utcnow() + timedelta(seconds=settings.JOB_LEASE_SECONDS))
+                    )
+                    await db.commit()
+                if extended.rowcount != 1:
+                    logger.warning(f"Аренда задания {job_id} потеряна")
+                    return
+            except Exception as e:
+                logger.warning(f"Не удалось продлить аренду задания {job_id}: {e}")
+
+    async def _owned_job(self, db, job_id: int, attempt: int) -> Optional[AnalysisJob]:
+        """Задание, если оно все еще выполняется этой попыткой"""
+        job = await db.get(AnalysisJob, job_id)
+        if job is None or job.status != "running" or job.attempts != attempt:
+            logger.warning(f"Задание {job_id} перехвачено другим воркером, результат попытки {attempt} отброшен")
+            return None
+        return job
+
+    async def _load(self, job_id: int) -> Optional[Dict[str, Any]]:
+        async with SessionLocal() as db:
+            job = await db.get(AnalysisJob, job_id)
+            if job is None:
+                return None
+            return {
+                "analysis_type": job.analysis_type,
+                "original_text": job.original_text,
+                "attempts": job.attempts
+            }
+
+    async def _complete(self, job_id: int, attempt: int, analysis_result, elapsed: float) -> bool:
+        async with SessionLocal() as db:
+            job = await self._owned_job(db, job_id, attempt)
+            if job is None:
+                return False
+            analysis = Analysis(
+                user_id=job.user_id,
+                original_text=job.original_text,
+                analysis_type=job.analysis_type,
+                result=analysis_result.result,
+                confidence_score=analysis_result.confidence,
+                prompt_tokens=analysis_result.prompt_tokens,
+                response_tokens=analysis_result.response_tokens,
+                latency_ms=round(elapsed * 1000)
+            )
+            db.add(analysis)
+            await record_usage(db, [analysis])
+            await db.flush()
+
+            job.status = "succeeded"
+            job.analysis_id = analysis.id
+            job.locked_until = None
+            job.error = None
+            await db.commit()
+            self.succeeded += 1
+            return True
+
+    async def _fail(self, job_id: int, attempts: int, error: str) -> bool:
+        """Повтор с экспоненциальной задержкой или окончательная ошибка"""
+        async with SessionLocal() as db:
+            job = await self._owned_job(db, job_id, attempts)
+            if job is None:
+                return False
+            job.error = error
+            job.locked_until = None
+
+            if attempts >= settings.JOB_MAX_ATTEMPTS:
+                job.status = "failed"
+                await db.commit()
+                self.failed += 1
+                return True
+
+            delay = settings.JOB_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1)
+            delay += random.uniform(0, delay / 2)
+            job.status = "queued"
+            job.next_run_at = utcnow() + timedelta(seconds=delay)
+            await db.commit()
+            self.retried += 1
+            return False
+
+    async def _defer(self, job_id: int, attempt: int, delay: float):
+        """Возврат задания в очередь через delay секунд без учета попытки"""
+        async with SessionLocal() as db:
+            job = await self._owned_job(db, job_id, attempt)
+            if job is None:
+                return
+            job.status = "queued"
+            job.attempts = max(job.attempts - 1, 0)
+            job.locked_until = None
+            job.next_run_at = utcnow() + timedelta(seconds=delay)
+            await db.commit()
+            self.deferred += 1
+
+    async def _send_callback(self, job_id: int):
+        """Уведомление клиента о завершении задания"""
+        payload = await self._callback_payload(job_id)
+        if payload is None or self._http is None:
+            return
+
+        url, body = payload
+        try:
+            # Адрес проверяется повторно: DNS хоста мог измениться после постановки задания
+            response = await post_callback(self._http, url, body)
+            response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"Не удалось отправить callback для задания {job_id}: {e}")
+
+    async def _callback_payload(self, job_id: int):
+        async with SessionLocal() as db:
+            job = await db.get(AnalysisJob, job_id)
+            if job is None or not job.callback_url:
+                return None
+            body = AnalysisJobResponse.model_validate(job).model_dump(mode="json")
+            return job.callback_url, body
+
+    async def _depth(self) -> Dict[str, int]:
+        async with SessionLocal() as db:
+            rows = await db.execute(
+                select(AnalysisJob.status, func.count(AnalysisJob.id)).where(
+                    AnalysisJob.status.in_(["queued", "running"])
+                ).group_by(AnalysisJob.status)
+            )
+            return dict(rows.all())
+
+    async def stats(self) -> Dict[str, Any]:
+        """Глубина очереди и счетчики обработанных заданий"""
+        depth = await self._depth()
+        return {
+            "workers": len(self._workers),
+            "queued": depth.get("queued", 0),
+            "running": depth.get("running", 0),
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retried": self.retried,
+            "deferred": self.deferred
+        }
+
+
+# Общая очередь заданий процесса
+job_queue = JobQueue()
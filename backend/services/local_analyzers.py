@@ -0,0 +1,143 @@
+"""
+Локальные анализаторы без обращения к модели: ключевые слова (RAKE)
+и тональность по словарю. Используются для коротких текстов, где
+запрос к Gemini избыточен.
+"""
+
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+# Анализы, для которых есть локальная реализация
+LOCAL_ANALYSIS_TYPES = ("sentiment", "keywords")
+
+RUSSIAN_STOPWORDS = frozenset("""
+а без более бы был была были было быть в вам вас весь во вот все всего всех вы где да даже
+для до его ее её если есть еще ещё же за здесь и из или им их к как какая какой когда кто
+ли либо лишь мне мной мог может можно мой мы на над надо наш не него нее неё нет ни них но
+ну о об однако он она они оно от очень по под после потом при про раз с сам свой себе себя
+со так также такой там те тем то того тоже той только том ты у уже хотя чего чей чем что
+чтобы чье чья эта эти это этот я будет будут был всё всем этим этой этого того между через
+перед около вы вам нам нас им ими мне тебе тебя его ему ей нею ним ними сейчас тут вообще
+просто ведь вдруг зачем почему потому поэтому чтоб какие каких который которая которые
+которое которых которым также кроме среди а-то где-то кто-то что-то как-то
+""".split())
+
+# Основы слов тональной лексики (сравнение по началу слова)
+POSITIVE_STEMS = (
+    "хорош", "отличн", "прекрасн", "замечательн", "великолепн", "восхит", "любл", "любим",
+    "нрав", "понрав", "радост", "радуе", "радую", "счаст", "успех", "успешн", "удобн",
+    "полезн", "интересн", "спасиб", "благодар", "лучш", "доволен", "довольн", "классн",
+    "супер", "круто", "крутой", "удач", "приятн", "рекоменд", "надежн", "выгодн", "побед",
+    "восторг", "чудесн", "идеальн",
+)
+NEGATIVE_STEMS = (
+    "плох", "ужас", "отврат", "ненави", "груст", "печал", "проблем", "ошибк", "слома",
+    "хуж", "разочар", "недовол", "злит", "злой", "злост", "бесит", "провал", "катастроф",
+    "кошмар", "неудобн", "скучн", "медленн", "сбой", "сбои", "сбоя", "обман", "жаль",
+    "страшн", "болит", "поломк", "отказ", "жалоб", "неприятн", "бесполезн", "дефект",
+)
+NEGATIONS = frozenset(("не", "ни", "нет", "без"))
+
+_WORD_RE = re.compile(r"[а-яёa-z0-9]+(?:-[а-яёa-z0-9]+)*", re.IGNORECASE)
+_PHRASE_SPLIT_RE = re.compile(r"[.,!?;:()\[\]{}\"«»—–\n]+")
+
+
+def _words(text: str) -> List[str]:
+    return [word.lower() for word in _WORD_RE.findall(text)]
+
+
+def extract_keywords_local(text: str, limit: int = 10) -> Tuple[str, Optional[float]]:
+    """
+    Ключевые фразы по алгоритму RAKE: фраза - последовательность слов
+    между стоп-словами и знаками препинания, вес слова - степень/частота
+    """
+    phrases: List[Tuple[str, ...]] = []
+    for fragment in _PHRASE_SPLIT_RE.split(text):
+        phrase: List[str] = []
+        for word in _words(fragment):
+            if word in RUSSIAN_STOPWORDS or len(word) < 3 or word.isdigit():
+                if phrase:
+                    phrases.append(tuple(phrase))
+                phrase = []
+            else:
+                phrase.append(word)
+        if phrase:
+            phrases.append(tuple(phrase))
+
+    frequency: Dict[str, int] = defaultdict(int)
+    degree: Dict[str, int] = defaultdict(int)
+    for phrase in phrases:
+        # Слишком длинные "фразы" - это обычно перечисления без стоп-слов
+        phrase = phrase[:3]
+        for word in phrase:
+            frequency[word] += 1
+            degree[word] += len(phrase)
+
+    scores: Dict[Tuple[str, ...], float] = {}
+    for phrase in phrases:
+        phrase = phrase[:3]
+        scores[phrase] = sum(degree[word] / frequency[word] for word in phrase)
+
+    ranked = sorted(scores, key=lambda phrase: -scores[phrase])
+    keywords: List[str] = []
+    seen = set()
+    for phrase in ranked:
+        keyword = " ".join(phrase)
+        if keyword not in seen:
+            seen.add(keyword)
+            keywords.append(keyword)
+        if len(keywords) >= limit:
+            break
+
+    return ", ".join(keywords), 0.6 if keywords else None
+
+
+def _polarity(word: str) -> int:
+    if word.startswith(NEGATIVE_STEMS):
+        return -1
+    if word.startswith(POSITIVE_STEMS):
+        return 1
+    return 0
+
+
+def analyze_sentiment_local(text: str) -> Tuple[str, Optional[float]]:
+    """Тональность по словарю оценочной лексики с учетом отрицаний ("не нравится")"""
+    positive = negative = 0
+    previous = ""
+    for word in _words(text):
+        polarity = _polarity(word)
+        if polarity and previous in NEGATIONS:
+            polarity = -polarity
+        if polarity > 0:
+            positive += 1
+        elif polarity < 0:
+            negative += 1
+        previous = word
+
+    hits = positive + negative
+    if not hits:
+        label, confidence = "нейтральная", 0.5
+    else:
+        balance = (positive - negative) / hits
+        if balance > 0.2:
+            label = "позитивная"
+        elif balance < -0.2:
+            label = "негативная"
+        else:
+            label = "нейтральная"
+        # Чем больше оценочных слов и перевес одной стороны, тем выше уверенность
+        confidence = round(min(0.95, 0.5 + 0.1 * hits * abs(balance)), 2)
+
+    result = (
+        f"Тональность: {label}\n"
+        f"Уверенность: {confidence}\n"
+        f"Объяснение: локальная оценка по словарю (позитивных слов: {positive}, негативных: {negative})"
+    )
+    return result, confidence
+
+
+LOCAL_ANALYZERS = {
+    "sentiment": analyze_sentiment_local,
+    "keywords": extract_keywords_local,
+}
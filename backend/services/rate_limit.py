@@ -0,0 +1,280 @@
+"""
+Ограничение частоты запросов (token bucket)
+"""
+
+import ipaddress
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, Optional, Tuple
+
+from fastapi import Request
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from backend.config import settings
+from backend.database import SessionLocal
+from backend.models import RateLimitBucket
+from backend.services.chunking import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitExceeded(Exception):
+    """Превышен лимит запросов; retry_after - через сколько секунд повторить"""
+
+    def __init__(self, retry_after: float, scope: str):
+        self.retry_after = retry_after
+        self.scope = scope
+        super().__init__(f"Превышен лимит запросов ({scope}), повторите через {retry_after:.0f} с")
+
+
+@dataclass(frozen=True)
+class Limit:
+    """Параметры корзины: запас токенов и скорость пополнения"""
+    capacity: float
+    refill_per_second: float
+
+    @classmethod
+    def per_minute(cls, rate: float, burst: float) -> "Limit":
+        return cls(capacity=burst, refill_per_second=rate / 60)
+
+
+def take_tokens(
+    tokens: float, updated_at: float, now: float, limit: Limit, cost: float
+) -> Tuple[float, float]:
+    """
+    Пополнение корзины на момент now и попытка забрать cost токенов.
+    Возвращает (новый остаток, через сколько секунд повторить; 0 - разрешено).
+    Отрицательный cost возвращает токены в корзину.
+    """
+    elapsed = max(0.0, now - updated_at)
+    tokens = min(limit.capacity, tokens + elapsed * limit.refill_per_second)
+    # Запрос дороже всей корзины забирает ее целиком, иначе он не прошел бы никогда
+    cost = min(cost, limit.capacity)
+
+    if tokens >= cost:
+        return min(limit.capacity, tokens - cost), 0.0
+    return tokens, max((cost - tokens) / limit.refill_per_second, 0.001)
+
+
+def is_trusted_proxy(address: str) -> bool:
+    """Адрес входит в TRUSTED_PROXIES (адреса или подсети обратных прокси)"""
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(
+        ip in ipaddress.ip_network(proxy, strict=False) for proxy in settings.TRUSTED_PROXIES
+    )
+
+
+def client_ip(request: Request) -> str:
+    """
+    Адрес клиента. Если запрос пришел от доверенного прокси, адрес берется
+    из X-Forwarded-For: справа налево до первого адреса, не являющегося прокси.
+    Заголовок от остальных клиентов игнорируется, иначе его можно подделать.
+    """
+    address = request.client.host if request.client else "unknown"
+    if not is_trusted_proxy(address):
+        return address
+
+    forwarded = request.headers.get("x-forwarded-for", "")
+    for hop in reversed([item.strip() for item in forwarded.split(",") if item.strip()]):
+        address = hop
+        if not is_trusted_proxy(hop):
+            break
+    return address
+
+
+class TokenBucketLimiter:
+    """
+    Набор корзин токенов в памяти процесса, по одной на ключ.
+    Корзина вмещает capacity токенов и пополняется со скоростью
+    refill_per_second; каждый запрос забирает один токен.
+    Потокобезопасен: корзину можно брать и из пула потоков.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float, max_keys: int = 100000):
+        self.limit = Limit(capacity, refill_per_second)
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Hashable, Tuple[float, float]]" = OrderedDict()
+        # pop и повторная вставка корзины должны быть атомарны, иначе два
+        # одновременных запроса заберут токен из одного и того же остатка
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+
+    def acquire(self, key: Hashable, cost: float = 1.0, limit: Optional[Limit] = None) -> float:
+        """
+        Попытка забрать cost токенов из корзины key.
+        Возвращает 0, если запрос разрешен, иначе - через сколько секунд повторить.
+        """
+        limit = limit or self.limit
+        with self._lock:
+            now = time.monotonic()
+            tokens, updated_at = self._buckets.pop(key, (limit.capacity, now))
+            tokens, retry_after = take_tokens(tokens, updated_at, now, limit, cost)
+
+            if retry_after:
+                self.rejected += 1
+            elif cost > 0:
+                self.allowed += 1
+
+            self._buckets[key] = (tokens, now)
+            # Вытесняем давно не использованные корзины (они все равно полные)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики разрешенных и отклоненных запросов"""
+        return {
+            "keys": len(self._buckets),
+            "allowed": self.allowed,
+            "rejected": self.rejected
+        }
+
+
+class MemoryRateLimitBackend:
+    """Корзины в памяти процесса: для одного воркера"""
+
+    def __init__(self):
+        self._limiter = TokenBucketLimiter(capacity=1, refill_per_second=1)
+
+    async def acquire(self, key: str, limit: Limit, cost: float) -> float:
+        return self._limiter.acquire(key, cost, limit)
+
+
+class SQLRateLimitBackend:
+    """
+    Корзины в таблице rate_limit_buckets: общие для всех воркеров.
+    Обновление корзины - условный UPDATE по updated_at (оптимистичная блокировка).
+    """
+
+    # Сколько раз повторяем обновление при одновременном доступе к корзине
+    MAX_ATTEMPTS = 5
+
+    async def acquire(self, key: str, limit: Limit, cost: float) -> float:
+        for _ in range(self.MAX_ATTEMPTS):
+            async with SessionLocal() as db:
+                now = time.time()
+                bucket = await db.get(RateLimitBucket, key)
+
+                if bucket is None:
+                    tokens, retry_after = take_tokens(limit.capacity, now, now, limit, cost)
+                    db.add(RateLimitBucket(key=key, tokens=tokens, updated_at=now))
+                    try:
+                        await db.commit()
+                    except IntegrityError:
+                        # Корзину одновременно создал другой воркер
+                        continue
+                    return retry_after
+
+                tokens, retry_after = take_tokens(bucket.tokens, bucket.updated_at, now, limit, cost)
+                result = await db.execute(
+                    update(RateLimitBucket).where(
+                        RateLimitBucket.key == key,
+                        RateLimitBucket.updated_at == bucket.updated_at
+                    ).values(tokens=tokens, updated_at=max(now, bucket.updated_at))
+                )
+                await db.commit()
+                if result.rowcount == 1:
+                    return retry_after
+
+        logger.warning(f"Не удалось обновить корзину лимита {key}: высокая конкуренция")
+        return 1 / limit.refill_per_second
+
+
+# Запас на ответ модели при оценке расхода токенов запроса
+RESPONSE_TOKENS_ESTIMATE = 256
+
+
+class RateLimiter:
+    """
+    Квоты запросов: на пользователя, на Telegram чат, общая на сервис
+    и бюджет вызовов модели (запросы и токены в минуту)
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        headroom = settings.GEMINI_BUDGET_HEADROOM
+        self.user_limit = Limit.per_minute(
+            settings.RATE_LIMIT_USER_PER_MINUTE, settings.RATE_LIMIT_USER_BURST
+        )
+        self.telegram_limit = Limit.per_minute(
+            settings.RATE_LIMIT_TELEGRAM_PER_MINUTE, settings.RATE_LIMIT_TELEGRAM_BURST
+        )
+        self.global_limit = Limit.per_minute(
+            settings.RATE_LIMIT_GLOBAL_PER_MINUTE, settings.RATE_LIMIT_GLOBAL_BURST
+        )
+        # Бюджет модели держим чуть ниже лимитов Gemini; запас - минутный объем
+        rpm = settings.GEMINI_RPM_LIMIT * headroom
+        tpm = settings.GEMINI_TPM_LIMIT * headroom
+        self.model_requests_limit = Limit.per_minute(rpm, rpm)
+        self.model_tokens_limit = Limit.per_minute(tpm, tpm)
+        self.rejected: Dict[str, int] = {}
+
+    async def check(self, *buckets: Tuple[str, str, Limit, float]):
+        """
+        Списание из нескольких корзин (scope, key, limit, cost).
+        Если одна из корзин пуста, уже списанное возвращается и
+        выбрасывается RateLimitExceeded.
+        """
+        taken = []
+        for scope, key, limit, cost in buckets:
+            retry_after = await self.backend.acquire(key, limit, cost)
+            if retry_after:
+                for _, taken_key, taken_limit, taken_cost in taken:
+                    await self.backend.acquire(taken_key, taken_limit, -taken_cost)
+                self.rejected[scope] = self.rejected.get(scope, 0) + 1
+                raise RateLimitExceeded(retry_after, scope)
+            taken.append((scope, key, limit, cost))
+
+    async def check_user(self, user_id: int, cost: float = 1):
+        """Лимит запросов анализа пользователя веб-API"""
+        await self.check(
+            ("user", f"user:{user_id}", self.user_limit, cost),
+            ("global", "global", self.global_limit, cost)
+        )
+
+    async def check_telegram(self, telegram_id: str, cost: float = 1):
+        """Лимит запросов анализа из Telegram чата"""
+        await self.check(
+            ("telegram", f"telegram:{telegram_id}", self.telegram_limit, cost),
+            ("global", "global", self.global_limit, cost)
+        )
+
+    async def check_model_budget(self, prompt: str):
+        """Бюджет вызовов модели: запросы и токены в минуту"""
+        await self.check(
+            ("model_rpm", "model:requests", self.model_requests_limit, 1),
+            (
+                "model_tpm", "model:tokens", self.model_tokens_limit,
+                estimate_tokens(prompt) + RESPONSE_TOKENS_ESTIMATE
+            )
+        )
+
+    def stats(self) -> Dict[str, int]:
+        """Число отклоненных запросов по видам лимитов"""
+        return dict(self.rejected)
+
+
+# Единственный экземпляр на процесс
+_rate_limiter: Optional[RateLimiter] = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Получение общего экземпляра RateLimiter с настроенным хранилищем"""
+    global _rate_limiter
+
+    if _rate_limiter is None:
+        if settings.RATE_LIMIT_BACKEND == "sql":
+            backend = SQLRateLimitBackend()
+        else:
+            backend = MemoryRateLimitBackend()
+        _rate_limiter = RateLimiter(backend)
+    return _rate_limiter
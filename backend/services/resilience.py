@@ -0,0 +1,165 @@
+"""
+Устойчивость вызовов внешнего сервиса: адаптивный лимит параллелизма,
+автоматический выключатель (circuit breaker) и повторы с задержкой
+"""
+
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class AIMDLimiter:
+    """
+    Адаптивный лимит одновременных вызовов (AIMD).
+    Успешный быстрый вызов увеличивает лимит на 1/limit (примерно +1 за
+    "окно" из limit вызовов), перегрузка (ошибка или задержка выше
+    целевой) уменьшает его в backoff_ratio раз.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        latency_target: float,
+        backoff_ratio: float = 0.5
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff_ratio = backoff_ratio
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Занять слот на время вызова; результат фиксируется через on_success/on_overload"""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def on_success(self, latency: float):
+        if latency > self.latency_target:
+            self.on_overload()
+            return
+        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def on_overload(self):
+        self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit
+        }
+
+
+class CircuitOpenError(Exception):
+    """Выключатель разомкнут: вызовы отклоняются без обращения к сервису"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"вызовы отключены после серии ошибок, повторите через {retry_after:.0f} с")
+
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель.
+    closed - вызовы проходят; после failure_threshold ошибок подряд -> open.
+    open - вызовы сразу отклоняются; через recovery_timeout -> half_open.
+    half_open - пропускается один пробный вызов: успех -> closed, ошибка -> open.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, recovery_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.rejected = 0
+        self.times_opened = 0
+        self._probe_in_flight = False
+
+    def before_call(self):
+        """Проверка перед вызовом; CircuitOpenError, если вызов не разрешен"""
+        if self.state == self.OPEN:
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed < self.recovery_timeout:
+                self.rejected += 1
+                raise CircuitOpenError(self.recovery_timeout - elapsed)
+            self.state = self.HALF_OPEN
+
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError(self.recovery_timeout)
+            self._probe_in_flight = True
+
+    def record_success(self):
+        self._probe_in_flight = False
+        self.failures = 0
+        self.state = self.CLOSED
+
+    def record_failure(self):
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self._open()
+
+    def record_ignored(self):
+        """Вызов завершился ошибкой, не связанной с состоянием сервиса"""
+        self._probe_in_flight = False
+
+    def _open(self):
+        if self.state != self.OPEN:
+            self.times_opened += 1
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected
+        }
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """Задержка перед повтором: экспоненциальная с полным джиттером"""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+async def retry_with_backoff(
+    func: Callable[[], Awaitable[Any]],
+    attempts: int,
+    base_delay: float,
+    max_delay: float,
+    is_retryable: Callable[[BaseException], bool],
+    on_retry: Optional[Callable[[BaseException], None]] = None
+) -> Any:
+    """Вызов func с повторами только для ошибок, признанных временными"""
+    for attempt in range(attempts):
+        try:
+            return await func()
+        except Exception as e:
+            if attempt == attempts - 1 or not is_retryable(e):
+                raise
+            if on_retry is not None:
+                on_retry(e)
+            await asyncio.sleep(backoff_delay(attempt, base_delay, max_delay))
@@ -0,0 +1,61 @@
+"""
+Объединение одинаковых одновременных запросов (single-flight)
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Call:
+    """Выполняющийся вызов и число ожидающих его запросов"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Одновременные запросы с одинаковым ключом ждут один общий вызов
+    и получают его результат (или исключение)
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self.executed = 0
+        self.collapsed = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполнение func один раз для всех одновременных запросов с ключом key"""
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(func()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.executed += 1
+        else:
+            self.collapsed += 1
+
+        call.waiters += 1
+        try:
+            # shield: отмена одного ожидающего не отменяет общий вызов
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            # Последний ожидающий ушел - результат больше никому не нужен
+            if call.waiters == 1 and not call.task.done():
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, key: Hashable, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики выполненных и объединенных вызовов"""
+        return {
+            "in_flight": len(self._calls),
+            "executed": self.executed,
+            "collapsed": self.collapsed
+        }
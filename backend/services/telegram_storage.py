@@ -0,0 +1,100 @@
+"""
+Данные Telegram бота в БД: привязка аккаунтов, история и пакетное
+сохранение сессий и анализов. Используется ботом напрямую (BOT_STORAGE_MODE=db)
+и API для бота (/api/telegram) в режиме api.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.database import upsert_insert
+from backend.models import Analysis, TelegramSession, User
+from backend.services.history import select_analysis_previews
+from backend.services.usage import record_usage
+
+# Сессий в одном INSERT (ограничение числа параметров запроса в SQLite)
+SESSIONS_PER_STATEMENT = 100
+
+
+class AccountAlreadyLinked(Exception):
+    """Telegram аккаунт уже привязан к другому пользователю"""
+
+
+async def find_user_id(db: AsyncSession, telegram_id: str) -> Optional[int]:
+    """user_id пользователя, привязанного к Telegram аккаунту"""
+    return await db.scalar(select(User.id).where(User.telegram_id == telegram_id))
+
+
+async def link_account(db: AsyncSession, username: str, telegram_id: str) -> Optional[int]:
+    """
+    Привязка Telegram аккаунта к пользователю; None, если пользователь не найден.
+    AccountAlreadyLinked - аккаунт привязан к другому пользователю
+    """
+    user = await db.scalar(select(User).where(User.username == username))
+    if not user:
+        return None
+    linked_user_id = await find_user_id(db, telegram_id)
+    if linked_user_id is not None and linked_user_id != user.id:
+        raise AccountAlreadyLinked(telegram_id)
+    user.telegram_id = telegram_id
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Аккаунт одновременно привязали к другому пользователю
+        await db.rollback()
+        raise AccountAlreadyLinked(telegram_id)
+    return user.id
+
+
+async def unlink_account(db: AsyncSession, telegram_id: str) -> Optional[int]:
+    """Отвязка Telegram аккаунта; user_id отвязанного пользователя или None"""
+    user = await db.scalar(select(User).where(User.telegram_id == telegram_id))
+    if not user:
+        return None
+    user.telegram_id = None
+    await db.commit()
+    return user.id
+
+
+async def recent_analyses(db: AsyncSession, user_id: int, limit: int) -> List[Any]:
+    """Превью последних анализов пользователя"""
+    return (await db.execute(
+        select_analysis_previews(user_id).order_by(
+            Analysis.created_at.desc(), Analysis.id.desc()
+        ).limit(limit)
+    )).all()
+
+
+async def save_records(
+    db: AsyncSession,
+    sessions: List[Dict[str, Any]],
+    analyses: Iterable[Dict[str, Any]]
+):
+    """
+    Сохранение сессий (upsert по telegram_id) и анализов с дневными
+    агрегатами расхода одной транзакцией
+    """
+    for start in range(0, len(sessions), SESSIONS_PER_STATEMENT):
+        statement = upsert_insert(TelegramSession).values(
+            sessions[start:start + SESSIONS_PER_STATEMENT]
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["telegram_id"],
+            set_={
+                "username": statement.excluded.username,
+                "first_name": statement.excluded.first_name,
+                "last_name": statement.excluded.last_name,
+                "last_activity": statement.excluded.last_activity
+            }
+        )
+        await db.execute(statement)
+
+    rows = [Analysis(**values) for values in analyses]
+    if rows:
+        db.add_all(rows)
+        await record_usage(db, rows)
+
+    await db.commit()
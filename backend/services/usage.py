@@ -0,0 +1,94 @@
+"""
+Учет расхода токенов Gemini и задержки анализов: счетчик токенов
+на запрос и дневные агрегаты по пользователям и типам анализа
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.database import upsert_insert
+from backend.models import Analysis, UsageDaily
+
+
+@dataclass
+class TokenUsage:
+    """Токены, израсходованные на вызовы модели"""
+    prompt_tokens: int = 0
+    response_tokens: int = 0
+
+    def split(self, parts: int) -> List["TokenUsage"]:
+        """Деление расхода одного вызова между parts результатами (остаток - первому)"""
+        shares = [
+            TokenUsage(self.prompt_tokens // parts, self.response_tokens // parts)
+            for _ in range(parts)
+        ]
+        shares[0].prompt_tokens += self.prompt_tokens % parts
+        shares[0].response_tokens += self.response_tokens % parts
+        return shares
+
+
+_current_usage: ContextVar[Optional[TokenUsage]] = ContextVar("token_usage", default=None)
+
+
+@contextmanager
+def track_usage() -> Iterator[TokenUsage]:
+    """
+    Счетчик токенов вызовов модели внутри блока. Задачи, созданные
+    в блоке (фрагменты длинного текста), пишут в тот же счетчик.
+    """
+    usage = TokenUsage()
+    token = _current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _current_usage.reset(token)
+
+
+def add_usage(prompt_tokens: int, response_tokens: int):
+    """Учет токенов вызова модели в текущем счетчике (если он есть)"""
+    usage = _current_usage.get()
+    if usage is not None:
+        usage.prompt_tokens += prompt_tokens
+        usage.response_tokens += response_tokens
+
+
+async def record_usage(db: AsyncSession, analyses: Iterable[Analysis]):
+    """
+    Добавление анализов в дневные агрегаты usage_daily.
+    Выполняется в транзакции сохранения анализов; фиксирует ее вызывающий.
+    """
+    day = datetime.now(timezone.utc).date()
+    totals: Dict[Tuple[int, str], List[int]] = {}
+    for analysis in analyses:
+        total = totals.setdefault((analysis.user_id, analysis.analysis_type), [0, 0, 0, 0])
+        total[0] += 1
+        total[1] += analysis.prompt_tokens or 0
+        total[2] += analysis.response_tokens or 0
+        total[3] += analysis.latency_ms or 0
+
+    # Строки обновляются в одном порядке, чтобы параллельные транзакции не блокировали друг друга
+    for (user_id, analysis_type), (requests, prompt_tokens, response_tokens, latency_ms) in sorted(totals.items()):
+        statement = upsert_insert(UsageDaily).values(
+            day=day,
+            user_id=user_id,
+            analysis_type=analysis_type,
+            requests=requests,
+            prompt_tokens=prompt_tokens,
+            response_tokens=response_tokens,
+            latency_ms=latency_ms
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["day", "user_id", "analysis_type"],
+            set_={
+                "requests": UsageDaily.requests + statement.excluded.requests,
+                "prompt_tokens": UsageDaily.prompt_tokens + statement.excluded.prompt_tokens,
+                "response_tokens": UsageDaily.response_tokens + statement.excluded.response_tokens,
+                "latency_ms": UsageDaily.latency_ms + statement.excluded.latency_ms
+            }
+        )
+        await db.execute(statement)
@@ -0,0 +1,75 @@
+"""
+Общие настройки тестов: отдельная SQLite БД во временном каталоге
+и управляемые часы для проверок, зависящих от времени
+"""
+
+import asyncio
+import itertools
+import os
+import tempfile
+
+import pytest
+
+# Настройки читаются при импорте backend, поэтому окружение задается до него
+_database_dir = tempfile.mkdtemp(prefix="ai-content-curator-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_database_dir}/test.db"
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+
+class FakeClock:
+    """Замена модуля time: время меняется только через advance"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    # Один цикл событий на все тесты: соединения пула БД привязаны к циклу
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def database():
+    """БД со схемой, созданной миграциями"""
+    from backend.migrate import upgrade_database
+    upgrade_database()
+
+
+_user_numbers = itertools.count()
+
+
+@pytest.fixture
+def make_user(database):
+    """Создание пользователя с уникальными именем и email"""
+    from backend.database import SessionLocal
+    from backend.models import User
+
+    async def make(**values):
+        number = next(_user_numbers)
+        async with SessionLocal() as db:
+            user = User(
+                username=f"user{number}", email=f"user{number}@example.com",
+                hashed_password="x", **values
+            )
+            db.add(user)
+            await db.commit()
+            return user
+
+    return make
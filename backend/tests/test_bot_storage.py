@@ -0,0 +1,250 @@
+import json
+
+import httpx
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from backend.config import settings
+from telegram_bot.storage import (
+    ApiStorage, WriteBehindBuffer, is_rejected, outcome_unknown, split_batch
+)
+
+
+class FakeStorage:
+    """
+    Хранилище записей бота: down - временная ошибка, записи с bad - отклоняются,
+    lose_response - записи сохраняются, но ответ теряется (таймаут)
+    """
+
+    def __init__(self):
+        self.sessions = []
+        self.analyses = []
+        self.calls = 0
+        self.down = False
+        self.lose_response = False
+
+    async def save_records(self, sessions, analyses):
+        self.calls += 1
+        if self.down:
+            raise httpx.ConnectError("connection refused")
+        if any(record.get("bad") for record in sessions + analyses):
+            raise IntegrityError("INSERT", {}, Exception("FOREIGN KEY constraint failed"))
+        self.sessions += sessions
+        self.analyses += analyses
+        if self.lose_response:
+            raise httpx.ReadTimeout("timed out")
+
+
+@pytest.fixture
+def storage(monkeypatch) -> FakeStorage:
+    monkeypatch.setattr(settings, "BOT_WRITE_BATCH_SIZE", 4)
+    monkeypatch.setattr(settings, "BOT_WRITE_MAX_PENDING", 10)
+    monkeypatch.setattr(settings, "BOT_WRITE_MAX_RETRIES", 2)
+    return FakeStorage()
+
+
+def add_session(buffer: WriteBehindBuffer, telegram_id: str, username: str = None):
+    buffer.add_session(telegram_id, username, None, None)
+
+
+def status_error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://api/telegram/records")
+    return httpx.HTTPStatusError(
+        "error", request=request, response=httpx.Response(status, request=request)
+    )
+
+
+def test_rejected_errors_are_classified():
+    assert is_rejected(IntegrityError("INSERT", {}, Exception("UNIQUE constraint failed")))
+    assert is_rejected(status_error(409))
+    assert is_rejected(status_error(422))
+    assert not is_rejected(status_error(401))
+    assert not is_rejected(status_error(503))
+    assert not is_rejected(httpx.ConnectError("connection refused"))
+
+
+def test_unknown_outcome_errors_are_classified():
+    assert outcome_unknown(httpx.ReadTimeout("timed out"))
+    assert outcome_unknown(httpx.RemoteProtocolError("server disconnected"))
+    assert outcome_unknown(status_error(504))
+    assert not outcome_unknown(status_error(503))
+    assert not outcome_unknown(httpx.ConnectError("connection refused"))
+    assert not outcome_unknown(httpx.PoolTimeout("no connection"))
+    assert not outcome_unknown(IntegrityError("INSERT", {}, Exception("UNIQUE constraint failed")))
+
+
+def test_split_batch_keeps_order():
+    sessions = [{"telegram_id": "1"}, {"telegram_id": "2"}]
+    analyses = [{"n": 1}, {"n": 2}, {"n": 3}]
+
+    first, second = split_batch(sessions[:1], analyses)
+    assert first == (sessions[:1], [{"n": 1}])
+    assert second == ([], [{"n": 2}, {"n": 3}])
+
+    first, second = split_batch(sessions, analyses)
+    assert first == (sessions, [])
+    assert second == ([], analyses)
+
+    first, second = split_batch(sessions, [])
+    assert first == ([{"telegram_id": "1"}], [])
+    assert second == ([{"telegram_id": "2"}], [])
+
+
+async def test_flush_saves_in_batches(storage):
+    buffer = WriteBehindBuffer(storage)
+    for n in range(6):
+        buffer.add_analysis(n=n)
+    add_session(buffer, "1", "old")
+    add_session(buffer, "1", "new")
+
+    await buffer.flush()
+
+    assert storage.calls == 2
+    assert [analysis["n"] for analysis in storage.analyses] == list(range(6))
+    # Повторные сессии одного пользователя схлопываются
+    assert [session["username"] for session in storage.sessions] == ["new"]
+    assert buffer.stats() == {
+        "pending": 0, "flushed": 7, "failed_flushes": 0, "dropped": 0, "rejected": 0
+    }
+
+
+async def test_rejected_record_is_dropped_and_rest_saved(storage):
+    buffer = WriteBehindBuffer(storage)
+    for n in range(4):
+        buffer.add_analysis(n=n, bad=n == 2)
+    buffer.add_analysis(n=4)
+
+    await buffer.flush()
+
+    assert [analysis["n"] for analysis in storage.analyses] == [0, 1, 3, 4]
+    assert buffer.rejected == 1
+    assert buffer.pending == 0
+
+
+async def test_failed_batch_is_retried_first(storage):
+    buffer = WriteBehindBuffer(storage)
+    add_session(buffer, "1", "old")
+    buffer.add_analysis(n=1)
+    storage.down = True
+    await buffer.flush()
+    assert buffer.pending == 2
+
+    add_session(buffer, "1", "new")
+    buffer.add_analysis(n=2)
+    storage.down = False
+    await buffer.flush()
+
+    # Новые данные сессии записываются после отложенного пакета
+    assert [session["username"] for session in storage.sessions] == ["old", "new"]
+    assert [analysis["n"] for analysis in storage.analyses] == [1, 2]
+    assert buffer.pending == 0
+
+
+async def test_failed_batch_is_dropped_after_max_retries(storage):
+    buffer = WriteBehindBuffer(storage)
+    for n in range(3):
+        buffer.add_analysis(n=n)
+    storage.down = True
+
+    for _ in range(settings.BOT_WRITE_MAX_RETRIES):
+        await buffer.flush()
+        assert buffer.pending == 3
+    await buffer.flush()
+
+    assert buffer.pending == 0
+    assert buffer.dropped == 3
+    assert buffer.failed_flushes == settings.BOT_WRITE_MAX_RETRIES + 1
+
+    # Следующий пакет снова получает все попытки
+    storage.down = False
+    buffer.add_analysis(n=3)
+    await buffer.flush()
+    assert [analysis["n"] for analysis in storage.analyses] == [3]
+
+
+async def test_overflow_drops_oldest_analyses_then_sessions(storage):
+    buffer = WriteBehindBuffer(storage)
+    for n in range(8):
+        buffer.add_analysis(n=n)
+    for n in range(4):
+        add_session(buffer, str(n))
+
+    assert buffer.pending == 10
+    assert buffer.dropped == 2
+
+    for n in range(8, 16):
+        add_session(buffer, str(n))
+
+    # Отброшены все анализы и самые старые сессии; счетчик равен числу удаленных записей
+    assert buffer.pending == 10
+    assert buffer.dropped == 10
+    await buffer.flush()
+    assert storage.analyses == []
+    assert [session["telegram_id"] for session in storage.sessions] == [
+        "2", "3", *(str(n) for n in range(8, 16))
+    ]
+
+
+async def test_unknown_outcome_does_not_duplicate_analyses(storage):
+    buffer = WriteBehindBuffer(storage)
+    add_session(buffer, "1", "name")
+    buffer.add_analysis(n=1)
+    buffer.add_analysis(n=2)
+    storage.lose_response = True
+
+    await buffer.flush()
+    storage.lose_response = False
+    await buffer.flush()
+    await buffer.flush()
+
+    # Анализы не отправляются повторно, сессия (upsert) повторяется
+    assert [analysis["n"] for analysis in storage.analyses] == [1, 2]
+    assert [session["telegram_id"] for session in storage.sessions] == ["1", "1"]
+    assert storage.calls == 2
+    assert buffer.dropped == 2
+    assert buffer.pending == 0
+
+
+async def test_unknown_outcome_of_analyses_only_batch_is_not_retried(storage):
+    buffer = WriteBehindBuffer(storage)
+    buffer.add_analysis(n=1)
+    storage.lose_response = True
+
+    await buffer.flush()
+    storage.lose_response = False
+    buffer.add_analysis(n=2)
+    await buffer.flush()
+
+    assert [analysis["n"] for analysis in storage.analyses] == [1, 2]
+    assert storage.calls == 2
+
+
+async def test_api_read_timeout_after_commit_is_not_resent(monkeypatch, storage):
+    posted = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        posted.append(body)
+        # Бэкенд сохранил пакет, но ответ не дошел до бота
+        if len(posted) == 1:
+            raise httpx.ReadTimeout("timed out", request=request)
+        return httpx.Response(200, json={"sessions": 0, "analyses": 0})
+
+    api = ApiStorage()
+    await api.close()
+    api._client = httpx.AsyncClient(
+        base_url="http://api", transport=httpx.MockTransport(handler)
+    )
+    buffer = WriteBehindBuffer(api)
+    add_session(buffer, "1", "name")
+    buffer.add_analysis(
+        user_id=1, original_text="text", analysis_type="summary", result="result"
+    )
+
+    await buffer.flush()
+    await buffer.flush()
+    await api.close()
+
+    assert [len(body["analyses"]) for body in posted] == [1, 0]
+    assert [len(body["sessions"]) for body in posted] == [1, 1]
+    assert buffer.pending == 0
@@ -0,0 +1,65 @@
+from backend.services import cache
+from backend.services.cache import TTLCache, make_cache_key
+
+
+def test_get_returns_stored_value():
+    store = TTLCache(max_entries=10, ttl_seconds=60)
+    store.set("a", 1)
+
+    assert store.get("a") == 1
+    assert store.get("b") is None
+    assert store.stats()["hits"] == 1
+    assert store.stats()["misses"] == 1
+
+
+def test_entry_expires_after_ttl(monkeypatch, clock):
+    monkeypatch.setattr(cache, "time", clock)
+    store = TTLCache(max_entries=10, ttl_seconds=60)
+    store.set("a", 1)
+
+    clock.advance(59)
+    assert store.get("a") == 1
+    clock.advance(2)
+    assert store.get("a") is None
+    assert len(store) == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    store = TTLCache(max_entries=2, ttl_seconds=60)
+    store.set("a", 1)
+    store.set("b", 2)
+    # Чтение делает "a" самой свежей записью
+    store.get("a")
+    store.set("c", 3)
+
+    assert store.get("b") is None
+    assert store.get("a") == 1
+    assert store.get("c") == 3
+    assert store.stats()["evictions"] == 1
+
+
+def test_size_limit_evicts_until_total_fits():
+    store = TTLCache(max_entries=10, ttl_seconds=60, max_bytes=10, sizeof=len)
+    store.set("a", "xxxx")
+    store.set("b", "yyyy")
+    store.set("c", "zzzz")
+
+    assert store.get("a") is None
+    assert store.stats()["bytes"] == 8
+
+
+def test_overwrite_replaces_size():
+    store = TTLCache(max_entries=10, ttl_seconds=60, max_bytes=10, sizeof=len)
+    store.set("a", "xxxxxxxx")
+    store.set("a", "x")
+
+    assert store.stats()["bytes"] == 1
+    assert store.get("a") == "x"
+
+
+def test_cache_key_ignores_whitespace_differences():
+    key = make_cache_key("summary", "1", "Привет,   мир\n")
+
+    assert key == make_cache_key("summary", "1", " Привет, мир")
+    assert key != make_cache_key("summary", "2", "Привет, мир")
+    assert key != make_cache_key("keywords", "1", "Привет, мир")
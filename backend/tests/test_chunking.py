@@ -0,0 +1,82 @@
+import pytest
+
+from backend.config import settings
+from backend.services.chunking import (
+    CHARS_PER_TOKEN, combine_sentiment, merge_keywords, split_text
+)
+from backend.services.gemini_service import GeminiService
+
+SENTENCE = "Предложение о важном событии дня. "
+
+
+def test_short_text_is_one_chunk():
+    assert split_text("  Короткий текст  ", 100) == ["Короткий текст"]
+
+
+def test_chunks_fit_budget_and_keep_words():
+    text = "\n\n".join(SENTENCE * 20 for _ in range(5)) + " " + "слово" * 200
+    chunks = split_text(text, 50)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 50 * CHARS_PER_TOKEN for chunk in chunks)
+    # Текст сохраняется целиком, меняются только пробелы на границах
+    assert "".join("".join(chunks).split()) == "".join(text.split())
+
+
+def test_merge_keywords_prefers_common_words():
+    merged = merge_keywords(["Python, API, тесты", "api, базы данных", "API, Python"], limit=3)
+
+    assert merged == "API, Python, тесты"
+
+
+def test_combine_sentiment_weights_by_length():
+    result, confidence = combine_sentiment(
+        [("Тональность: позитивная", 0.9), ("Тональность: негативная", 0.9)], [300, 100]
+    )
+
+    assert result.startswith("Тональность: позитивная")
+    assert confidence == 0.9
+
+
+class StubGemini(GeminiService):
+    """Резюме без обращения к модели: начало текста заданной доли длины"""
+
+    def __init__(self, ratio: float):
+        self.ratio = ratio
+        self.calls = []
+
+    async def _summarize(self, text: str):
+        assert len(text.strip()) <= settings.CHUNK_MAX_TOKENS * CHARS_PER_TOKEN
+        self.calls.append(len(text))
+        return text[:max(1, int(len(text) * self.ratio))], 0.9
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(settings, "CHUNK_MAX_TOKENS", 50)
+    monkeypatch.setattr(settings, "CHUNK_REDUCE_MAX_DEPTH", 2)
+
+
+@pytest.mark.parametrize("ratio", [0.1, 0.9, 1.0])
+async def test_summary_reduction_is_bounded(small_chunks, ratio):
+    service = StubGemini(ratio)
+    text = SENTENCE * 400
+    chunks = len(split_text(text, settings.CHUNK_MAX_TOKENS))
+
+    summary, confidence = await service.create_summary(text)
+
+    assert confidence == 0.9
+    assert len(summary) <= settings.CHUNK_MAX_TOKENS * CHARS_PER_TOKEN
+    # Каждый уровень сокращает текст, поэтому фрагментов на уровне не больше,
+    # чем в исходном тексте; после последнего уровня - одно финальное резюме
+    assert len(service.calls) <= chunks * settings.CHUNK_REDUCE_MAX_DEPTH + 1
+
+
+async def test_summary_stops_when_summaries_do_not_shrink(small_chunks):
+    service = StubGemini(1.0)
+    text = SENTENCE * 20
+
+    await service.create_summary(text)
+
+    # Резюме фрагментов не короче текста: сразу финальное резюме по началу
+    assert len(service.calls) == len(split_text(text, settings.CHUNK_MAX_TOKENS)) + 1
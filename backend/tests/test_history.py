@@ -0,0 +1,94 @@
+import pytest
+from sqlalchemy import func, select
+
+from backend.database import SessionLocal
+from backend.models import Analysis
+from backend.services.history import (
+    RESULT_PREVIEW_LENGTH, TEXT_PREVIEW_LENGTH, history_filters, select_analysis_previews
+)
+
+
+@pytest.fixture
+async def analyses(make_user):
+    """Анализы пользователя с разными уверенностью и задержкой; None - метрика неизвестна"""
+    user = await make_user()
+    metrics = {
+        "high_fast": (0.9, 500),
+        "high_slow": (0.95, 5000),
+        "low_fast": (0.3, 200),
+        "edge": (0.8, 2000),
+        "unknown": (None, None),
+    }
+    async with SessionLocal() as db:
+        rows = {
+            name: Analysis(
+                user_id=user.id, original_text=name, analysis_type="summary",
+                result="result", confidence_score=confidence, latency_ms=latency
+            )
+            for name, (confidence, latency) in metrics.items()
+        }
+        db.add_all(rows.values())
+        await db.commit()
+    return user.id
+
+
+async def fetch_names(user_id: int, **filters) -> set:
+    async with SessionLocal() as db:
+        rows = (await db.execute(select_analysis_previews(user_id, **filters))).all()
+        total = await db.scalar(
+            select(func.count(Analysis.id)).where(*history_filters(user_id, **filters))
+        )
+    # Подсчет для include_total использует те же условия, что и список
+    assert total == len(rows)
+    return {row.original_text for row in rows}
+
+
+async def test_no_filters_returns_all(analyses):
+    assert await fetch_names(analyses) == {"high_fast", "high_slow", "low_fast", "edge", "unknown"}
+
+
+async def test_min_confidence_is_inclusive_and_skips_unknown(analyses):
+    assert await fetch_names(analyses, min_confidence=0.8) == {"high_fast", "high_slow", "edge"}
+    assert await fetch_names(analyses, min_confidence=0.0) == {
+        "high_fast", "high_slow", "low_fast", "edge"
+    }
+
+
+async def test_max_latency_is_inclusive_and_skips_unknown(analyses):
+    assert await fetch_names(analyses, max_latency_ms=2000) == {"high_fast", "low_fast", "edge"}
+
+
+async def test_filters_combine(analyses):
+    assert await fetch_names(analyses, min_confidence=0.8, max_latency_ms=2000) == {
+        "high_fast", "edge"
+    }
+    assert await fetch_names(analyses, min_confidence=0.99) == set()
+
+
+async def test_filters_respect_type(analyses):
+    assert await fetch_names(analyses, analysis_type="keywords", min_confidence=0.0) == set()
+
+
+async def test_previews_are_truncated_in_database(make_user):
+    user = await make_user()
+    async with SessionLocal() as db:
+        db.add_all([
+            Analysis(
+                user_id=user.id, original_text="a" * (TEXT_PREVIEW_LENGTH + 1),
+                analysis_type="summary", result="short"
+            ),
+            Analysis(
+                user_id=user.id, original_text="short",
+                analysis_type="summary", result="b" * RESULT_PREVIEW_LENGTH
+            ),
+        ])
+        await db.commit()
+        rows = (await db.execute(
+            select_analysis_previews(user.id).order_by(Analysis.id)
+        )).all()
+
+    assert len(rows[0].original_text) == TEXT_PREVIEW_LENGTH
+    assert rows[0].truncated
+    # Результат ровно на границе превью не считается обрезанным
+    assert rows[1].result == "b" * RESULT_PREVIEW_LENGTH
+    assert not rows[1].truncated
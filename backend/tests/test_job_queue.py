@@ -0,0 +1,209 @@
+import asyncio
+from datetime import timedelta
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from sqlalchemy import delete, update
+
+from backend.config import settings
+from backend.database import SessionLocal
+from backend.models import AnalysisJob
+from backend.services import job_queue
+from backend.services.job_queue import (
+    JobQueue, check_callback_url, is_public_address, post_callback, utcnow
+)
+
+@pytest.fixture
+async def make_jobs(make_user):
+    """Создание заданий: по count на каждого из users новых пользователей"""
+    async with SessionLocal() as db:
+        await db.execute(delete(AnalysisJob))
+        await db.commit()
+
+    async def make(users: int, count: int):
+        jobs = []
+        for _ in range(users):
+            user = await make_user()
+            jobs += [
+                AnalysisJob(
+                    user_id=user.id,
+                    original_text="text",
+                    analysis_type="summary",
+                    next_run_at=utcnow() - timedelta(seconds=1)
+                )
+                for _ in range(count)
+            ]
+        async with SessionLocal() as db:
+            db.add_all(jobs)
+            await db.commit()
+            return [job.id for job in jobs]
+
+    return make
+
+
+async def load_job(job_id: int) -> AnalysisJob:
+    async with SessionLocal() as db:
+        return await db.get(AnalysisJob, job_id)
+
+
+async def expire_lease(job_id: int):
+    async with SessionLocal() as db:
+        await db.execute(
+            update(AnalysisJob).where(AnalysisJob.id == job_id).values(
+                locked_until=utcnow() - timedelta(seconds=1)
+            )
+        )
+        await db.commit()
+
+
+async def test_concurrent_claims_take_each_job_once(make_jobs, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_MAX_PER_USER", 100)
+    job_ids = await make_jobs(users=3, count=4)
+    queues = [JobQueue() for _ in range(4)]
+
+    # Воркер, проигравший все гонки за кандидатов, повторяет захват при следующем опросе
+    claimed = []
+    while True:
+        results = await asyncio.gather(*(queue._claim() for queue in queues for _ in range(3)))
+        results = [job_id for job_id in results if job_id is not None]
+        if not results:
+            break
+        claimed += results
+
+    assert len(claimed) == len(set(claimed))
+    assert sorted(claimed) == sorted(job_ids)
+    for job_id in job_ids:
+        job = await load_job(job_id)
+        assert job.status == "running"
+        assert job.attempts == 1
+
+
+async def test_claim_respects_per_user_limit(make_jobs, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_MAX_PER_USER", 2)
+    await make_jobs(users=1, count=3)
+    queue = JobQueue()
+
+    assert await queue._claim() is not None
+    assert await queue._claim() is not None
+    assert await queue._claim() is None
+
+
+async def test_running_job_is_not_claimed_until_lease_expires(make_jobs):
+    (job_id,) = await make_jobs(users=1, count=1)
+    queue = JobQueue()
+
+    assert await queue._claim() == job_id
+    assert await queue._claim() is None
+
+    await expire_lease(job_id)
+    assert await queue._claim() == job_id
+    assert (await load_job(job_id)).attempts == 2
+
+
+async def test_stale_attempt_cannot_finish_reclaimed_job(make_jobs):
+    (job_id,) = await make_jobs(users=1, count=1)
+    queue = JobQueue()
+    result = SimpleNamespace(result="summary", confidence=0.9, prompt_tokens=10, response_tokens=5)
+
+    await queue._claim()
+    await expire_lease(job_id)
+    await queue._claim()
+
+    # Первая попытка потеряла аренду: ее результат и ошибка отбрасываются
+    assert await queue._complete(job_id, 1, result, 0.1) is False
+    assert await queue._fail(job_id, 1, "error") is False
+    job = await load_job(job_id)
+    assert job.status == "running"
+    assert job.error is None
+
+    assert await queue._complete(job_id, 2, result, 0.1) is True
+    job = await load_job(job_id)
+    assert job.status == "succeeded"
+    assert job.analysis_id is not None
+
+
+async def test_lease_extension_is_fenced_by_attempt(make_jobs):
+    (job_id,) = await make_jobs(users=1, count=1)
+    queue = JobQueue()
+    await queue._claim()
+    await expire_lease(job_id)
+    await queue._claim()
+    locked_until = (await load_job(job_id)).locked_until
+
+    await queue._defer(job_id, 1, 60)
+
+    job = await load_job(job_id)
+    assert job.status == "running"
+    assert job.locked_until == locked_until
+
+
+def test_public_addresses():
+    assert is_public_address("8.8.8.8")
+    assert is_public_address("2001:4860:4860::8888")
+    for address in ("127.0.0.1", "10.0.0.1", "192.168.1.1", "169.254.169.254", "::1", "224.0.0.1"):
+        assert not is_public_address(address)
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1/hook",
+    "http://169.254.169.254/latest/meta-data",
+    "http://10.1.2.3:8080/hook",
+    "http://[::1]/hook",
+    "ftp://8.8.8.8/hook",
+])
+async def test_callback_to_internal_address_is_rejected(url, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_CALLBACK_ALLOWED_HOSTS", [])
+    with pytest.raises(ValueError):
+        await check_callback_url(url)
+
+
+async def test_callback_to_public_address_is_allowed(monkeypatch):
+    monkeypatch.setattr(settings, "JOB_CALLBACK_ALLOWED_HOSTS", [])
+    await check_callback_url("https://8.8.8.8/hook")
+
+
+async def test_callback_allowlist_is_exclusive(monkeypatch):
+    monkeypatch.setattr(settings, "JOB_CALLBACK_ALLOWED_HOSTS", ["127.0.0.1"])
+    await check_callback_url("http://127.0.0.1:9000/hook")
+    with pytest.raises(ValueError):
+        await check_callback_url("https://8.8.8.8/hook")
+
+
+@pytest.fixture
+def rebinding_dns(monkeypatch):
+    """DNS, который на первый запрос отвечает публичным адресом, а затем - внутренним"""
+    monkeypatch.setattr(settings, "JOB_CALLBACK_ALLOWED_HOSTS", [])
+    answers = [["93.184.216.34"]]
+
+    async def resolve(host, port):
+        return answers.pop(0) if answers else ["127.0.0.1"]
+
+    monkeypatch.setattr(job_queue, "resolve_host", resolve)
+
+
+async def test_callback_connects_to_checked_address(rebinding_dns):
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200)
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        await post_callback(client, "https://hooks.example.com:8443/done?x=1", {"id": 1})
+
+    (request,) = requests
+    assert request.url.host == "93.184.216.34"
+    assert request.url.port == 8443
+    assert request.url.raw_path == b"/done?x=1"
+    assert request.headers["Host"] == "hooks.example.com:8443"
+    assert request.extensions["sni_hostname"] == "hooks.example.com"
+
+
+async def test_callback_rejected_when_dns_turns_internal(rebinding_dns):
+    await check_callback_url("https://hooks.example.com/done")
+
+    transport = httpx.MockTransport(lambda request: httpx.Response(200))
+    async with httpx.AsyncClient(transport=transport) as client:
+        with pytest.raises(ValueError):
+            await post_callback(client, "https://hooks.example.com/done", {"id": 1})
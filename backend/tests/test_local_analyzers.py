@@ -0,0 +1,123 @@
+import pytest
+
+from backend.config import settings
+from backend.services.analysis_service import ENGINE_GEMINI, ENGINE_LOCAL, AnalysisService
+from backend.services.local_analyzers import analyze_sentiment_local, extract_keywords_local
+
+
+def keywords(text: str, limit: int = 10) -> list:
+    result, _ = extract_keywords_local(text, limit)
+    return result.split(", ") if result else []
+
+
+def sentiment_label(text: str):
+    result, confidence = analyze_sentiment_local(text)
+    label = result.splitlines()[0].split(": ")[1]
+    return label, confidence
+
+
+def test_keywords_are_phrases_between_stopwords_and_punctuation():
+    text = "Машинное обучение помогает в работе. Машинное обучение и большие данные!"
+
+    result = keywords(text)
+    # Длинная фраза набирает больше веса, чем ее части и отдельные слова
+    assert result[0] == "машинное обучение помогает"
+    assert set(result) == {
+        "машинное обучение помогает", "машинное обучение", "большие данные", "работе"
+    }
+
+
+def test_keywords_skip_short_words_and_numbers():
+    assert keywords("Версия 2024 от ООО и АО, ИП") == ["версия", "ооо"]
+
+
+def test_long_phrase_is_cut_to_three_words():
+    assert keywords("быстрая надежная удобная дешевая доставка") == ["быстрая надежная удобная"]
+
+
+def test_keywords_limit_and_duplicates():
+    text = "кошки, собаки, кошки, птицы, рыбы"
+
+    assert keywords(text) == ["кошки", "собаки", "птицы", "рыбы"]
+    assert keywords(text, limit=2) == ["кошки", "собаки"]
+
+
+@pytest.mark.parametrize("text", ["", "   ", "и в на, 123!"])
+def test_no_keywords_without_content_words(text):
+    assert extract_keywords_local(text) == ("", None)
+
+
+def test_sentiment_of_plain_evaluative_words():
+    assert sentiment_label("Отличный сервис, очень удобно") == ("позитивная", 0.7)
+    assert sentiment_label("Ужасный интерфейс и постоянные сбои") == ("негативная", 0.7)
+
+
+@pytest.mark.parametrize("text, label", [
+    ("Мне не нравится этот сервис", "негативная"),
+    ("Совсем не плохо", "позитивная"),
+    ("Работает без проблем", "позитивная"),
+    ("Ни разу не хорошо", "негативная"),
+])
+def test_negation_flips_next_word(text, label):
+    assert sentiment_label(text)[0] == label
+
+
+def test_negation_applies_only_to_adjacent_word():
+    # "не" относится к "очень", поэтому "хорошо" остается позитивным
+    assert sentiment_label("не очень хорошо")[0] == "позитивная"
+
+
+@pytest.mark.parametrize("text", ["", "Сегодня вторник", "хорошо, но плохо"])
+def test_neutral_sentiment(text):
+    assert sentiment_label(text) == ("нейтральная", 0.5)
+
+
+def test_sentiment_confidence_grows_with_hits_and_is_capped():
+    _, few = analyze_sentiment_local("хорошо")
+    _, many = analyze_sentiment_local("хорошо " * 20)
+
+    assert few == 0.6
+    assert many == 0.95
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_ANALYZER_MAX_CHARS", 20)
+    # Модель не нужна: локальные анализы к ней не обращаются
+    return AnalysisService(gemini_service=None)
+
+
+@pytest.mark.parametrize("analysis_type, text, engine", [
+    ("sentiment", "коротко", ENGINE_LOCAL),
+    ("keywords", "", ENGINE_LOCAL),
+    ("keywords", "x" * 20, ENGINE_LOCAL),
+    ("keywords", "x" * 21, ENGINE_GEMINI),
+    ("summary", "коротко", ENGINE_GEMINI),
+])
+def test_select_engine_by_type_and_length(service, analysis_type, text, engine):
+    assert service.select_engine(analysis_type, text) == engine
+
+
+def test_select_engine_disabled_by_default(service, monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_ANALYZER_MAX_CHARS", 0)
+
+    assert service.select_engine("sentiment", "коротко") == ENGINE_GEMINI
+    assert service.select_engine("sentiment", "") == ENGINE_LOCAL
+
+
+def test_explicit_engine_is_validated(service):
+    assert service.select_engine("sentiment", "x" * 100, ENGINE_LOCAL) == ENGINE_LOCAL
+    assert service.select_engine("sentiment", "коротко", ENGINE_GEMINI) == ENGINE_GEMINI
+    with pytest.raises(ValueError):
+        service.select_engine("summary", "коротко", ENGINE_LOCAL)
+    with pytest.raises(ValueError):
+        service.select_engine("sentiment", "коротко", "openai")
+
+
+async def test_local_analysis_does_not_call_model(service):
+    result = await service.analyze("sentiment", "не нравится")
+
+    assert result.engine == ENGINE_LOCAL
+    assert result.result.startswith("Тональность: негативная")
+    assert (result.prompt_tokens, result.response_tokens) == (0, 0)
+    assert service.local_calls == 1
@@ -0,0 +1,73 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+import sqlalchemy as sa
+from alembic import command
+
+from backend.config import settings
+from backend.migrate import alembic_config
+
+VERSIONS = Path(__file__).resolve().parent.parent / "migrations" / "versions"
+
+
+def load_revision(name: str):
+    """Модуль миграции: имена файлов начинаются с цифр, обычный import не подходит"""
+    spec = importlib.util.spec_from_file_location(name, VERSIONS / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+parse_number = load_revision("0007_numeric_analysis_metrics").parse_number
+
+
+@pytest.mark.parametrize("value, number", [
+    ("0.95", 0.95),
+    ("1.0", 1.0),
+    ("1.23s", 1.23),
+    (" 2,5 S ", 2.5),
+    ("-0.5", -0.5),
+    ("85%", 0.85),
+    ("100 %", 1.0),
+])
+def test_parse_number_legacy_values(value, number):
+    assert parse_number(value) == pytest.approx(number)
+
+
+@pytest.mark.parametrize("value", [None, "", "   ", "abc", "None", "v2", "1.2.3", "1.5 min", "95%%"])
+def test_parse_number_garbage_is_null(value):
+    assert parse_number(value) is None
+
+
+def test_upgrade_converts_legacy_metrics(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DATABASE_URL", f"sqlite:///{tmp_path}/legacy.db")
+    config = alembic_config()
+    command.upgrade(config, "0006")
+
+    engine = sa.create_engine(settings.DATABASE_URL)
+    with engine.begin() as conn:
+        conn.execute(sa.text(
+            "INSERT INTO users (id, username, email, hashed_password) "
+            "VALUES (1, 'legacy', 'legacy@example.com', 'x')"
+        ))
+        conn.execute(sa.text(
+            "INSERT INTO analyses "
+            "(id, user_id, original_text, analysis_type, result, confidence_score, processing_time, latency_ms) "
+            "VALUES (:id, 1, 'text', 'summary', 'result', :confidence, :processing_time, :latency_ms)"
+        ), [
+            {"id": 1, "confidence": "0.9", "processing_time": "1.23s", "latency_ms": None},
+            {"id": 2, "confidence": "85%", "processing_time": "garbage", "latency_ms": None},
+            {"id": 3, "confidence": None, "processing_time": "2.00s", "latency_ms": 1500},
+        ])
+
+    command.upgrade(config, "0007")
+
+    with engine.connect() as conn:
+        rows = conn.execute(sa.text(
+            "SELECT id, confidence_score, latency_ms FROM analyses ORDER BY id"
+        )).all()
+    engine.dispose()
+
+    # Уже заполненный latency_ms не перезаписывается значением из processing_time
+    assert [tuple(row) for row in rows] == [(1, 0.9, 1230), (2, 0.85, None), (3, None, 1500)]
@@ -0,0 +1,150 @@
+import base64
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import delete, select, text
+
+from backend.database import SessionLocal
+from backend.models import Analysis
+from backend.pagination import (
+    MAX_PAGE_SIZE, created_before, decode_created_cursor, decode_id_cursor, encode_cursor,
+    next_created_cursor, next_id_cursor, page_size, split_page
+)
+
+def test_created_cursor_round_trip():
+    created_at = datetime(2024, 1, 2, 3, 4, 5, 678900, tzinfo=timezone.utc)
+    cursor = encode_cursor(created_at, 42)
+
+    assert "=" not in cursor
+    assert decode_created_cursor(cursor) == (created_at, 42)
+
+
+def test_id_cursor_round_trip():
+    assert decode_id_cursor(encode_cursor(7)) == 7
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor!",
+    base64.urlsafe_b64encode(b'{"id": 1}').decode(),
+    encode_cursor("2024-01-01T00:00:00"),
+    encode_cursor("not a date", 1),
+    encode_cursor("2024-01-01T00:00:00", "x"),
+])
+def test_invalid_created_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_created_cursor(cursor)
+
+
+def test_invalid_id_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        decode_id_cursor(encode_cursor(1, 2))
+
+
+def test_page_size_is_clamped():
+    assert page_size(0) == 1
+    assert page_size(20) == 20
+    assert page_size(10 ** 6) == MAX_PAGE_SIZE
+
+
+def test_next_cursor_only_when_more_rows():
+    rows = [SimpleNamespace(id=3), SimpleNamespace(id=2), SimpleNamespace(id=1)]
+    page, has_more = split_page(rows, 2)
+
+    assert [row.id for row in page] == [3, 2]
+    assert has_more
+    assert decode_id_cursor(next_id_cursor(page, has_more)) == 2
+    assert next_id_cursor(rows, False) is None
+    assert next_created_cursor([], True) is None
+
+
+@pytest.fixture
+async def user_id(make_user):
+    return (await make_user()).id
+
+
+async def add_analyses(user_id: int, created_at: list) -> list:
+    async with SessionLocal() as db:
+        rows = [
+            Analysis(
+                user_id=user_id, original_text="text", analysis_type="summary",
+                result="result", created_at=value
+            )
+            for value in created_at
+        ]
+        db.add_all(rows)
+        await db.commit()
+        return [row.id for row in rows]
+
+
+async def fetch_all_pages(user_id: int, limit: int) -> list:
+    """Обход всех страниц так же, как это делает GET /api/analysis/"""
+    ids, cursor = [], None
+    async with SessionLocal() as db:
+        while True:
+            query = select(Analysis).where(Analysis.user_id == user_id)
+            if cursor:
+                query = query.where(created_before(Analysis, decode_created_cursor(cursor)))
+            rows = (await db.scalars(
+                query.order_by(Analysis.created_at.desc(), Analysis.id.desc()).limit(limit + 1)
+            )).all()
+            page, has_more = split_page(rows, limit)
+            ids += [row.id for row in page]
+            cursor = next_created_cursor(page, has_more)
+            if cursor is None:
+                return ids
+
+
+async def test_pages_follow_created_at_then_id_without_gaps(user_id):
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    # Несколько анализов с одинаковым временем: порядок между ними задает id
+    created_at = [base, base + timedelta(minutes=1), base, base + timedelta(minutes=1), base, base]
+    ids = await add_analyses(user_id, created_at)
+
+    expected = [row_id for _, row_id in sorted(zip(created_at, ids), reverse=True)]
+    for limit in (1, 2, 4, 10):
+        assert await fetch_all_pages(user_id, limit) == expected
+
+
+async def test_cursor_survives_deleted_anchor_row(user_id):
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    ids = await add_analyses(
+        user_id, [base, base + timedelta(minutes=1), base + timedelta(minutes=2)]
+    )
+    cursor = encode_cursor(base + timedelta(minutes=1), ids[1])
+
+    async with SessionLocal() as db:
+        await db.execute(delete(Analysis).where(Analysis.id == ids[1]))
+        await db.commit()
+        rows = (await db.scalars(
+            select(Analysis.id).where(
+                Analysis.user_id == user_id,
+                created_before(Analysis, decode_created_cursor(cursor))
+            )
+        )).all()
+
+    assert rows == [ids[0]]
+
+
+async def test_deep_page_seeks_index_range(user_id):
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    created_at = [base + timedelta(seconds=i // 3) for i in range(300)]
+    ids = await add_analyses(user_id, created_at)
+    expected = [row_id for _, row_id in sorted(zip(created_at, ids), reverse=True)]
+    # Курсор глубоко в истории: после него остается последняя страница
+    anchor = expected[279]
+    query = select(Analysis.id).where(
+        Analysis.user_id == user_id,
+        created_before(Analysis, (created_at[ids.index(anchor)], anchor))
+    ).order_by(Analysis.created_at.desc(), Analysis.id.desc()).limit(21)
+
+    async with SessionLocal() as db:
+        compiled = query.compile(db.bind, compile_kwargs={"literal_binds": True})
+        plan = " ".join(
+            str(row[-1]) for row in await db.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))
+        )
+        rows = (await db.scalars(query)).all()
+
+    # Индекс просматривается с позиции курсора, а не с самых новых записей
+    assert "ix_analyses_user_created (user_id=? AND created_at<?)" in plan
+    assert rows == expected[280:]
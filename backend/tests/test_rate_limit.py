@@ -0,0 +1,168 @@
+import asyncio
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from backend.config import settings
+from backend.routers import auth
+from backend.services import rate_limit
+from backend.services.rate_limit import (
+    Limit, MemoryRateLimitBackend, RateLimiter, RateLimitExceeded, SQLRateLimitBackend,
+    TokenBucketLimiter, client_ip, take_tokens
+)
+
+
+def make_request(client: str, forwarded: str = None) -> Request:
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "headers": headers, "client": (client, 12345)})
+
+
+def test_forwarded_header_ignored_from_untrusted_client(monkeypatch):
+    monkeypatch.setattr(settings, "TRUSTED_PROXIES", ["172.28.0.10"])
+
+    assert client_ip(make_request("203.0.113.5", "198.51.100.1")) == "203.0.113.5"
+
+
+def test_client_taken_from_trusted_proxy_chain(monkeypatch):
+    monkeypatch.setattr(settings, "TRUSTED_PROXIES", ["172.28.0.0/16"])
+
+    # Левое значение подставлено клиентом и не учитывается
+    request = make_request("172.28.0.10", "1.1.1.1, 198.51.100.1, 172.28.0.20")
+    assert client_ip(request) == "198.51.100.1"
+    assert client_ip(make_request("172.28.0.10")) == "172.28.0.10"
+
+
+@pytest.fixture
+def login_limits(monkeypatch):
+    """Небольшие лимиты входа: 3 попытки на адрес и пользователя, 5 на адрес"""
+    monkeypatch.setattr(settings, "TRUSTED_PROXIES", [])
+    monkeypatch.setattr(auth, "login_limiter", TokenBucketLimiter(3, 0.001))
+    monkeypatch.setattr(auth, "login_ip_limiter", TokenBucketLimiter(5, 0.001))
+    monkeypatch.setattr(auth, "login_global_limiter", TokenBucketLimiter(100, 0.001))
+
+
+async def attempt_login(client: str, username: str):
+    await auth.check_login_rate(make_request(client), SimpleNamespace(username=username))
+
+
+async def test_login_attempts_limited_per_address_and_username(login_limits):
+    for _ in range(3):
+        await attempt_login("203.0.113.5", "victim")
+    with pytest.raises(HTTPException) as error:
+        await attempt_login("203.0.113.5", " Victim ")
+    assert error.value.status_code == 429
+    assert int(error.value.headers["Retry-After"]) > 0
+
+    # Подбор пароля к одному аккаунту не мешает войти другим пользователям и с других адресов
+    await attempt_login("203.0.113.5", "other")
+    await attempt_login("198.51.100.1", "victim")
+
+
+async def test_login_attempts_limited_per_address(login_limits):
+    for number in range(5):
+        await attempt_login("203.0.113.5", f"user{number}")
+    with pytest.raises(HTTPException):
+        await attempt_login("203.0.113.5", "user5")
+    await attempt_login("198.51.100.1", "user5")
+
+
+def test_take_tokens_refills_up_to_capacity():
+    limit = Limit(capacity=10, refill_per_second=1)
+
+    assert take_tokens(0, 100, 105, limit, 1) == (4, 0.0)
+    assert take_tokens(5, 100, 1000, limit, 1) == (9, 0.0)
+
+
+def test_take_tokens_reports_wait_for_missing_tokens():
+    limit = Limit(capacity=10, refill_per_second=2)
+
+    assert take_tokens(1, 100, 100, limit, 5) == (1, 2.0)
+
+
+def test_take_tokens_caps_cost_and_refunds():
+    limit = Limit(capacity=10, refill_per_second=1)
+
+    # Запрос дороже всей корзины проходит, когда она полна
+    assert take_tokens(10, 100, 100, limit, 50) == (0, 0.0)
+    assert take_tokens(3, 100, 100, limit, -2) == (5, 0.0)
+
+
+def test_token_bucket_refills_over_time(monkeypatch, clock):
+    monkeypatch.setattr(rate_limit, "time", clock)
+    limiter = TokenBucketLimiter(capacity=2, refill_per_second=1)
+
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("a") == pytest.approx(1.0)
+    assert limiter.acquire("b") == 0
+
+    clock.advance(1)
+    assert limiter.acquire("a") == 0
+    assert limiter.stats() == {"keys": 2, "allowed": 4, "rejected": 1}
+
+
+def test_token_bucket_forgets_least_recent_keys():
+    limiter = TokenBucketLimiter(capacity=1, refill_per_second=0.001, max_keys=2)
+    limiter.acquire("a")
+    limiter.acquire("b")
+    limiter.acquire("c")
+
+    # Корзина "a" вытеснена и снова полна
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("c") > 0
+
+
+def test_token_bucket_is_thread_safe():
+    # Частое переключение потоков делает гонку между pop и вставкой корзины заметной
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    limiter = TokenBucketLimiter(capacity=50, refill_per_second=0.001)
+    barrier = threading.Barrier(8)
+
+    def worker():
+        barrier.wait()
+        return sum(1 for _ in range(200) if limiter.acquire("login") == 0)
+
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            allowed = sum(pool.map(lambda _: worker(), range(8)))
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert allowed == 50
+    assert limiter.stats() == {"keys": 1, "allowed": 50, "rejected": 8 * 200 - 50}
+
+
+async def test_rejected_check_refunds_taken_buckets():
+    limiter = RateLimiter(MemoryRateLimitBackend())
+    limiter.user_limit = Limit(capacity=5, refill_per_second=0.001)
+    limiter.global_limit = Limit(capacity=1, refill_per_second=0.001)
+
+    await limiter.check_user(1)
+    with pytest.raises(RateLimitExceeded) as error:
+        await limiter.check_user(1)
+    assert error.value.scope == "global"
+    assert limiter.stats() == {"global": 1}
+
+    # Токены пользователя за отклоненный запрос возвращены: осталось 4 из 5
+    user_bucket = [("user", "user:1", limiter.user_limit, 4)]
+    await limiter.check(*user_bucket)
+    with pytest.raises(RateLimitExceeded):
+        await limiter.check(*user_bucket)
+
+
+async def test_sql_buckets_are_shared_between_backends(database):
+    key = f"test:{uuid.uuid4()}"
+    limit = Limit(capacity=5, refill_per_second=0.001)
+    backends = [SQLRateLimitBackend() for _ in range(3)]
+
+    results = await asyncio.gather(*(backends[n % 3].acquire(key, limit, 1) for n in range(8)))
+
+    assert sum(1 for retry_after in results if retry_after == 0) <= 5
+    assert await backends[0].acquire(key, limit, 1) > 0
@@ -0,0 +1,184 @@
+import asyncio
+
+import pytest
+
+from backend.services import resilience
+from backend.services.resilience import (
+    AIMDLimiter, CircuitBreaker, CircuitOpenError, backoff_delay, retry_with_backoff
+)
+
+
+@pytest.fixture
+def breaker(monkeypatch, clock) -> CircuitBreaker:
+    monkeypatch.setattr(resilience, "time", clock)
+    return CircuitBreaker(failure_threshold=3, recovery_timeout=30)
+
+
+def open_breaker(breaker: CircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.before_call()
+        breaker.record_failure()
+
+
+def test_breaker_opens_after_consecutive_failures(breaker):
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.times_opened == 1
+
+
+def test_success_resets_failure_count(breaker):
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    breaker.before_call()
+    breaker.record_success()
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 1
+
+
+def test_open_breaker_rejects_until_recovery(breaker, clock):
+    open_breaker(breaker)
+    clock.advance(10)
+
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before_call()
+    assert error.value.retry_after == pytest.approx(20)
+    assert breaker.rejected == 1
+
+
+def test_half_open_allows_single_probe(breaker, clock):
+    open_breaker(breaker)
+    clock.advance(30)
+
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_successful_probe_closes_breaker(breaker, clock):
+    open_breaker(breaker)
+    clock.advance(30)
+    breaker.before_call()
+    breaker.record_success()
+
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_reopens_breaker(breaker, clock):
+    open_breaker(breaker)
+    clock.advance(30)
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.times_opened == 2
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_ignored_probe_result_allows_next_probe(breaker, clock):
+    open_breaker(breaker)
+    clock.advance(30)
+    breaker.before_call()
+    breaker.record_ignored()
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.before_call()
+
+
+def test_aimd_grows_additively_and_backs_off():
+    limiter = AIMDLimiter(initial_limit=4, min_limit=1, max_limit=8, latency_target=1.0)
+
+    for _ in range(4):
+        limiter.on_success(0.1)
+    assert 4.9 < limiter.limit < 5
+
+    limiter.on_success(2.0)
+    assert limiter.limit == pytest.approx(2.45, abs=0.05)
+    for _ in range(5):
+        limiter.on_overload()
+    assert limiter.limit == 1
+
+
+async def test_aimd_limits_concurrent_slots():
+    limiter = AIMDLimiter(initial_limit=2, min_limit=1, max_limit=4, latency_target=1.0)
+    release = asyncio.Event()
+    running = 0
+    peak = 0
+
+    async def call():
+        nonlocal running, peak
+        async with limiter.slot():
+            running += 1
+            peak = max(peak, running)
+            await release.wait()
+            running -= 1
+
+    tasks = [asyncio.ensure_future(call()) for _ in range(5)]
+    await asyncio.sleep(0.01)
+    assert limiter.in_flight == 2
+    release.set()
+    await asyncio.gather(*tasks)
+
+    assert peak == 2
+    assert limiter.in_flight == 0
+
+
+def test_backoff_delay_is_capped():
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt, base_delay=0.5, max_delay=2) <= 2
+
+
+async def test_retry_repeats_only_retryable_errors():
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectionError("temporary")
+        return "ok"
+
+    retried = []
+    result = await retry_with_backoff(
+        flaky, attempts=3, base_delay=0, max_delay=0,
+        is_retryable=lambda e: isinstance(e, ConnectionError), on_retry=retried.append
+    )
+    assert result == "ok"
+    assert len(retried) == 2
+
+    async def broken():
+        calls.append(1)
+        raise ValueError("permanent")
+
+    calls.clear()
+    with pytest.raises(ValueError):
+        await retry_with_backoff(
+            broken, attempts=3, base_delay=0, max_delay=0,
+            is_retryable=lambda e: isinstance(e, ConnectionError)
+        )
+    assert len(calls) == 1
+
+
+async def test_retry_gives_up_after_attempts():
+    calls = []
+
+    async def down():
+        calls.append(1)
+        raise ConnectionError("down")
+
+    with pytest.raises(ConnectionError):
+        await retry_with_backoff(
+            down, attempts=3, base_delay=0, max_delay=0, is_retryable=lambda e: True
+        )
+    assert len(calls) == 3
@@ -0,0 +1,213 @@
+import asyncio
+from datetime import datetime, timezone
+
+from telegram import CallbackQuery, Chat, Message, Update, User
+
+from telegram_bot.scheduler import (
+    FAST_LANE, LLM_LANE, ChatOrderedUpdateProcessor, WebhookUpdateQueue, update_chat_key,
+    update_lane
+)
+
+
+def make_update(update_id: int, chat_id: int = 1, text: str = "/help") -> Update:
+    message = Message(
+        message_id=update_id,
+        date=datetime.now(timezone.utc),
+        chat=Chat(id=chat_id, type="private"),
+        text=text
+    )
+    return Update(update_id=update_id, message=message)
+
+
+def test_update_lanes():
+    assert update_lane(make_update(1, text="/help")) == FAST_LANE
+    assert update_lane(make_update(1, text="/analyze summary текст")) == LLM_LANE
+    assert update_lane(make_update(1, text="/Analyze@curator_bot all текст")) == LLM_LANE
+    assert update_lane(make_update(1, text="Текст для анализа")) == LLM_LANE
+    query = CallbackQuery(
+        id="1", from_user=User(id=1, first_name="Имя", is_bot=False), chat_instance="1"
+    )
+    assert update_lane(Update(update_id=1, callback_query=query)) == FAST_LANE
+    assert update_lane(object()) == FAST_LANE
+
+
+def test_update_chat_key():
+    assert update_chat_key(make_update(1, chat_id=42)) == 42
+    assert update_chat_key(object()) is None
+
+
+async def test_updates_of_one_chat_run_in_order():
+    processor = ChatOrderedUpdateProcessor(fast_workers=4, llm_workers=4, max_pending=16)
+    order = []
+
+    async def handle(update_id: int, delay: float):
+        await asyncio.sleep(delay)
+        order.append(update_id)
+
+    await asyncio.gather(
+        processor.do_process_update(make_update(1, text="длинный анализ"), handle(1, 0.05)),
+        processor.do_process_update(make_update(2, text="/help"), handle(2, 0)),
+        processor.do_process_update(make_update(3, text="/help"), handle(3, 0)),
+    )
+
+    assert order == [1, 2, 3]
+    assert processor.stats()["active_chats"] == 0
+
+
+async def test_chats_and_lanes_run_independently():
+    processor = ChatOrderedUpdateProcessor(fast_workers=4, llm_workers=1, max_pending=16)
+    release = asyncio.Event()
+    running = {LLM_LANE: 0}
+    peak = {LLM_LANE: 0}
+    finished = []
+
+    async def analyze(update_id: int):
+        running[LLM_LANE] += 1
+        peak[LLM_LANE] = max(peak[LLM_LANE], running[LLM_LANE])
+        await release.wait()
+        running[LLM_LANE] -= 1
+        finished.append(update_id)
+
+    async def command(update_id: int):
+        finished.append(update_id)
+
+    analyses = [
+        asyncio.ensure_future(
+            processor.do_process_update(make_update(n, chat_id=n, text="текст"), analyze(n))
+        )
+        for n in (1, 2, 3)
+    ]
+    await asyncio.sleep(0.01)
+
+    # Пока очередь анализа занята, быстрая команда другого чата выполняется сразу
+    await asyncio.wait_for(
+        processor.do_process_update(make_update(4, chat_id=4), command(4)), timeout=1
+    )
+    assert finished == [4]
+    assert processor.stats()[LLM_LANE]["queued"] == 2
+
+    release.set()
+    await asyncio.gather(*analyses)
+    assert peak[LLM_LANE] == 1
+    assert sorted(finished) == [1, 2, 3, 4]
+    assert processor.stats()[LLM_LANE]["processed"] == 3
+
+
+def make_queue(process, max_pending: int = 1, max_size: int = 10, dedup_window: int = 100):
+    return WebhookUpdateQueue(
+        process, max_pending=max_pending, max_size=max_size, dedup_window=dedup_window,
+        enqueue_timeout=0.01
+    )
+
+
+async def test_webhook_queue_skips_redelivered_updates():
+    processed = []
+
+    async def process(update):
+        processed.append(update.update_id)
+
+    queue = make_queue(process)
+    await queue.start()
+    for update_id in (1, 2, 1, 3, 2):
+        assert await queue.put(make_update(update_id))
+    await queue.stop(drain_timeout=1)
+
+    assert processed == [1, 2, 3]
+    assert queue.stats()["duplicates"] == 2
+
+
+async def test_webhook_queue_dedup_window_is_bounded():
+    queue = make_queue(lambda update: asyncio.sleep(0), dedup_window=2)
+    await queue.start()
+    for update_id in (1, 2, 3):
+        await queue.put(make_update(update_id))
+
+    # update_id 1 вытеснен из окна и принимается снова
+    assert await queue.put(make_update(1))
+    await queue.stop(drain_timeout=1)
+    assert queue.stats()["accepted"] == 4
+    assert queue.stats()["duplicates"] == 0
+
+
+async def test_full_webhook_queue_sheds_and_accepts_redelivery():
+    release = asyncio.Event()
+    processed = []
+
+    async def process(update):
+        await release.wait()
+        processed.append(update.update_id)
+
+    queue = make_queue(process, max_pending=1, max_size=1)
+    await queue.start()
+    assert await queue.put(make_update(1))
+    await asyncio.sleep(0)
+    assert await queue.put(make_update(2))
+    await asyncio.sleep(0)
+    assert await queue.put(make_update(3))
+
+    # 1 в обработке, 2 ждет места в обработке, 3 в очереди: очередь заполнена
+    assert not await queue.put(make_update(4))
+    assert queue.stats()["shed"] == 1
+    assert queue.stats()["in_progress"] == 1
+
+    release.set()
+    await asyncio.sleep(0.01)
+    # Повторная доставка отклоненного обновления принимается
+    assert await queue.put(make_update(4))
+    await queue.stop(drain_timeout=1)
+    assert processed == [1, 2, 3, 4]
+
+
+async def test_webhook_worker_survives_failed_update():
+    processed = []
+
+    async def process(update):
+        if update.update_id == 1:
+            raise RuntimeError("boom")
+        processed.append(update.update_id)
+
+    queue = make_queue(process)
+    await queue.start()
+    await queue.put(make_update(1))
+    await queue.put(make_update(2))
+    await queue.stop(drain_timeout=1)
+
+    assert processed == [2]
+    assert queue.stats()["failed"] == 1
+    assert queue.stats()["in_progress"] == 0
+
+
+async def test_webhook_flood_from_one_chat_does_not_stall_others():
+    processor = ChatOrderedUpdateProcessor(fast_workers=2, llm_workers=2, max_pending=64)
+    release = asyncio.Event()
+    finished = []
+
+    async def handle(update):
+        if update.effective_chat.id == 1:
+            await release.wait()
+        finished.append(update.update_id)
+
+    async def process(update):
+        await processor.process_update(update, handle(update))
+
+    queue = make_queue(process, max_pending=64, max_size=100)
+    await queue.start()
+    # Чат 1 присылает поток анализов, каждый из которых долго ждет модель
+    for update_id in range(1, 41):
+        assert await queue.put(make_update(update_id, chat_id=1, text="/analyze summary текст"))
+    await asyncio.sleep(0.01)
+
+    # Быстрая команда другого чата выполняется, пока чат 1 еще ждет
+    assert await queue.put(make_update(100, chat_id=2, text="/help"))
+    for _ in range(100):
+        if finished:
+            break
+        await asyncio.sleep(0.01)
+    assert finished == [100]
+    assert queue.stats()["in_progress"] == 40
+
+    release.set()
+    await queue.stop(drain_timeout=1)
+    # Обновления чата 1 обработаны по порядку
+    assert finished == [100] + list(range(1, 41))
+    assert queue.stats()["processed"] == 41
@@ -0,0 +1,64 @@
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import func, select
+
+from backend.database import SessionLocal
+from backend.models import Analysis, TelegramSession
+from backend.services.telegram_storage import (
+    AccountAlreadyLinked, find_user_id, link_account, save_records, unlink_account
+)
+
+async def test_link_and_unlink_account(make_user):
+    user = await make_user()
+    telegram_id = str(uuid.uuid4().int)[:12]
+
+    async with SessionLocal() as db:
+        assert await link_account(db, user.username, telegram_id) == user.id
+        # Повторная привязка к тому же пользователю не ошибка
+        assert await link_account(db, user.username, telegram_id) == user.id
+        assert await find_user_id(db, telegram_id) == user.id
+        assert await link_account(db, "missing-user", telegram_id) is None
+
+        assert await unlink_account(db, telegram_id) == user.id
+        assert await find_user_id(db, telegram_id) is None
+        assert await unlink_account(db, telegram_id) is None
+
+
+async def test_account_linked_to_another_user_is_rejected(make_user):
+    owner, other = await make_user(), await make_user()
+    telegram_id = str(uuid.uuid4().int)[:12]
+
+    async with SessionLocal() as db:
+        await link_account(db, owner.username, telegram_id)
+        with pytest.raises(AccountAlreadyLinked):
+            await link_account(db, other.username, telegram_id)
+        assert await find_user_id(db, telegram_id) == owner.id
+
+
+async def test_save_records_upserts_sessions(make_user):
+    user = await make_user()
+    telegram_id = str(uuid.uuid4().int)[:12]
+
+    def session(username: str):
+        return {
+            "telegram_id": telegram_id, "username": username, "first_name": None,
+            "last_name": None, "last_activity": datetime.now(timezone.utc)
+        }
+
+    analysis = {
+        "user_id": user.id, "original_text": "text", "analysis_type": "summary",
+        "result": "result", "confidence_score": 0.9
+    }
+    async with SessionLocal() as db:
+        await save_records(db, [session("old")], [analysis])
+        await save_records(db, [session("new")], [analysis])
+
+        stored = await db.scalar(
+            select(TelegramSession).where(TelegramSession.telegram_id == telegram_id)
+        )
+        assert stored.username == "new"
+        assert await db.scalar(
+            select(func.count(Analysis.id)).where(Analysis.user_id == user.id)
+        ) == 2
@@ -0,0 +1,183 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import delete, select
+
+from backend.config import settings
+from backend.database import SessionLocal
+from backend.models import Analysis, UsageDaily
+from backend.routers.admin import get_admin_user, get_usage_report
+from backend.services.usage import TokenUsage, add_usage, record_usage, track_usage
+
+
+def make_analysis(user_id: int, analysis_type: str = "summary", prompt=0, response=0, latency=None):
+    return Analysis(
+        user_id=user_id, original_text="text", analysis_type=analysis_type, result="result",
+        prompt_tokens=prompt, response_tokens=response, latency_ms=latency
+    )
+
+
+async def usage_rows(user_id: int) -> dict:
+    async with SessionLocal() as db:
+        rows = (await db.scalars(
+            select(UsageDaily).where(UsageDaily.user_id == user_id)
+        )).all()
+    return {
+        row.analysis_type: (row.requests, row.prompt_tokens, row.response_tokens, row.latency_ms)
+        for row in rows
+    }
+
+
+def test_split_gives_remainder_to_first_share():
+    shares = TokenUsage(prompt_tokens=10, response_tokens=5).split(3)
+
+    assert [(share.prompt_tokens, share.response_tokens) for share in shares] == [
+        (4, 3), (3, 1), (3, 1)
+    ]
+    assert sum(share.prompt_tokens for share in shares) == 10
+    assert sum(share.response_tokens for share in shares) == 5
+
+
+async def test_track_usage_counts_calls_in_child_tasks():
+    async def call_model(prompt_tokens, response_tokens):
+        add_usage(prompt_tokens, response_tokens)
+
+    # Вне блока расход никуда не пишется
+    add_usage(100, 100)
+    with track_usage() as usage:
+        await asyncio.gather(call_model(3, 1), call_model(5, 2))
+
+    assert (usage.prompt_tokens, usage.response_tokens) == (8, 3)
+
+
+async def test_record_usage_aggregates_by_type(make_user):
+    user = await make_user()
+
+    async with SessionLocal() as db:
+        await record_usage(db, [
+            make_analysis(user.id, "summary", prompt=100, response=20, latency=300),
+            make_analysis(user.id, "summary", prompt=50, response=10, latency=None),
+            make_analysis(user.id, "keywords", prompt=None, response=None, latency=40),
+        ])
+        await db.commit()
+    async with SessionLocal() as db:
+        await record_usage(db, [make_analysis(user.id, "summary", prompt=1, response=2, latency=3)])
+        await db.commit()
+
+    # Токены запроса и ответа копятся раздельно, повторная запись дополняет строку дня
+    assert await usage_rows(user.id) == {
+        "summary": (3, 151, 32, 303),
+        "keywords": (1, 0, 0, 40),
+    }
+
+
+async def test_record_usage_not_saved_on_rollback(make_user):
+    user = await make_user()
+
+    async with SessionLocal() as db:
+        await record_usage(db, [make_analysis(user.id, prompt=10)])
+        await db.rollback()
+
+    assert await usage_rows(user.id) == {}
+
+
+async def test_concurrent_upserts_for_same_day(make_user):
+    user = await make_user()
+
+    async def save(number: int):
+        async with SessionLocal() as db:
+            await record_usage(db, [
+                make_analysis(user.id, prompt=number, response=1, latency=10),
+                make_analysis(user.id, "keywords", prompt=1, response=number, latency=5),
+            ])
+            await db.commit()
+
+    await asyncio.gather(*(save(number) for number in range(1, 21)))
+
+    # Ни одно обновление не потеряно: одна строка на тип, суммы по всем транзакциям
+    assert await usage_rows(user.id) == {
+        "summary": (20, 210, 20, 200),
+        "keywords": (20, 20, 210, 100),
+    }
+
+
+async def test_admin_dependency_checks_username(monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_USERNAMES", ["admin"])
+    admin = SimpleNamespace(username="admin")
+
+    assert await get_admin_user(admin) is admin
+    with pytest.raises(HTTPException) as error:
+        await get_admin_user(SimpleNamespace(username="user"))
+    assert error.value.status_code == 403
+
+
+@pytest.fixture
+async def usage_history(make_user):
+    """Дневные агрегаты двух пользователей; одна строка за пределами периода отчета"""
+    heavy, light = await make_user(), await make_user()
+    today = datetime.now(timezone.utc).date()
+    async with SessionLocal() as db:
+        await db.execute(delete(UsageDaily))
+        db.add_all([
+            UsageDaily(
+                day=today, user_id=heavy.id, analysis_type="summary",
+                requests=2, prompt_tokens=1000, response_tokens=200, latency_ms=3000
+            ),
+            UsageDaily(
+                day=today, user_id=light.id, analysis_type="keywords",
+                requests=1, prompt_tokens=10, response_tokens=5, latency_ms=100
+            ),
+            UsageDaily(
+                day=today - timedelta(days=1), user_id=light.id, analysis_type="summary",
+                requests=1, prompt_tokens=40, response_tokens=10, latency_ms=900
+            ),
+            UsageDaily(
+                day=today - timedelta(days=40), user_id=light.id, analysis_type="summary",
+                requests=100, prompt_tokens=10 ** 6, response_tokens=10 ** 6, latency_ms=0
+            ),
+        ])
+        await db.commit()
+    yield today, heavy, light
+    async with SessionLocal() as db:
+        await db.execute(delete(UsageDaily))
+        await db.commit()
+
+
+async def test_usage_report_totals(usage_history):
+    today, heavy, light = usage_history
+
+    async with SessionLocal() as db:
+        report = await get_usage_report(days=30, users_limit=20, db=db, admin=None)
+
+    assert report.since == today - timedelta(days=29)
+    total = report.total
+    assert (total.requests, total.prompt_tokens, total.response_tokens) == (4, 1050, 215)
+    assert total.avg_latency_ms == pytest.approx(1000)
+
+    assert [(row.day, row.requests, row.prompt_tokens) for row in report.days] == [
+        (today - timedelta(days=1), 1, 40), (today, 3, 1010)
+    ]
+    # Самые затратные пользователи первыми
+    assert [(row.username, row.requests, row.prompt_tokens, row.response_tokens) for row in report.users] == [
+        (heavy.username, 2, 1000, 200), (light.username, 2, 50, 15)
+    ]
+    assert [(row.analysis_type, row.requests, row.avg_latency_ms) for row in report.analysis_types] == [
+        ("keywords", 1, 100), ("summary", 3, 1300)
+    ]
+
+
+async def test_usage_report_period_and_limits(usage_history):
+    today, heavy, light = usage_history
+
+    async with SessionLocal() as db:
+        one_day = await get_usage_report(days=1, users_limit=1, db=db, admin=None)
+        year = await get_usage_report(days=10 ** 6, users_limit=20, db=db, admin=None)
+
+    assert one_day.since == today
+    assert one_day.total.requests == 3
+    assert [row.username for row in one_day.users] == [heavy.username]
+    # Период ограничен сверху и включает строку 40-дневной давности
+    assert year.total.requests == 104
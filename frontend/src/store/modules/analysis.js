@@ -5,6 +5,7 @@ const API_URL = process.env.VUE_APP_API_URL || 'http://localhost:8000/api'
 const state = {
   analyses: [],
   currentAnalysis: null,
+  nextCursor: null,
   loading: false,
   error: null,
   stats: {
@@ -17,6 +18,7 @@ const state = {
 
 const getters = {
   analyses: state => state.analyses,
+  hasMore: state => state.nextCursor !== null,
   currentAnalysis: state => state.currentAnalysis,
   loading: state => state.loading,
   error: state => state.error,
@@ -30,10 +32,15 @@ const mutations = {
   SET_ERROR(state, error) {
     state.error = error
   },
-  SET_ANALYSES(state, { analyses, total }) {
+  SET_ANALYSES(state, { analyses, total, next_cursor }) {
     state.analyses = analyses
+    state.nextCursor = next_cursor
     state.stats.total = total
   },
+  APPEND_ANALYSES(state, { analyses, next_cursor }) {
+    state.analyses.push(...analyses)
+    state.nextCursor = next_cursor
+  },
   ADD_ANALYSIS(state, analysis) {
     state.analyses.unshift(analysis)
     state.stats.total += 1
@@ -81,18 +88,19 @@ const actions = {
     }
   },
 
-  async fetchAnalyses({ commit }, { skip = 0, limit = 20, analysisType = null } = {}) {
+  async fetchAnalyses({ commit, state }, { more = false, limit = 20, analysisType = null } = {}) {
     try {
       commit('SET_LOADING', true)
       commit('SET_ERROR', null)
 
-      const params = { skip, limit }
+      // Первая страница запрашивается вместе с общим количеством, следующие - по курсору
+      const params = more ? { limit, cursor: state.nextCursor } : { limit, include_total: true }
       if (analysisType) {
         params.analysis_type = analysisType
       }
 
       const response = await axios.get(`${API_URL}/analysis/`, { params })
-      commit('SET_ANALYSES', response.data)
+      commit(more ? 'APPEND_ANALYSES' : 'SET_ANALYSES', response.data)
 
       return { success: true }
     } catch (error) {
@@ -0,0 +1,163 @@
+"""
+Проверка планов горячих запросов через EXPLAIN.
+
+Запуск (после alembic upgrade head):
+    python scripts/check_query_plans.py [--create-schema]
+
+Скрипт завершается с кодом 1, если хотя бы один запрос выполняется
+полным сканированием таблицы, с отдельной сортировкой или без границы
+диапазона индекса там, где она нужна (страницы по курсору).
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import sys
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, select  # noqa: E402
+
+from backend.database import engine  # noqa: E402
+from backend.migrate import upgrade_database  # noqa: E402
+from backend.models import Analysis, UsageDaily, User  # noqa: E402
+from backend.pagination import created_before  # noqa: E402
+from backend.services.history import select_analysis_previews  # noqa: E402
+
+# (название, запрос, ожидаемый индекс или None, запрос с сортировкой,
+#  колонка, по которой индекс должен просматриваться диапазоном, или None)
+HOT_QUERIES = [
+    (
+        "история анализов пользователя",
+        select_analysis_previews(1)
+        .order_by(Analysis.created_at.desc(), Analysis.id.desc()).limit(21),
+        "ix_analyses_user_created",
+        True,
+        None,
+    ),
+    (
+        "следующая страница истории по курсору",
+        select_analysis_previews(1).where(
+            created_before(Analysis, (datetime(2024, 1, 1), 100))
+        ).order_by(Analysis.created_at.desc(), Analysis.id.desc()).limit(21),
+        "ix_analyses_user_created",
+        True,
+        "created_at",
+    ),
+    (
+        "история анализов пользователя по типу",
+        select_analysis_previews(1, "summary")
+        .order_by(Analysis.created_at.desc(), Analysis.id.desc()).limit(21),
+        "ix_analyses_user_type_created",
+        True,
+        None,
+    ),
+    (
+        "следующая страница истории по типу по курсору",
+        select_analysis_previews(1, "summary").where(
+            created_before(Analysis, (datetime(2024, 1, 1), 100))
+        ).order_by(Analysis.created_at.desc(), Analysis.id.desc()).limit(21),
+        "ix_analyses_user_type_created",
+        True,
+        "created_at",
+    ),
+    (
+        "история анализов с фильтрами по уверенности и задержке",
+        select_analysis_previews(1, min_confidence=0.8, max_latency_ms=2000)
+        .order_by(Analysis.created_at.desc(), Analysis.id.desc()).limit(21),
+        "ix_analyses_user_created",
+        True,
+        None,
+    ),
+    (
+        "отчет о расходе по дням за период",
+        select(UsageDaily.day, func.sum(UsageDaily.prompt_tokens))
+        .where(UsageDaily.day >= date(2024, 1, 1))
+        .group_by(UsageDaily.day).order_by(UsageDaily.day),
+        None,
+        True,
+        "day",
+    ),
+    (
+        "поиск пользователя по telegram_id",
+        select(User).where(User.telegram_id == "123456789"),
+        None,
+        False,
+        None,
+    ),
+]
+
+
+def has_range_bound(dialect: str, plan: str, column: str) -> bool:
+    """Индекс просматривается диапазоном по column, а не с начала"""
+    if dialect == "sqlite":
+        # SEARCH t USING INDEX ix (user_id=? AND created_at<?)
+        pattern = rf"USING (COVERING )?INDEX \S+ \([^)]*\b{column}[<>]"
+    else:
+        # Index Cond: ((user_id = 1) AND (created_at <= ...))
+        pattern = rf"Index Cond: .*\b{column} [<>]"
+    return re.search(pattern, plan) is not None
+
+
+def check_plan(dialect: str, plan: str, expected_index, ordered: bool, range_column=None):
+    """Список проблем в плане запроса"""
+    problems = []
+
+    if dialect == "sqlite":
+        if "USING INDEX" not in plan and "USING COVERING INDEX" not in plan:
+            problems.append("индекс не используется")
+        if ordered and "TEMP B-TREE" in plan:
+            problems.append("отдельная сортировка")
+    else:
+        if "Index" not in plan:
+            problems.append("индекс не используется")
+        if ordered and "Sort" in plan:
+            problems.append("отдельная сортировка")
+
+    if expected_index and expected_index not in plan:
+        problems.append(f"не используется {expected_index}")
+    if range_column and not has_range_bound(dialect, plan, range_column):
+        problems.append(f"нет границы диапазона индекса по {range_column}")
+
+    return problems
+
+
+async def main(create_schema: bool) -> int:
+    failed = 0
+
+    if create_schema:
+        await asyncio.to_thread(upgrade_database)
+
+    async with engine.connect() as conn:
+        dialect = conn.dialect.name
+        if dialect == "sqlite":
+            explain = "EXPLAIN QUERY PLAN "
+        else:
+            explain = "EXPLAIN "
+            # На маленьких таблицах планировщик предпочитает Seq Scan
+            await conn.exec_driver_sql("SET enable_seqscan = off")
+
+        for name, query, expected_index, ordered, range_column in HOT_QUERIES:
+            sql = str(query.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+            result = await conn.exec_driver_sql(explain + sql)
+            plan = "\n".join(" ".join(str(value) for value in row) for row in result.all())
+
+            problems = check_plan(dialect, plan, expected_index, ordered, range_column)
+            status = "OK" if not problems else "FAIL: " + ", ".join(problems)
+            print(f"[{status}] {name}\n{plan}\n")
+            failed += bool(problems)
+
+    await engine.dispose()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Проверка планов горячих запросов")
+    parser.add_argument(
+        "--create-schema", action="store_true",
+        help="применить миграции перед проверкой"
+    )
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.create_schema)))
@@ -4,17 +4,21 @@ Telegram бот для AI Content Curator
 
 import asyncio
 import logging
-from typing import Optional
+import time
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, 
     CallbackQueryHandler, ContextTypes, filters
 )
-import httpx
 from backend.config import settings
-from backend.database import SessionLocal
-from backend.models import User, TelegramSession, Analysis
-from backend.services.gemini_service import GeminiService
+from backend.services.analysis_service import (
+    ANALYSIS_TYPES, COMBINED_ANALYSIS_TYPE, AnalysisResult, get_analysis_service
+)
+from backend.services.rate_limit import RateLimitExceeded, get_rate_limiter
+from backend.services.resilience import CircuitOpenError
+from backend.services.telegram_storage import AccountAlreadyLinked
+from telegram_bot.scheduler import ChatOrderedUpdateProcessor
+from telegram_bot.storage import TelegramUserCache, WriteBehindBuffer, create_storage
 
 # Настройка логирования
 logging.basicConfig(
@@ -23,30 +27,45 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# API URL для взаимодействия с бэкендом
-API_BASE_URL = "http://localhost:8000/api"
-
-
 class AIContentCuratorBot:
     """Основной класс Telegram бота"""
     
     def __init__(self):
         self.application = None
-        self.gemini_service = None
+        self.analysis_service = None
+        # Хранилище данных бота (БД или API бэкенда, см. BOT_STORAGE_MODE),
+        # запись вне обработчиков и кэш привязки аккаунтов
+        self.backend = create_storage()
+        self.storage = WriteBehindBuffer(self.backend)
+        self.user_cache = TelegramUserCache(self.backend)
+        # Параллельная обработка обновлений с сохранением порядка внутри чата
+        self.update_processor = ChatOrderedUpdateProcessor(
+            fast_workers=settings.BOT_FAST_WORKERS,
+            llm_workers=settings.BOT_LLM_WORKERS,
+            max_pending=settings.BOT_MAX_PENDING_UPDATES
+        )
         
     async def initialize(self):
         """Инициализация бота"""
         if not settings.TELEGRAM_BOT_TOKEN:
             raise ValueError("TELEGRAM_BOT_TOKEN не установлен")
         
-        # Инициализируем Gemini сервис
+        # Инициализируем сервис анализа (Gemini + кэш)
         try:
-            self.gemini_service = GeminiService()
+            self.analysis_service = get_analysis_service()
         except Exception as e:
             logger.warning(f"Не удалось инициализировать Gemini: {e}")
         
         # Создаем приложение
-        self.application = Application.builder().token(settings.TELEGRAM_BOT_TOKEN).build()
+        self.application = (
+            Application.builder()
+            .token(settings.TELEGRAM_BOT_TOKEN)
+            .concurrent_updates(self.update_processor)
+            .post_shutdown(lambda application: self.shutdown())
+            .build()
+        )
+        
+        await self.storage.start()
         
         # Регистрируем обработчики
         self.application.add_handler(CommandHandler("start", self.start_command))
@@ -60,6 +79,11 @@ class AIContentCuratorBot:
         
         logger.info("Бот инициализирован")
     
+    async def shutdown(self):
+        """Остановка бота: сохранение накопленных записей"""
+        await self.storage.stop()
+        await self.backend.close()
+    
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
         user = update.effective_user
@@ -88,6 +112,7 @@ class AIContentCuratorBot:
             [InlineKeyboardButton("📊 Анализ тональности", callback_data="analyze_sentiment")],
             [InlineKeyboardButton("📄 Краткая выжимка", callback_data="analyze_summary")],
             [InlineKeyboardButton("🔑 Ключевые слова", callback_data="analyze_keywords")],
+            [InlineKeyboardButton("🧩 Полный анализ", callback_data="analyze_all")],
             [InlineKeyboardButton("🌐 Открыть веб-версию", url="http://localhost:3000")]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -110,6 +135,7 @@ class AIContentCuratorBot:
 • sentiment - анализ тональности
 • summary - краткая выжимка  
 • keywords - ключевые слова
+• all - все три анализа одним запросом
 
 💡 Примеры использования:
 /analyze sentiment Отличный продукт!
@@ -132,68 +158,63 @@ class AIContentCuratorBot:
         
         # Здесь должна быть логика привязки аккаунта
         # Пока что просто сохраняем связь в базе
-        db = SessionLocal()
         try:
-            # Ищем пользователя по имени
-            user = db.query(User).filter(User.username == username).first()
-            if not user:
+            user_id = await self.backend.link_account(username, telegram_id)
+            if user_id is None:
                 await update.message.reply_text(
                     f"❌ Пользователь '{username}' не найден. "
                     "Зарегистрируйтесь на сайте: http://localhost:3000/register"
                 )
                 return
             
-            # Обновляем telegram_id у пользователя
-            user.telegram_id = telegram_id
-            db.commit()
+            self.user_cache.set(telegram_id, user_id)
             
             await update.message.reply_text(
                 f"✅ Аккаунт '{username}' успешно привязан к Telegram!\n"
                 "Теперь ваши анализы будут сохраняться в личном кабинете."
             )
             
+        except AccountAlreadyLinked:
+            await update.message.reply_text(
+                "❌ Этот Telegram аккаунт уже привязан к другому пользователю. "
+                "Сначала отвяжите его командой /disconnect"
+            )
         except Exception as e:
             logger.error(f"Ошибка при привязке аккаунта: {e}")
             await update.message.reply_text(
                 "❌ Произошла ошибка при привязке аккаунта. Попробуйте позже."
             )
-        finally:
-            db.close()
     
     async def disconnect_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /disconnect"""
         telegram_id = str(update.effective_user.id)
         
-        db = SessionLocal()
         try:
-            user = db.query(User).filter(User.telegram_id == telegram_id).first()
-            if user:
-                user.telegram_id = None
-                db.commit()
+            user_id = await self.backend.unlink_account(telegram_id)
+            self.user_cache.set(telegram_id, None)
+            if user_id is not None:
                 await update.message.reply_text("✅ Аккаунт отвязан от Telegram")
             else:
                 await update.message.reply_text("❌ Аккаунт не был привязан")
         except Exception as e:
             logger.error(f"Ошибка при отвязке аккаунта: {e}")
             await update.message.reply_text("❌ Произошла ошибка")
-        finally:
-            db.close()
     
     async def analyze_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /analyze"""
         if len(context.args) < 2:
             await update.message.reply_text(
                 "❌ Использование: /analyze <тип> <текст>\n"
-                "Типы: sentiment, summary, keywords"
+                "Типы: sentiment, summary, keywords, all"
             )
             return
         
         analysis_type = context.args[0].lower()
         text = " ".join(context.args[1:])
         
-        if analysis_type not in ["sentiment", "summary", "keywords"]:
+        if analysis_type not in [*ANALYSIS_TYPES, COMBINED_ANALYSIS_TYPE]:
             await update.message.reply_text(
-                "❌ Неверный тип анализа. Доступные: sentiment, summary, keywords"
+                "❌ Неверный тип анализа. Доступные: sentiment, summary, keywords, all"
             )
             return
         
@@ -203,19 +224,19 @@ class AIContentCuratorBot:
         """Обработчик команды /history"""
         telegram_id = str(update.effective_user.id)
         
-        db = SessionLocal()
         try:
-            user = db.query(User).filter(User.telegram_id == telegram_id).first()
-            if not user:
+            user_id = await self.user_cache.get_user_id(telegram_id)
+            if not user_id:
                 await update.message.reply_text(
                     "❌ Аккаунт не привязан. Используйте /connect <username>"
                 )
                 return
             
+            # Дописываем ожидающие анализы, чтобы в истории были последние
+            await self.storage.flush()
+            
             # Получаем последние анализы
-            analyses = db.query(Analysis).filter(
-                Analysis.user_id == user.id
-            ).order_by(Analysis.created_at.desc()).limit(5).all()
+            analyses = await self.backend.recent_analyses(user_id, 5)
             
             if not analyses:
                 await update.message.reply_text("📭 У вас пока нет анализов")
@@ -239,8 +260,6 @@ class AIContentCuratorBot:
         except Exception as e:
             logger.error(f"Ошибка при получении истории: {e}")
             await update.message.reply_text("❌ Произошла ошибка")
-        finally:
-            db.close()
     
     async def button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик нажатий на кнопки"""
@@ -254,7 +273,8 @@ class AIContentCuratorBot:
             type_names = {
                 "sentiment": "анализа тональности",
                 "summary": "создания выжимки",
-                "keywords": "извлечения ключевых слов"
+                "keywords": "извлечения ключевых слов",
+                "all": "полного анализа"
             }
             
             await query.edit_message_text(
@@ -276,7 +296,8 @@ class AIContentCuratorBot:
             keyboard = [
                 [InlineKeyboardButton("😊 Анализ тональности", callback_data="analyze_sentiment")],
                 [InlineKeyboardButton("📄 Краткая выжимка", callback_data="analyze_summary")],
-                [InlineKeyboardButton("🔑 Ключевые слова", callback_data="analyze_keywords")]
+                [InlineKeyboardButton("🔑 Ключевые слова", callback_data="analyze_keywords")],
+                [InlineKeyboardButton("🧩 Полный анализ", callback_data="analyze_all")]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
@@ -292,35 +313,62 @@ class AIContentCuratorBot:
     
     async def perform_analysis(self, update: Update, text: str, analysis_type: str):
         """Выполнение анализа текста"""
-        if not self.gemini_service:
+        if not self.analysis_service:
             await update.message.reply_text(
                 "❌ Сервис анализа недоступен. Проверьте настройки Gemini API."
             )
             return
         
+        try:
+            await get_rate_limiter().check_telegram(str(update.effective_user.id))
+        except RateLimitExceeded as e:
+            await update.message.reply_text(self.rate_limit_message(e))
+            return
+        
+        if analysis_type == COMBINED_ANALYSIS_TYPE:
+            await self.perform_combined_analysis(update, text)
+            return
+        
         # Отправляем сообщение о начале анализа
         status_message = await update.message.reply_text("🤖 Анализирую текст...")
         
         try:
             # Выполняем анализ
             if analysis_type == "sentiment":
-                result, confidence = await self.gemini_service.analyze_sentiment(text)
                 emoji = "😊"
                 type_name = "Анализ тональности"
             elif analysis_type == "summary":
-                result, confidence = await self.gemini_service.create_summary(text)
                 emoji = "📄"
                 type_name = "Краткая выжимка"
             elif analysis_type == "keywords":
-                result, confidence = await self.gemini_service.extract_keywords(text)
                 emoji = "🔑"
                 type_name = "Ключевые слова"
             else:
                 await status_message.edit_text("❌ Неподдерживаемый тип анализа")
                 return
             
+            # Получаем результат потоком и периодически обновляем сообщение
+            analysis_result = None
+            partial = ""
+            start_time = last_edit = time.monotonic()
+            async for item in self.analysis_service.analyze_stream(analysis_type, text):
+                if isinstance(item, AnalysisResult):
+                    analysis_result = item
+                    continue
+                
+                partial += item
+                if time.monotonic() - last_edit >= settings.BOT_STREAM_EDIT_INTERVAL:
+                    last_edit = time.monotonic()
+                    await self.edit_progress(status_message, f"{emoji} {type_name}\n\n{partial}")
+            
+            result = analysis_result.result
+            confidence = analysis_result.confidence
+            
             # Сохраняем результат в базу данных (если пользователь привязан)
-            await self.save_analysis(update.effective_user.id, text, analysis_type, result, confidence)
+            await self.save_analysis(
+                update.effective_user.id, text, analysis_type,
+                analysis_result, time.monotonic() - start_time
+            )
             
             # Формируем ответ
             response_text = f"{emoji} **{type_name}**\n\n"
@@ -334,64 +382,100 @@ class AIContentCuratorBot:
             
             await status_message.edit_text(response_text, parse_mode='Markdown')
             
+        except (RateLimitExceeded, CircuitOpenError) as e:
+            await status_message.edit_text(self.rate_limit_message(e))
         except Exception as e:
             logger.error(f"Ошибка при анализе: {e}")
             await status_message.edit_text(
                 "❌ Произошла ошибка при анализе текста. Попробуйте позже."
             )
     
-    async def save_telegram_session(self, user):
-        """Сохранение сессии Telegram пользователя"""
-        db = SessionLocal()
+    def rate_limit_message(self, error) -> str:
+        """Ответ пользователю при превышении лимита запросов или недоступности Gemini"""
+        seconds = max(1, round(error.retry_after))
+        if isinstance(error, RateLimitExceeded) and error.scope == "telegram":
+            return f"⏳ Слишком много запросов. Подождите {seconds} с и попробуйте снова."
+        return f"⏳ Сервис сейчас перегружен. Попробуйте через {seconds} с."
+    
+    async def edit_progress(self, status_message, text: str):
+        """Промежуточное обновление сообщения во время потокового анализа"""
+        # Лимит Telegram - 4096 символов, показываем хвост текста
+        if len(text) > 4000:
+            text = "..." + text[-4000:]
         try:
-            session = db.query(TelegramSession).filter(
-                TelegramSession.telegram_id == str(user.id)
-            ).first()
-            
-            if not session:
-                session = TelegramSession(
-                    telegram_id=str(user.id),
-                    username=user.username,
-                    first_name=user.first_name,
-                    last_name=user.last_name
-                )
-                db.add(session)
-            else:
-                session.username = user.username
-                session.first_name = user.first_name
-                session.last_name = user.last_name
-            
-            db.commit()
+            await status_message.edit_text(f"{text} ▌")
         except Exception as e:
-            logger.error(f"Ошибка при сохранении сессии: {e}")
-        finally:
-            db.close()
+            logger.debug(f"Не удалось обновить сообщение: {e}")
     
-    async def save_analysis(self, telegram_user_id: int, text: str, analysis_type: str, result: str, confidence: Optional[float]):
-        """Сохранение результата анализа в базу данных"""
-        db = SessionLocal()
+    async def perform_combined_analysis(self, update: Update, text: str):
+        """Тональность, резюме и ключевые слова одним запросом"""
+        status_message = await update.message.reply_text("🤖 Анализирую текст...")
+        
         try:
-            # Ищем пользователя по telegram_id
-            user = db.query(User).filter(User.telegram_id == str(telegram_user_id)).first()
-            if not user:
-                return  # Пользователь не привязан
+            start_time = time.monotonic()
+            results = await self.analysis_service.analyze_all(text)
+            elapsed = time.monotonic() - start_time
             
-            # Создаем запись анализа
-            analysis = Analysis(
-                user_id=user.id,
-                original_text=text,
-                analysis_type=analysis_type,
-                result=result,
-                confidence_score=str(confidence) if confidence else None
-            )
+            sections = [
+                ("sentiment", "😊", "Анализ тональности"),
+                ("summary", "📄", "Краткая выжимка"),
+                ("keywords", "🔑", "Ключевые слова"),
+            ]
+            
+            response_text = "🧩 **Полный анализ**\n\n"
+            response_text += f"📝 **Исходный текст:**\n{text[:200]}{'...' if len(text) > 200 else ''}\n\n"
+            
+            for analysis_type, emoji, type_name in sections:
+                analysis_result = results[analysis_type]
+                
+                # Сохраняем каждый тип анализа отдельной записью
+                await self.save_analysis(
+                    update.effective_user.id, text, analysis_type, analysis_result, elapsed
+                )
+                
+                response_text += f"{emoji} **{type_name}:**\n{analysis_result.result}\n\n"
             
-            db.add(analysis)
-            db.commit()
+            response_text += "✅ Анализ завершен!"
+            
+            await status_message.edit_text(response_text, parse_mode='Markdown')
             
+        except (RateLimitExceeded, CircuitOpenError) as e:
+            await status_message.edit_text(self.rate_limit_message(e))
         except Exception as e:
-            logger.error(f"Ошибка при сохранении анализа: {e}")
-        finally:
-            db.close()
+            logger.error(f"Ошибка при анализе: {e}")
+            await status_message.edit_text(
+                "❌ Произошла ошибка при анализе текста. Попробуйте позже."
+            )
+    
+    async def save_telegram_session(self, user):
+        """Сохранение сессии Telegram пользователя (в фоне, пакетами)"""
+        self.storage.add_session(
+            str(user.id), user.username, user.first_name, user.last_name
+        )
+    
+    async def save_analysis(
+        self, telegram_user_id: int, text: str, analysis_type: str,
+        analysis_result: AnalysisResult, elapsed: float
+    ):
+        """Сохранение результата анализа в базу данных (в фоне, пакетами)"""
+        try:
+            user_id = await self.user_cache.get_user_id(str(telegram_user_id))
+        except Exception as e:
+            logger.error(f"Ошибка при поиске пользователя: {e}")
+            return
+        if not user_id:
+            return  # Пользователь не привязан
+        
+        self.storage.add_analysis(
+            user_id=user_id,
+            original_text=text,
+            analysis_type=analysis_type,
+            result=analysis_result.result,
+            confidence_score=analysis_result.confidence,
+            prompt_tokens=analysis_result.prompt_tokens,
+            response_tokens=analysis_result.response_tokens,
+            latency_ms=round(elapsed * 1000)
+        )
     
     async def run(self):
         """Запуск бота"""
@@ -0,0 +1,273 @@
+"""
+Параллельная обработка обновлений Telegram с сохранением порядка внутри чата
+и очередь обновлений, полученных через webhook
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Set
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# Очереди обработки: быстрые команды и обновления, которые могут вызвать модель
+FAST_LANE = "fast"
+LLM_LANE = "llm"
+
+# Команды, запускающие анализ
+LLM_COMMANDS = frozenset(("analyze",))
+
+# Сколько последних ожиданий хранится для расчета перцентиля
+WAIT_SAMPLES = 1000
+
+
+def update_lane(update: object) -> str:
+    """Очередь для обновления: текст и /analyze могут запустить анализ, остальное - быстрое"""
+    if not isinstance(update, Update) or update.callback_query is not None:
+        return FAST_LANE
+    message = update.effective_message
+    if message is None or not message.text:
+        return FAST_LANE
+    if not message.text.startswith("/"):
+        # Обычный текст запускает анализ, если бот ждет текст после выбора типа
+        return LLM_LANE
+    command = message.text.split()[0][1:].split("@")[0].lower()
+    return LLM_LANE if command in LLM_COMMANDS else FAST_LANE
+
+
+def update_chat_key(update: object) -> Optional[Hashable]:
+    """Ключ упорядочивания: чат обновления (или None, если порядок не важен)"""
+    if isinstance(update, Update) and update.effective_chat is not None:
+        return update.effective_chat.id
+    return None
+
+
+class Lane:
+    """Очередь обработки со своим числом воркеров и метриками ожидания"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._slots = asyncio.Semaphore(workers)
+        self.queued = 0
+        self.running = 0
+        self.processed = 0
+        self._waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+
+    async def run(self, coroutine: Awaitable[Any], enqueued_at: float):
+        async with self._slots:
+            self.queued -= 1
+            self.running += 1
+            self._waits.append(time.monotonic() - enqueued_at)
+            try:
+                await coroutine
+            finally:
+                self.running -= 1
+                self.processed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._waits)
+        p95 = waits[int(len(waits) * 0.95)] if waits else 0.0
+        return {
+            "workers": self.workers,
+            "queued": self.queued,
+            "running": self.running,
+            "processed": self.processed,
+            "avg_wait_ms": round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+            "p95_wait_ms": round(p95 * 1000, 1)
+        }
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Обработчик обновлений для Application.concurrent_updates.
+    Обновления разных чатов обрабатываются параллельно, одного чата -
+    строго по очереди (состояние waiting_for_text зависит от порядка).
+    Быстрые команды и анализ текста идут в отдельных очередях со своими
+    воркерами, поэтому долгий анализ не задерживает /help других пользователей.
+
+    max_pending - сколько обновлений принимается в обработку одновременно,
+    включая ожидающие своей очереди.
+    """
+
+    def __init__(self, fast_workers: int, llm_workers: int, max_pending: int):
+        super().__init__(max_pending)
+        self.lanes = {
+            FAST_LANE: Lane(fast_workers),
+            LLM_LANE: Lane(llm_workers),
+        }
+        # Блокировки чатов с числом обновлений, которые их держат или ждут
+        self._chats: Dict[Hashable, list] = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]):
+        lane = self.lanes[update_lane(update)]
+        lane.queued += 1
+        enqueued_at = time.monotonic()
+
+        chat_key = update_chat_key(update)
+        if chat_key is None:
+            await lane.run(coroutine, enqueued_at)
+            return
+
+        # asyncio.Lock пропускает ожидающих в порядке очереди
+        entry = self._chats.setdefault(chat_key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await lane.run(coroutine, enqueued_at)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[chat_key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики очередей: глубина, выполняющиеся обновления и время ожидания"""
+        return {
+            **{name: lane.stats() for name, lane in self.lanes.items()},
+            "active_chats": len(self._chats)
+        }
+
+
+class WebhookUpdateQueue:
+    """
+    Ограниченная очередь обновлений webhook. Обработчик webhook только
+    ставит обновление в очередь и сразу отвечает Telegram. Диспетчер
+    передает обновления из очереди в обработку фоновыми задачами и не ждет
+    их завершения: порядок и параллельность обработки определяет
+    ChatOrderedUpdateProcessor, поэтому поток обновлений одного чата не
+    задерживает остальные. В обработке одновременно не больше max_pending
+    обновлений, дальше обновления копятся в очереди.
+
+    Повторные доставки одного update_id пропускаются. Если очередь
+    заполнена, обновление ждет места не дольше enqueue_timeout, после
+    чего отклоняется (Telegram доставит его повторно).
+    """
+
+    def __init__(
+        self,
+        process: Callable[[Update], Awaitable[Any]],
+        max_pending: int,
+        max_size: int,
+        dedup_window: int,
+        enqueue_timeout: float
+    ):
+        self._process = process
+        self._max_pending = max_pending
+        self._slots = asyncio.Semaphore(max_pending)
+        self._queue: asyncio.Queue = asyncio.Queue(max_size)
+        self._enqueue_timeout = enqueue_timeout
+        # Последние принятые update_id в порядке поступления
+        self._recent: Dict[int, None] = {}
+        self._dedup_window = dedup_window
+        self._dispatcher: Optional[asyncio.Task] = None
+        # Обновления в обработке
+        self._tasks: Set[asyncio.Task] = set()
+        self.accepted = 0
+        self.duplicates = 0
+        self.shed = 0
+        self.processed = 0
+        self.failed = 0
+
+    async def start(self):
+        """Запуск диспетчера"""
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(
+                self._dispatch(), name="telegram-webhook-dispatcher"
+            )
+
+    async def stop(self, drain_timeout: float):
+        """Остановка после обработки очереди и начатых обновлений (не дольше drain_timeout секунд)"""
+        if self._dispatcher is None:
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + drain_timeout
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+            if self._tasks:
+                await asyncio.wait(self._tasks, timeout=max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            pass
+        unfinished = self._queue.qsize() + len(self._tasks)
+        if unfinished:
+            logger.error(f"При остановке не обработано обновлений Telegram: {unfinished}")
+
+        self._dispatcher.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(self._dispatcher, *self._tasks, return_exceptions=True)
+        self._dispatcher = None
+
+    async def put(self, update: Update) -> bool:
+        """Постановка обновления в очередь; False - очередь заполнена, обновление отклонено"""
+        update_id = update.update_id
+        if update_id in self._recent:
+            self.duplicates += 1
+            return True
+
+        # update_id запоминается до ожидания места, чтобы параллельная повторная доставка не прошла
+        self._remember(update_id)
+        try:
+            if self._enqueue_timeout > 0:
+                await asyncio.wait_for(self._queue.put(update), timeout=self._enqueue_timeout)
+            else:
+                self._queue.put_nowait(update)
+        except (asyncio.TimeoutError, asyncio.QueueFull):
+            # Отклоненное обновление должно быть принято при повторной доставке
+            self._recent.pop(update_id, None)
+            self.shed += 1
+            return False
+
+        self.accepted += 1
+        return True
+
+    def _remember(self, update_id: int):
+        if len(self._recent) >= self._dedup_window:
+            del self._recent[next(iter(self._recent))]
+        self._recent[update_id] = None
+
+    async def _dispatch(self):
+        while True:
+            update = await self._queue.get()
+            try:
+                # Ждем только свободного места в обработке, не самой обработки
+                await self._slots.acquire()
+                task = asyncio.create_task(self._run(update))
+                self._tasks.add(task)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, update: Update):
+        try:
+            await self._process(update)
+            self.processed += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Ошибка обработки обновления Telegram {update.update_id}: {e}")
+        finally:
+            self._slots.release()
+            self._tasks.discard(asyncio.current_task())
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики очереди webhook"""
+        return {
+            "queued": self._queue.qsize(),
+            "max_size": self._queue.maxsize,
+            "in_progress": len(self._tasks),
+            "max_pending": self._max_pending,
+            "accepted": self.accepted,
+            "duplicates": self.duplicates,
+            "shed": self.shed,
+            "processed": self.processed,
+            "failed": self.failed
+        }
@@ -0,0 +1,415 @@
+"""
+Данные Telegram бота: хранилище (напрямую в БД или через API бэкенда),
+буфер отложенной записи (write-behind) и кэш привязки telegram_id -> user_id
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from pydantic import ValidationError
+from sqlalchemy.exc import DataError, IntegrityError
+
+from backend.config import settings
+from backend.database import SessionLocal
+from backend.routers.auth import invalidate_user_cache
+from backend.schemas import AnalysisPreview, TelegramLinkRequest, TelegramRecords
+from backend.services import telegram_storage
+from backend.services.telegram_storage import AccountAlreadyLinked
+from backend.services.cache import TTLCache
+from backend.services.resilience import retry_with_backoff
+
+logger = logging.getLogger(__name__)
+
+# Значение в кэше для Telegram аккаунта, не привязанного к пользователю
+NOT_LINKED = 0
+
+# Ответы API, после которых идемпотентный запрос повторяется
+RETRYABLE_STATUSES = (502, 503, 504)
+
+# Ошибки, при которых запрос не дошел до сервера и его можно повторить в любом случае
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# Ответы API на сохранение записей, которые не изменятся при повторе тех же данных
+REJECTED_STATUSES = (400, 409, 413, 422)
+
+# Ответы прокси перед API: бэкенд мог успеть выполнить запрос
+GATEWAY_STATUSES = (502, 504)
+
+
+def is_rejected(error: BaseException) -> bool:
+    """Записи отклонены БД или API: повтор с теми же данными завершится той же ошибкой"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in REJECTED_STATUSES
+    return isinstance(error, (IntegrityError, DataError, ValidationError))
+
+
+def outcome_unknown(error: BaseException) -> bool:
+    """
+    Запрос дошел до API, но ответ не получен (таймаут чтения, разрыв
+    соединения, ответ прокси): записи могли сохраниться
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in GATEWAY_STATUSES
+    return isinstance(error, httpx.TransportError) and not isinstance(error, NOT_SENT_ERRORS)
+
+
+def split_batch(
+    sessions: List[Dict[str, Any]], analyses: List[Dict[str, Any]]
+) -> List[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+    """Деление пакета записей пополам (сессии идут первыми)"""
+    middle = (len(sessions) + len(analyses)) // 2
+    if middle <= len(sessions):
+        return [(sessions[:middle], []), (sessions[middle:], analyses)]
+    middle -= len(sessions)
+    return [(sessions, analyses[:middle]), ([], analyses[middle:])]
+
+
+class DatabaseStorage:
+    """Данные бота напрямую в БД (BOT_STORAGE_MODE=db)"""
+
+    async def find_user_id(self, telegram_id: str) -> Optional[int]:
+        async with SessionLocal() as db:
+            return await telegram_storage.find_user_id(db, telegram_id)
+
+    async def link_account(self, username: str, telegram_id: str) -> Optional[int]:
+        async with SessionLocal() as db:
+            user_id = await telegram_storage.link_account(db, username, telegram_id)
+        if user_id is not None:
+            invalidate_user_cache(user_id)
+        return user_id
+
+    async def unlink_account(self, telegram_id: str) -> Optional[int]:
+        async with SessionLocal() as db:
+            user_id = await telegram_storage.unlink_account(db, telegram_id)
+        if user_id is not None:
+            invalidate_user_cache(user_id)
+        return user_id
+
+    async def recent_analyses(self, user_id: int, limit: int) -> List[Any]:
+        async with SessionLocal() as db:
+            return await telegram_storage.recent_analyses(db, user_id, limit)
+
+    async def save_records(self, sessions: List[Dict[str, Any]], analyses: List[Dict[str, Any]]):
+        async with SessionLocal() as db:
+            await telegram_storage.save_records(db, sessions, analyses)
+
+    async def close(self):
+        pass
+
+
+class ApiStorage:
+    """
+    Данные бота через API бэкенда (BOT_STORAGE_MODE=api): с БД работает
+    только процесс API. Соединения с API переиспользуются (keep-alive),
+    временные ошибки повторяются с задержкой. Сохранение записей
+    повторяется, только если запрос не был отправлен (см. outcome_unknown).
+    """
+
+    def __init__(self):
+        self._client = httpx.AsyncClient(
+            base_url=settings.BOT_API_URL,
+            headers={"X-Bot-Token": settings.BOT_API_TOKEN},
+            timeout=settings.BOT_API_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=settings.BOT_API_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.BOT_API_MAX_CONNECTIONS
+            )
+        )
+
+    async def _request(
+        self, method: str, path: str, idempotent: bool = True, **kwargs: Any
+    ) -> httpx.Response:
+        async def send() -> httpx.Response:
+            response = await self._client.request(method, path, **kwargs)
+            if response.status_code in RETRYABLE_STATUSES:
+                response.raise_for_status()
+            return response
+
+        def is_retryable(error: BaseException) -> bool:
+            if isinstance(error, NOT_SENT_ERRORS):
+                return True
+            return idempotent and isinstance(error, (httpx.TransportError, httpx.HTTPStatusError))
+
+        return await retry_with_backoff(
+            send,
+            attempts=settings.BOT_API_RETRY_ATTEMPTS,
+            base_delay=settings.BOT_API_RETRY_BASE_DELAY,
+            max_delay=settings.BOT_API_RETRY_MAX_DELAY,
+            is_retryable=is_retryable,
+            on_retry=lambda e: logger.warning(f"Повтор запроса к API {method} {path}: {e!r}")
+        )
+
+    async def find_user_id(self, telegram_id: str) -> Optional[int]:
+        response = await self._request("GET", f"/telegram/accounts/{telegram_id}")
+        response.raise_for_status()
+        return response.json()["user_id"]
+
+    async def link_account(self, username: str, telegram_id: str) -> Optional[int]:
+        response = await self._request(
+            "PUT", f"/telegram/accounts/{telegram_id}",
+            json=TelegramLinkRequest(username=username).model_dump()
+        )
+        if response.status_code == 404:
+            return None
+        if response.status_code == 409:
+            raise AccountAlreadyLinked(telegram_id)
+        response.raise_for_status()
+        return response.json()["user_id"]
+
+    async def unlink_account(self, telegram_id: str) -> Optional[int]:
+        response = await self._request("DELETE", f"/telegram/accounts/{telegram_id}")
+        response.raise_for_status()
+        return response.json()["user_id"]
+
+    async def recent_analyses(self, user_id: int, limit: int) -> List[Any]:
+        response = await self._request(
+            "GET", "/telegram/analyses", params={"user_id": user_id, "limit": limit}
+        )
+        response.raise_for_status()
+        return [AnalysisPreview.model_validate(item) for item in response.json()]
+
+    async def save_records(self, sessions: List[Dict[str, Any]], analyses: List[Dict[str, Any]]):
+        records = TelegramRecords(sessions=sessions, analyses=analyses)
+        response = await self._request(
+            "POST", "/telegram/records", idempotent=False, json=records.model_dump(mode="json")
+        )
+        response.raise_for_status()
+
+    async def close(self):
+        await self._client.aclose()
+
+
+def create_storage():
+    """Хранилище данных бота по настройке BOT_STORAGE_MODE"""
+    if settings.BOT_STORAGE_MODE == "api":
+        return ApiStorage()
+    return DatabaseStorage()
+
+
+class TelegramUserCache:
+    """Кэш user_id по telegram_id (включая отсутствие привязки)"""
+
+    def __init__(self, storage):
+        self._storage = storage
+        self._cache = TTLCache(
+            settings.BOT_USER_CACHE_MAX_ENTRIES, settings.BOT_USER_CACHE_TTL_SECONDS
+        )
+
+    async def get_user_id(self, telegram_id: str) -> Optional[int]:
+        """user_id привязанного пользователя или None"""
+        user_id = self._cache.get(telegram_id)
+        if user_id is None:
+            user_id = await self._storage.find_user_id(telegram_id) or NOT_LINKED
+            self._cache.set(telegram_id, user_id)
+        return user_id if user_id != NOT_LINKED else None
+
+    def set(self, telegram_id: str, user_id: Optional[int]):
+        """Обновление привязки после /connect и /disconnect"""
+        self._cache.set(telegram_id, user_id or NOT_LINKED)
+
+    def stats(self) -> Dict[str, int]:
+        return self._cache.stats()
+
+
+class WriteBehindBuffer:
+    """
+    Буфер записи сессий и анализов бота. Обработчики только добавляют
+    записи в память, фоновая задача сохраняет их пакетами: при накоплении
+    BOT_WRITE_BATCH_SIZE записей или раз в BOT_WRITE_FLUSH_INTERVAL секунд.
+    При остановке буфер сохраняет все, что успело накопиться.
+
+    Записи, отклоненные БД или API, отбрасываются с записью в лог (пакет
+    делится, пока не останутся только отклоненные записи). Пакет, не
+    сохраненный из-за временной ошибки, повторяется первым при следующей
+    записи, но не больше BOT_WRITE_MAX_RETRIES раз. Если неизвестно,
+    сохранил ли API пакет (например, таймаут ответа), повторяются только
+    сессии (upsert), а анализы отбрасываются: повтор мог бы их задвоить.
+    """
+
+    def __init__(self, storage):
+        self._storage = storage
+        # Сессии по telegram_id: повторные /start одного пользователя схлопываются
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._analyses: List[Dict[str, Any]] = []
+        # Пакет, не сохраненный из-за временной ошибки, и число неудачных попыток
+        self._retry_batch: Optional[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]] = None
+        self._retry_failures = 0
+        self._flush_requested = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.flushed = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    @property
+    def pending(self) -> int:
+        retrying = sum(map(len, self._retry_batch)) if self._retry_batch else 0
+        return len(self._sessions) + len(self._analyses) + retrying
+
+    async def start(self):
+        """Запуск фоновой записи"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run(), name="bot-write-behind")
+
+    async def stop(self):
+        """Остановка с сохранением накопленных записей"""
+        if self._task is not None:
+            # Задачу не отменяем, чтобы не прервать запись на середине
+            self._stopping = True
+            self._flush_requested.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        if self.pending:
+            logger.error(f"При остановке не сохранено записей бота: {self.pending}")
+
+    def add_session(
+        self,
+        telegram_id: str,
+        username: Optional[str],
+        first_name: Optional[str],
+        last_name: Optional[str]
+    ):
+        """Сохранение (обновление) сессии Telegram пользователя"""
+        self._sessions[telegram_id] = {
+            "telegram_id": telegram_id,
+            "username": username,
+            "first_name": first_name,
+            "last_name": last_name,
+            "last_activity": datetime.now(timezone.utc)
+        }
+        self._after_add()
+
+    def add_analysis(self, **values: Any):
+        """Сохранение анализа (значения колонок Analysis)"""
+        self._analyses.append(values)
+        self._after_add()
+
+    def _after_add(self):
+        # Если БД долго недоступна, отбрасываем самые старые анализы (затем сессии),
+        # чтобы не расти без предела
+        overflow = self.pending - settings.BOT_WRITE_MAX_PENDING
+        if overflow > 0:
+            analyses = min(overflow, len(self._analyses))
+            del self._analyses[:analyses]
+            sessions = list(islice(self._sessions, overflow - analyses))
+            for telegram_id in sessions:
+                del self._sessions[telegram_id]
+            self.dropped += analyses + len(sessions)
+            logger.warning(
+                f"Буфер записи бота переполнен, отброшено анализов: {analyses}, сессий: {len(sessions)}"
+            )
+        if self.pending >= settings.BOT_WRITE_BATCH_SIZE:
+            self._flush_requested.set()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(
+                    self._flush_requested.wait(), timeout=settings.BOT_WRITE_FLUSH_INTERVAL
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
+
+    async def flush(self):
+        """
+        Сохранение накопленных записей пакетами по BOT_WRITE_BATCH_SIZE
+        (каждый пакет - одна транзакция)
+        """
+        async with self._lock:
+            # Отложенный пакет сохраняется первым: более новые данные сессий
+            # из буфера должны записаться после него
+            if self._retry_batch is not None:
+                sessions, analyses = self._retry_batch
+                self._retry_batch = None
+                if not await self._save_batch(sessions, analyses):
+                    return
+
+            batch_size = settings.BOT_WRITE_BATCH_SIZE
+            # Записи, добавленные во время сохранения, дождутся следующего цикла
+            batches = -(-max(len(self._sessions), len(self._analyses)) // batch_size)
+            for _ in range(batches):
+                sessions = [
+                    self._sessions.pop(telegram_id)
+                    for telegram_id in list(islice(self._sessions, batch_size))
+                ]
+                analyses = self._analyses[:batch_size]
+                del self._analyses[:batch_size]
+                if not await self._save_batch(sessions, analyses):
+                    return
+
+    async def _save_batch(
+        self, sessions: List[Dict[str, Any]], analyses: List[Dict[str, Any]]
+    ) -> bool:
+        """Сохранение пакета; False - временная ошибка, пакет отложен или отброшен"""
+        parts = [(sessions, analyses)]
+        while parts:
+            part_sessions, part_analyses = parts.pop()
+            try:
+                await self._storage.save_records(part_sessions, part_analyses)
+            except Exception as e:
+                self.failed_flushes += 1
+                if not is_rejected(e):
+                    if part_analyses and outcome_unknown(e):
+                        self.dropped += len(part_analyses)
+                        logger.error(
+                            f"Неизвестно, сохранены ли анализы бота ({len(part_analyses)}): {e!r}; "
+                            f"анализы отброшены, чтобы повтор их не задвоил"
+                        )
+                        part_analyses = []
+                    parts.append((part_sessions, part_analyses))
+                    self._defer_batch(parts, e)
+                    return False
+                if len(part_sessions) + len(part_analyses) > 1:
+                    # Ищем отклоненные записи, сохраняя остальные
+                    parts.extend(reversed(split_batch(part_sessions, part_analyses)))
+                    continue
+                self.rejected += 1
+                record = part_sessions[0] if part_sessions else part_analyses[0]
+                logger.error(
+                    f"Запись бота отклонена и отброшена: {e}; "
+                    f"telegram_id={record.get('telegram_id')}, user_id={record.get('user_id')}"
+                )
+                continue
+            self.flushed += len(part_sessions) + len(part_analyses)
+        self._retry_failures = 0
+        return True
+
+    def _defer_batch(
+        self, parts: List[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]], error: Exception
+    ):
+        # Несохраненные части пакета (в исходном порядке) объединяются для повтора
+        sessions = [session for part in reversed(parts) for session in part[0]]
+        analyses = [analysis for part in reversed(parts) for analysis in part[1]]
+        if not sessions and not analyses:
+            return
+        self._retry_failures += 1
+        if self._retry_failures > settings.BOT_WRITE_MAX_RETRIES:
+            self._retry_failures = 0
+            self.dropped += len(sessions) + len(analyses)
+            logger.error(
+                f"Пакет данных бота не сохранен после {settings.BOT_WRITE_MAX_RETRIES} повторов "
+                f"и отброшен (сессий: {len(sessions)}, анализов: {len(analyses)}): {error}"
+            )
+            return
+        self._retry_batch = (sessions, analyses)
+        logger.error(f"Ошибка при сохранении данных бота, пакет будет повторен: {error}")
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики буфера записи"""
+        return {
+            "pending": self.pending,
+            "flushed": self.flushed,
+            "failed_flushes": self.failed_flushes,
+            "dropped": self.dropped,
+            "rejected": self.rejected
+        }
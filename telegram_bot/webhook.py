@@ -5,34 +5,117 @@ Webhook для Telegram бота в FastAPI
 from fastapi import APIRouter, Request, HTTPException
 from telegram import Update
 from telegram.ext import Application
+import asyncio
 import json
 import logging
 from backend.config import settings
+from telegram_bot.scheduler import WebhookUpdateQueue
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Глобальная переменная для хранения приложения бота
+# Глобальные переменные для хранения бота и его приложения
+bot_instance = None
 bot_application: Application = None
+# Очередь обновлений, принятых webhook и ожидающих обработки
+update_queue: WebhookUpdateQueue = None
+# Бот создается один раз, даже если первые запросы пришли одновременно
+_bot_lock = asyncio.Lock()
+
+
+def webhook_enabled() -> bool:
+    """Бот работает через webhook этого приложения (задан токен и адрес webhook)"""
+    return bool(settings.TELEGRAM_BOT_TOKEN and settings.TELEGRAM_WEBHOOK_URL)
+
+
+def bot_ready() -> bool:
+    """Бот инициализирован и принимает обновления"""
+    return bot_application is not None
 
 
 async def initialize_bot_application():
-    """Инициализация приложения бота для webhook"""
-    global bot_application
+    """
+    Инициализация приложения бота для webhook. Вызывается при запуске
+    приложения; эндпоинты вызывают ее повторно, если запуск не удался.
+    """
+    global bot_instance, bot_application, update_queue
     
-    if bot_application is None:
+    if bot_application is not None:
+        return bot_application
+    
+    async with _bot_lock:
+        if bot_application is not None:
+            return bot_application
+        
         from telegram_bot.bot import AIContentCuratorBot
         bot = AIContentCuratorBot()
         await bot.initialize()
-        bot_application = bot.application
+        
+        application = bot.application
+        try:
+            # Проверка токена (getMe) и запуск обработчика обновлений
+            await application.initialize()
+        except Exception:
+            await bot.shutdown()
+            raise
+        
+        async def process(update: Update):
+            # Обрабатываем обновление через планировщик: порядок внутри чата и очереди
+            await application.update_processor.process_update(
+                update, application.process_update(update)
+            )
+        
+        update_queue = WebhookUpdateQueue(
+            process,
+            max_pending=settings.BOT_MAX_PENDING_UPDATES,
+            max_size=settings.BOT_WEBHOOK_QUEUE_SIZE,
+            dedup_window=settings.BOT_WEBHOOK_DEDUP_WINDOW,
+            enqueue_timeout=settings.BOT_WEBHOOK_ENQUEUE_TIMEOUT
+        )
+        await update_queue.start()
+        bot_instance = bot
+        bot_application = application
+        logger.info("Приложение бота для webhook готово")
     
     return bot_application
 
 
+async def shutdown_bot_application():
+    """Остановка бота при завершении приложения: обработка очереди и сохранение накопленных записей"""
+    global bot_instance, bot_application, update_queue
+    
+    async with _bot_lock:
+        if update_queue is not None:
+            await update_queue.stop(settings.BOT_WEBHOOK_DRAIN_TIMEOUT)
+            update_queue = None
+        
+        if bot_instance is not None:
+            await bot_application.shutdown()
+            await bot_instance.shutdown()
+            bot_instance = None
+            bot_application = None
+
+
+def bot_stats():
+    """Метрики бота (None, если бот не запущен в этом процессе)"""
+    if bot_instance is None:
+        return None
+    return {
+        "write_buffer": bot_instance.storage.stats(),
+        "user_cache": bot_instance.user_cache.stats(),
+        "updates": bot_instance.update_processor.stats(),
+        "webhook": update_queue.stats() if update_queue is not None else None
+    }
+
+
 @router.post("/webhook/telegram")
 async def telegram_webhook(request: Request):
-    """Обработчик webhook от Telegram"""
+    """
+    Обработчик webhook от Telegram. Обновление ставится в очередь и
+    обрабатывается в фоне, Telegram получает ответ сразу. При переполнении
+    очереди возвращается 503 - Telegram повторит доставку позже.
+    """
     try:
         # Получаем данные от Telegram
         data = await request.json()
@@ -43,11 +126,19 @@ async def telegram_webhook(request: Request):
         # Создаем объект Update
         update = Update.de_json(data, app.bot)
         
-        # Обрабатываем обновление
-        await app.process_update(update)
+        # Ставим обновление в очередь (повторные доставки пропускаются)
+        if not await update_queue.put(update):
+            logger.warning(f"Очередь webhook заполнена, обновление {update.update_id} отклонено")
+            raise HTTPException(
+                status_code=503,
+                detail="Бот перегружен, повторите позже",
+                headers={"Retry-After": str(settings.BOT_WEBHOOK_RETRY_AFTER_SECONDS)}
+            )
         
         return {"status": "ok"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Ошибка в webhook: {e}")
         raise HTTPException(status_code=500, detail="Ошибка обработки webhook")